@@ -2,4 +2,5 @@
 from . import user
 from . import event
 from . import community
-from . import notification 
\ No newline at end of file
+from . import notification
+from . import sync
\ No newline at end of file
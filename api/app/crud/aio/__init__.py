@@ -0,0 +1,11 @@
+# Async CRUD modules
+#
+# Each function mirrors the synchronous CRUD function of the same name and
+# takes the session yielded by `database.get_async_db`. The synchronous
+# implementation runs through `run_sync`, on the async engine's greenlet
+# bridge or in the threadpool, so both modes share one implementation.
+from . import user
+from . import event
+from . import community
+from . import notification
+from . import sync
@@ -0,0 +1,13 @@
+import functools
+from typing import Any, Callable, TypeVar
+
+T = TypeVar("T")
+
+def asyncify(fn: Callable[..., T]) -> Callable[..., Any]:
+    """Wrap a synchronous CRUD function so it runs through `db.run_sync`."""
+
+    @functools.wraps(fn)
+    async def wrapper(db, *args: Any, **kwargs: Any) -> T:
+        return await db.run_sync(fn, *args, **kwargs)
+
+    return wrapper
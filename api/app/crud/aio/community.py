@@ -0,0 +1,16 @@
+from .. import community as community_crud
+from ._base import asyncify
+
+get_community = asyncify(community_crud.get_community)
+get_communities = asyncify(community_crud.get_communities)
+get_communities_near = asyncify(community_crud.get_communities_near)
+search_communities = asyncify(community_crud.search_communities)
+get_communities_by_user = asyncify(community_crud.get_communities_by_user)
+get_joined_communities = asyncify(community_crud.get_joined_communities)
+get_joined_community_ids = asyncify(community_crud.get_joined_community_ids)
+get_communities_version = asyncify(community_crud.get_communities_version)
+create_community = asyncify(community_crud.create_community)
+update_community = asyncify(community_crud.update_community)
+delete_community = asyncify(community_crud.delete_community)
+join_community = asyncify(community_crud.join_community)
+leave_community = asyncify(community_crud.leave_community)
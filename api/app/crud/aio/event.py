@@ -0,0 +1,20 @@
+from .. import event as event_crud
+from ._base import asyncify
+
+get_event = asyncify(event_crud.get_event)
+get_events = asyncify(event_crud.get_events)
+get_events_near = asyncify(event_crud.get_events_near)
+search_events = asyncify(event_crud.search_events)
+get_feed = asyncify(event_crud.get_feed)
+get_events_by_user = asyncify(event_crud.get_events_by_user)
+get_attended_events = asyncify(event_crud.get_attended_events)
+get_liked_events = asyncify(event_crud.get_liked_events)
+get_attendee_avatars = asyncify(event_crud.get_attendee_avatars)
+get_events_version = asyncify(event_crud.get_events_version)
+create_event = asyncify(event_crud.create_event)
+update_event = asyncify(event_crud.update_event)
+delete_event = asyncify(event_crud.delete_event)
+attend_event = asyncify(event_crud.attend_event)
+unattend_event = asyncify(event_crud.unattend_event)
+like_event = asyncify(event_crud.like_event)
+unlike_event = asyncify(event_crud.unlike_event)
@@ -0,0 +1,12 @@
+from .. import notification as notification_crud
+from ._base import asyncify
+
+get_notification = asyncify(notification_crud.get_notification)
+get_unread_count = asyncify(notification_crud.get_unread_count)
+get_notifications_version = asyncify(notification_crud.get_notifications_version)
+get_user_notifications = asyncify(notification_crud.get_user_notifications)
+get_notifications_after = asyncify(notification_crud.get_notifications_after)
+create_notification = asyncify(notification_crud.create_notification)
+mark_notification_as_read = asyncify(notification_crud.mark_notification_as_read)
+mark_all_notifications_as_read = asyncify(notification_crud.mark_all_notifications_as_read)
+delete_notification = asyncify(notification_crud.delete_notification)
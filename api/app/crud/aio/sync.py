@@ -0,0 +1,4 @@
+from .. import sync as sync_crud
+from ._base import asyncify
+
+get_changes = asyncify(sync_crud.get_changes)
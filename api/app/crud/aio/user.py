@@ -0,0 +1,10 @@
+from .. import user as user_crud
+from ._base import asyncify
+
+get_user = asyncify(user_crud.get_user)
+get_user_by_email = asyncify(user_crud.get_user_by_email)
+get_users = asyncify(user_crud.get_users)
+get_users_by_interest = asyncify(user_crud.get_users_by_interest)
+create_user = asyncify(user_crud.create_user)
+update_user = asyncify(user_crud.update_user)
+delete_user = asyncify(user_crud.delete_user)
@@ -1,90 +1,219 @@
-from sqlalchemy.orm import Session
-from typing import List, Optional
+from sqlalchemy import String, delete, insert, literal, select, tuple_
+from sqlalchemy.orm import Session, selectinload
+from typing import List, Optional, Set, Tuple
 
 from .. import models, schemas
+from ..utils import changes, feed, geo, images, response_cache, search, versions
+from ..utils.pagination import decode_cursor, decode_datetime_cursor
+from ..utils.sql import insert_ignore
+
+def _listing_query(db: Session):
+    """Base community query that eager-loads everything a community response needs."""
+    return db.query(models.community.Community).options(selectinload(models.community.Community.creator))
 
 def get_community(db: Session, community_id: str) -> Optional[models.community.Community]:
     """Get a community by ID."""
-    return db.query(models.community.Community).filter(models.community.Community.id == community_id).first()
+    return _listing_query(db).filter(models.community.Community.id == community_id).first()
 
-def get_communities(
-    db: Session,
-    skip: int = 0,
-    limit: int = 100,
+def _filter_communities(
+    query,
     category: Optional[str] = None,
     membership_filter: Optional[str] = None,
     user_id: Optional[str] = None
-) -> List[models.community.Community]:
-    """Get multiple communities with filters and pagination."""
-    query = db.query(models.community.Community)
-    
+):
+    """Apply the communities list filters to `query`."""
     # Apply category filter if provided
     if category and category != "all":
         query = query.filter(models.community.Community.category == category)
     
     # Apply membership filter if both membership filter and user ID are provided
     if membership_filter and user_id and membership_filter != "all":
-        # Get the user
-        user = db.query(models.user.User).filter(models.user.User.id == user_id).first()
+        # Communities where user is a member, as a subquery on the association table
+        user_communities = select(models.user.user_community.c.community_id).where(
+            models.user.user_community.c.user_id == user_id
+        )
         
-        if user:
-            # Get communities where user is a member
-            user_communities = user.communities
-            
-            if membership_filter == "joined":
-                # Only include communities the user has joined
-                query = query.filter(models.community.Community.id.in_([comm.id for comm in user_communities]))
-            elif membership_filter == "notJoined":
-                # Exclude communities the user has joined
-                query = query.filter(~models.community.Community.id.in_([comm.id for comm in user_communities]))
-    
-    # Order by created date (newest first)
-    query = query.order_by(models.community.Community.created_at.desc())
-    
-    # Apply pagination
-    query = query.offset(skip).limit(limit)
+        if membership_filter == "joined":
+            # Only include communities the user has joined
+            query = query.filter(models.community.Community.id.in_(user_communities))
+        elif membership_filter == "notJoined":
+            # Exclude communities the user has joined
+            query = query.filter(~models.community.Community.id.in_(user_communities))
+    
+    return query
+
+def get_communities(
+    db: Session,
+    skip: int = 0,
+    limit: int = 100,
+    category: Optional[str] = None,
+    membership_filter: Optional[str] = None,
+    user_id: Optional[str] = None,
+    cursor: Optional[str] = None
+) -> List[models.community.Community]:
+    """
+    Get multiple communities with filters and pagination.
+    
+    When `cursor` is given the page starts after the community it points at
+    and `skip` is ignored. Raises ValueError for a malformed cursor.
+    """
+    query = _filter_communities(_listing_query(db), category, membership_filter, user_id)
+    
+    # Order by created date (newest first), with the ID as a stable tiebreaker
+    query = query.order_by(models.community.Community.created_at.desc(), models.community.Community.id.desc())
+    
+    # Apply pagination: keyset when a cursor is given, offset otherwise
+    if cursor:
+        created_at, community_id = decode_datetime_cursor(cursor)
+        query = query.filter(
+            tuple_(models.community.Community.created_at, models.community.Community.id)
+            < tuple_(created_at, community_id)
+        )
+    else:
+        query = query.offset(skip)
+    query = query.limit(limit)
     
     return query.all()
 
+def get_communities_near(
+    db: Session,
+    latitude: float,
+    longitude: float,
+    radius_km: float,
+    skip: int = 0,
+    limit: int = 100,
+    category: Optional[str] = None,
+    membership_filter: Optional[str] = None,
+    user_id: Optional[str] = None,
+    cursor: Optional[str] = None
+) -> List[Tuple[models.community.Community, float]]:
+    """
+    Get communities within `radius_km` of a point, nearest first, with the
+    same filters as `get_communities`.
+    
+    Returns (community, distance key) pairs; `geo.distance_km` converts the
+    key to kilometres. When `cursor` is given the page starts after the
+    community it points at and `skip` is ignored. Raises ValueError for a
+    malformed cursor.
+    """
+    after = None
+    if cursor:
+        key, community_id = decode_cursor(cursor)
+        if not isinstance(key, (int, float)) or isinstance(key, bool):
+            raise ValueError("Invalid cursor")
+        after = (key, community_id)
+    
+    # Rank candidates in the spatial index, loading those that pass the filters
+    query = _filter_communities(_listing_query(db), category, membership_filter, user_id)
+    offset = 0 if cursor else skip
+    matches = geo.load_nearest(db, "communities", query, latitude, longitude, radius_km, offset + limit, after)
+    
+    return matches[offset:]
+
+def search_communities(
+    db: Session,
+    query: str,
+    limit: int = 20,
+    cursor: Optional[str] = None
+) -> List[Tuple[models.community.Community, float]]:
+    """
+    Full-text search over community names and descriptions.
+    
+    Returns (community, rank) pairs, best match first; lower ranks are better.
+    When `cursor` is given the page starts after the match it points at.
+    Raises ValueError for a malformed cursor.
+    """
+    after = None
+    if cursor:
+        rank, community_id = decode_cursor(cursor)
+        if not isinstance(rank, (int, float)) or isinstance(rank, bool):
+            raise ValueError("Invalid cursor")
+        after = (rank, community_id)
+    
+    # Rank a page of IDs in the index, then load those communities in one query
+    matches = search.get_backend(db).search(db, "communities", query, limit, after)
+    communities = {
+        community.id: community
+        for community in _listing_query(db).filter(
+            models.community.Community.id.in_([community_id for community_id, _ in matches])
+        )
+    }
+    
+    return [(communities[community_id], rank) for community_id, rank in matches if community_id in communities]
+
+def get_communities_by_ids(db: Session, community_ids: List[str]) -> List[models.community.Community]:
+    """Get the communities with the given IDs that exist, in no particular order."""
+    if not community_ids:
+        return []
+    return _listing_query(db).filter(models.community.Community.id.in_(community_ids)).all()
+
 def get_communities_by_user(db: Session, user_id: str, skip: int = 0, limit: int = 100) -> List[models.community.Community]:
     """Get communities created by a specific user."""
-    return db.query(models.community.Community).filter(
+    return _listing_query(db).filter(
         models.community.Community.creator_id == user_id
     ).offset(skip).limit(limit).all()
 
 def get_joined_communities(db: Session, user_id: str, skip: int = 0, limit: int = 100) -> List[models.community.Community]:
     """Get communities that a user is a member of."""
-    user = db.query(models.user.User).filter(models.user.User.id == user_id).first()
-    if not user:
-        return []
-        
-    # Get joined communities
-    return user.communities[skip:skip+limit]
+    # Page through the association table instead of loading the user's whole collection
+    return _listing_query(db).join(
+        models.user.user_community,
+        models.user.user_community.c.community_id == models.community.Community.id
+    ).filter(
+        models.user.user_community.c.user_id == user_id
+    ).offset(skip).limit(limit).all()
+
+def get_joined_community_ids(db: Session, user_id: str, community_ids: List[str]) -> Set[str]:
+    """Get which of the given communities a user is a member of."""
+    if not community_ids:
+        return set()
+    
+    rows = db.execute(
+        select(models.user.user_community.c.community_id).where(
+            models.user.user_community.c.user_id == user_id,
+            models.user.user_community.c.community_id.in_(community_ids)
+        )
+    )
+    return {community_id for (community_id,) in rows}
+
+def get_communities_version(db: Session, user_id: str) -> str:
+    """
+    The version of a user's communities lists, changing whenever a community
+    or a user shown in them changes, or the user joins or leaves one.
+    """
+    return versions.list_version(db, ["communities", "users"], user_id, models.user.User.activity_version)
 
 def create_community(db: Session, community: schemas.community.CommunityCreate, user_id: str) -> models.community.Community:
-    """Create a new community."""
-    # Create the community
+    """Create a new community. Raises ValueError for an inline image that isn't a valid one."""
+    # Create the community, with an inline image moved to the blob store
     db_community = models.community.Community(
         name=community.name,
         description=community.description,
         category=community.category,
         location=community.location,
-        image=community.image,
+        image=images.externalize(community.image),
         guidelines=community.guidelines,
+        latitude=community.latitude,
+        longitude=community.longitude,
         creator_id=user_id
     )
     
-    # Add to database
+    # Add to database and the search and spatial indexes
     db.add(db_community)
-    db.commit()
-    db.refresh(db_community)
+    db.flush()
+    search.index_community(db, db_community)
+    geo.locate(db, "communities", db_community)
     
     # Add creator as a member
-    user = db.query(models.user.User).filter(models.user.User.id == user_id).first()
-    db_community.members.append(user)
+    db.execute(insert(models.user.user_community).values(user_id=user_id, community_id=db_community.id))
+    _adjust_counters(db, db_community.id, user_id, 1)
     db.commit()
     
-    return db_community
+    # The creator's community count changed
+    response_cache.invalidate("user", user_id)
+    
+    # Reload with the creator, so callers never lazy-load it
+    return get_community(db, db_community.id)
 
 def update_community(
     db: Session,
@@ -92,7 +221,7 @@ def update_community(
     community_data: schemas.community.CommunityUpdate,
     user_id: str
 ) -> Optional[models.community.Community]:
-    """Update a community."""
+    """Update a community. Raises ValueError for an inline image that isn't a valid one."""
     # Get the community
     db_community = get_community(db, community_id)
     if not db_community:
@@ -102,16 +231,23 @@ def update_community(
     if db_community.creator_id != user_id:
         return None
         
-    # Update community attributes
+    # Update community attributes, moving an inline image to the blob store
     update_data = community_data.dict(exclude_unset=True)
+    if "image" in update_data:
+        update_data["image"] = images.externalize(update_data["image"])
     for key, value in update_data.items():
         setattr(db_community, key, value)
     
-    # Commit changes
+    # Refresh the search document and location, and commit changes
+    search.index_community(db, db_community)
+    if "latitude" in update_data or "longitude" in update_data:
+        geo.locate(db, "communities", db_community)
+    versions.bump(db, "communities")
+    changes.record(db, "community", [(community_id, None)])
     db.commit()
-    db.refresh(db_community)
     
-    return db_community
+    # Reload with the creator, so callers never lazy-load it
+    return get_community(db, community_id)
 
 def delete_community(db: Session, community_id: str, user_id: str) -> bool:
     """Delete a community."""
@@ -123,51 +259,133 @@ def delete_community(db: Session, community_id: str, user_id: str) -> bool:
     # Check if user is the creator
     if db_community.creator_id != user_id:
         return False
+    
+    # Release the members' counters and drop the association rows in bulk;
+    # the community leaves the members' lists, and their memberships end
+    user_community = models.user.user_community
+    members = select(user_community.c.user_id).where(user_community.c.community_id == community_id)
+    member_ids = list(db.scalars(members))
+    changes.record(
+        db, "membership",
+        select(user_community.c.community_id, user_community.c.user_id).where(user_community.c.community_id == community_id),
+        deleted=True
+    )
+    db.query(models.user.User).filter(models.user.User.id.in_(members)).update(
+        {
+            models.user.User.community_count: models.user.User.community_count - 1,
+            models.user.User.activity_version: models.user.User.activity_version + 1,
+        },
+        synchronize_session=False
+    )
+    db.execute(delete(user_community).where(user_community.c.community_id == community_id))
         
-    # Delete the community
+    # Delete the community and its search and spatial index entries
+    search.remove_community(db, community_id)
+    geo.remove(db, "communities", community_id)
     db.delete(db_community)
+    versions.bump(db, "communities")
+    changes.record(db, "community", [(community_id, None)], deleted=True)
     db.commit()
     
+    # The members' community counts changed
+    for member_id in member_ids:
+        response_cache.invalidate("user", member_id)
+    
     return True
 
-def join_community(db: Session, community_id: str, user_id: str) -> bool:
-    """Add a user as a member to a community."""
-    # Get the community and user
-    community = get_community(db, community_id)
-    user = db.query(models.user.User).filter(models.user.User.id == user_id).first()
+def _adjust_counters(db: Session, community_id: str, user_id: str, delta: int) -> None:
+    """
+    Add `delta` to a community's member count and the user's community count,
+    bump the versions of the lists showing them, and log the community and
+    the membership started or ended for sync.
+    """
+    db.query(models.community.Community).filter(models.community.Community.id == community_id).update(
+        {models.community.Community.member_count: models.community.Community.member_count + delta},
+        synchronize_session=False
+    )
+    db.query(models.user.User).filter(models.user.User.id == user_id).update(
+        {
+            models.user.User.community_count: models.user.User.community_count + delta,
+            models.user.User.activity_version: models.user.User.activity_version + 1,
+        },
+        synchronize_session=False
+    )
+    versions.bump(db, "communities")
+    changes.record(db, "community", [(community_id, None)])
+    changes.record(db, "membership", [(community_id, user_id)], deleted=delta < 0)
+
+def join_community(db: Session, community_id: str, user_id: str) -> Optional[bool]:
+    """
+    Add a user as a member to a community.
     
-    if not community or not user:
-        return False
+    Returns whether the user was newly added, or None if the community doesn't exist.
+    """
+    user_community = models.user.user_community
     
-    # Check if user is already a member
-    if user in community.members:
-        return True
+    # Insert the membership row unless it already exists; the SELECT yields
+    # no row for a missing community, so nothing is inserted
+    result = db.execute(
+        insert_ignore(db, user_community).from_select(
+            ["user_id", "community_id"],
+            select(literal(user_id, String), models.community.Community.id).where(
+                models.community.Community.id == community_id
+            )
+        )
+    )
+    joined = bool(result.rowcount)
+    if not joined:
+        exists = db.scalar(
+            select(models.community.Community.id).where(models.community.Community.id == community_id)
+        )
+        if exists is None:
+            return None
     
-    # Add user to members
-    community.members.append(user)
+    # Bump both counters in the same transaction, only if the row is new
+    if joined:
+        _adjust_counters(db, community_id, user_id, 1)
+        feed.user_changed(db, user_id)
     db.commit()
     
-    return True
-
-def leave_community(db: Session, community_id: str, user_id: str) -> bool:
-    """Remove a user as a member from a community."""
-    # Get the community and user
-    community = get_community(db, community_id)
-    user = db.query(models.user.User).filter(models.user.User.id == user_id).first()
+    # The user's community count changed
+    if joined:
+        response_cache.invalidate("user", user_id)
     
-    if not community or not user:
-        return False
+    return joined
+
+def leave_community(db: Session, community_id: str, user_id: str) -> Optional[bool]:
+    """
+    Remove a user as a member from a community.
     
-    # Check if user is a member
-    if user not in community.members:
-        return True
+    Returns whether the user was a member, or None if the community doesn't
+    exist. Raises ValueError if the user is the community's creator.
+    """
+    # Look up the creator (creator can't leave)
+    creator_id = db.scalar(
+        select(models.community.Community.creator_id).where(models.community.Community.id == community_id)
+    )
+    if creator_id is None:
+        return None
+    if creator_id == user_id:
+        raise ValueError("The creator can't leave their community")
     
-    # Check if user is creator (creator can't leave)
-    if community.creator_id == user_id:
-        return False
+    # Delete the membership row if there is one
+    user_community = models.user.user_community
+    result = db.execute(
+        delete(user_community).where(
+            user_community.c.community_id == community_id,
+            user_community.c.user_id == user_id
+        )
+    )
+    left = bool(result.rowcount)
     
-    # Remove user from members
-    community.members.remove(user)
+    # Decrement both counters in the same transaction, only if a row was deleted
+    if left:
+        _adjust_counters(db, community_id, user_id, -1)
+        feed.user_changed(db, user_id)
     db.commit()
     
-    return True 
\ No newline at end of file
+    # The user's community count changed
+    if left:
+        response_cache.invalidate("user", user_id)
+    
+    return left
@@ -1,29 +1,44 @@
-from sqlalchemy.orm import Session
-from typing import List, Optional
+from sqlalchemy import String, Table, delete, func, literal, select, tuple_
+from sqlalchemy.orm import Session, selectinload
+from datetime import datetime, timezone
+from typing import Callable, Dict, List, Optional, Tuple
 
 from .. import models, schemas
+from . import notification as notification_crud
+from ..utils import changes, fanout, feed, geo, images, response_cache, search, versions
+from ..utils.dates import as_utc, parse_event_start
+from ..utils.pagination import decode_cursor, decode_datetime_cursor
+from ..utils.sql import insert_ignore
+
+# Number of attendee avatars shown on an event card
+FEED_AVATAR_LIMIT = 5
+
+def _feed_query(db: Session):
+    """Base event query that eager-loads everything an event feed item needs."""
+    return db.query(models.event.Event).options(selectinload(models.event.Event.organizer))
 
 def get_event(db: Session, event_id: str) -> Optional[models.event.Event]:
     """Get an event by ID."""
-    return db.query(models.event.Event).filter(models.event.Event.id == event_id).first()
+    return _feed_query(db).filter(models.event.Event.id == event_id).first()
 
-def get_events(
+def _filter_events(
     db: Session,
-    skip: int = 0,
-    limit: int = 100,
+    query,
     category: Optional[str] = None,
     location: Optional[str] = None,
     price_filter: Optional[str] = None,
-) -> List[models.event.Event]:
-    """Get multiple events with filters and pagination."""
-    query = db.query(models.event.Event)
-    
+    starts_from: Optional[datetime] = None,
+    starts_before: Optional[datetime] = None,
+    upcoming_only: bool = False,
+):
+    """Apply the events list filters to `query`."""
     # Apply filters if provided
     if category and category != "all":
         query = query.filter(models.event.Event.category == category)
         
     if location:
-        query = query.filter(models.event.Event.location.contains(location))
+        # Match location words through the search index instead of a LIKE scan
+        query = query.filter(models.event.Event.id.in_(search.get_backend(db).matching_ids(db, "events", "location", location)))
         
     if price_filter:
         if price_filter == "free":
@@ -31,41 +46,261 @@ def get_events(
         elif price_filter == "paid":
             query = query.filter(models.event.Event.price > 0)
     
-    # Order by date (newest first)
-    query = query.order_by(models.event.Event.date.desc())
+    # Bound the start time; ordered by start time, this is a range scan of
+    # ix_events_starts_at_id
+    if upcoming_only:
+        now = datetime.now(timezone.utc)
+        starts_from = max(as_utc(starts_from), now) if starts_from else now
+    if starts_from:
+        query = query.filter(models.event.Event.starts_at >= as_utc(starts_from))
+    if starts_before:
+        query = query.filter(models.event.Event.starts_at < as_utc(starts_before))
     
-    # Apply pagination
-    query = query.offset(skip).limit(limit)
+    return query
+
+def get_events(
+    db: Session,
+    skip: int = 0,
+    limit: int = 100,
+    category: Optional[str] = None,
+    location: Optional[str] = None,
+    price_filter: Optional[str] = None,
+    starts_from: Optional[datetime] = None,
+    starts_before: Optional[datetime] = None,
+    upcoming_only: bool = False,
+    cursor: Optional[str] = None,
+) -> List[models.event.Event]:
+    """
+    Get multiple events with filters and pagination.
+    
+    Events are ordered by start time, latest first, or soonest first when
+    `upcoming_only` hides events that have already started. `starts_from`
+    and `starts_before` bound the start time (inclusive and exclusive).
+    
+    When `cursor` is given the page starts after the event it points at and
+    `skip` is ignored. Raises ValueError for a malformed cursor.
+    """
+    query = _filter_events(
+        db, _feed_query(db), category, location, price_filter, starts_from, starts_before, upcoming_only
+    )
+    
+    # Order by start time (soonest first for upcoming events, latest first
+    # otherwise), with the ID as a stable tiebreaker
+    sort_key = tuple_(models.event.Event.starts_at, models.event.Event.id)
+    if upcoming_only:
+        query = query.order_by(models.event.Event.starts_at.asc(), models.event.Event.id.asc())
+    else:
+        query = query.order_by(models.event.Event.starts_at.desc(), models.event.Event.id.desc())
+    
+    # Apply pagination: keyset when a cursor is given, offset otherwise
+    if cursor:
+        starts_at, event_id = decode_datetime_cursor(cursor)
+        starts_at = as_utc(starts_at)
+        if upcoming_only:
+            query = query.filter(sort_key > tuple_(starts_at, event_id))
+        else:
+            query = query.filter(sort_key < tuple_(starts_at, event_id))
+    else:
+        query = query.offset(skip)
+    query = query.limit(limit)
     
     return query.all()
 
+def get_events_near(
+    db: Session,
+    latitude: float,
+    longitude: float,
+    radius_km: float,
+    skip: int = 0,
+    limit: int = 100,
+    category: Optional[str] = None,
+    location: Optional[str] = None,
+    price_filter: Optional[str] = None,
+    starts_from: Optional[datetime] = None,
+    starts_before: Optional[datetime] = None,
+    upcoming_only: bool = False,
+    cursor: Optional[str] = None,
+) -> List[Tuple[models.event.Event, float]]:
+    """
+    Get events within `radius_km` of a point, nearest first, with the same
+    filters as `get_events`.
+    
+    Returns (event, distance key) pairs; `geo.distance_km` converts the key
+    to kilometres. When `cursor` is given the page starts after the event it
+    points at and `skip` is ignored. Raises ValueError for a malformed cursor.
+    """
+    after = None
+    if cursor:
+        key, event_id = decode_cursor(cursor)
+        if not isinstance(key, (int, float)) or isinstance(key, bool):
+            raise ValueError("Invalid cursor")
+        after = (key, event_id)
+    
+    # Rank candidates in the spatial index, loading those that pass the filters
+    query = _filter_events(
+        db, _feed_query(db), category, location, price_filter, starts_from, starts_before, upcoming_only
+    )
+    offset = 0 if cursor else skip
+    matches = geo.load_nearest(db, "events", query, latitude, longitude, radius_km, offset + limit, after)
+    
+    return matches[offset:]
+
+def search_events(
+    db: Session,
+    query: str,
+    limit: int = 20,
+    cursor: Optional[str] = None
+) -> List[Tuple[models.event.Event, float]]:
+    """
+    Full-text search over event titles, categories, locations and descriptions.
+    
+    Returns (event, rank) pairs, best match first; lower ranks are better.
+    When `cursor` is given the page starts after the match it points at.
+    Raises ValueError for a malformed cursor.
+    """
+    after = None
+    if cursor:
+        rank, event_id = decode_cursor(cursor)
+        if not isinstance(rank, (int, float)) or isinstance(rank, bool):
+            raise ValueError("Invalid cursor")
+        after = (rank, event_id)
+    
+    # Rank a page of IDs in the index, then load those events in one query
+    matches = search.get_backend(db).search(db, "events", query, limit, after)
+    events = {
+        event.id: event
+        for event in _feed_query(db).filter(models.event.Event.id.in_([event_id for event_id, _ in matches]))
+    }
+    
+    return [(events[event_id], rank) for event_id, rank in matches if event_id in events]
+
+def get_feed(
+    db: Session,
+    user_id: str,
+    limit: int = 20,
+    cursor: Optional[str] = None
+) -> List[Tuple[models.event.Event, float]]:
+    """
+    Get a user's personalized home feed, best first, from their precomputed
+    feed items (see `app.utils.feed`).
+    
+    Returns (event, score) pairs, skipping events that started since the feed
+    was computed. A missing or stale feed is recomputed when the first page is
+    read. When `cursor` is given the page starts after the item it points at.
+    Raises ValueError for a malformed cursor.
+    """
+    after = None
+    if cursor:
+        score, event_id = decode_cursor(cursor)
+        if not isinstance(score, (int, float)) or isinstance(score, bool):
+            raise ValueError("Invalid cursor")
+        after = (score, event_id)
+    else:
+        # Compute the feed on first use, and again once it is stale
+        user = db.get(models.user.User, user_id)
+        if user is not None and feed.is_stale(user):
+            feed.refresh_user(db, user_id)
+            db.commit()
+    
+    # Read the page in feed order with one range scan over the user's items
+    query = (
+        db.query(models.event.Event, models.feed.FeedItem.score)
+        .join(models.feed.FeedItem, models.feed.FeedItem.event_id == models.event.Event.id)
+        .options(selectinload(models.event.Event.organizer))
+        .filter(
+            models.feed.FeedItem.user_id == user_id,
+            models.event.Event.starts_at >= datetime.now(timezone.utc)
+        )
+        .order_by(models.feed.FeedItem.score.desc(), models.feed.FeedItem.event_id.desc())
+    )
+    if after is not None:
+        query = query.filter(tuple_(models.feed.FeedItem.score, models.feed.FeedItem.event_id) < tuple_(*after))
+    
+    return [(event, score) for event, score in query.limit(limit)]
+
+def get_events_by_ids(db: Session, event_ids: List[str]) -> List[models.event.Event]:
+    """Get the events with the given IDs that exist, in no particular order."""
+    if not event_ids:
+        return []
+    return _feed_query(db).filter(models.event.Event.id.in_(event_ids)).all()
+
 def get_events_by_user(db: Session, user_id: str, skip: int = 0, limit: int = 100) -> List[models.event.Event]:
     """Get events created by a specific user."""
-    return db.query(models.event.Event).filter(
+    return _feed_query(db).filter(
         models.event.Event.organizer_id == user_id
     ).offset(skip).limit(limit).all()
 
 def get_attended_events(db: Session, user_id: str, skip: int = 0, limit: int = 100) -> List[models.event.Event]:
     """Get events that a user is attending."""
-    user = db.query(models.user.User).filter(models.user.User.id == user_id).first()
-    if not user:
-        return []
-        
-    # Get attended events
-    return user.attending_events[skip:skip+limit]
+    # Page through the association table instead of loading the user's whole collection
+    return _feed_query(db).join(
+        models.user.user_event, models.user.user_event.c.event_id == models.event.Event.id
+    ).filter(
+        models.user.user_event.c.user_id == user_id
+    ).offset(skip).limit(limit).all()
 
 def get_liked_events(db: Session, user_id: str, skip: int = 0, limit: int = 100) -> List[models.event.Event]:
     """Get events that a user has liked/favorited."""
-    user = db.query(models.user.User).filter(models.user.User.id == user_id).first()
-    if not user:
-        return []
-        
-    # Get liked events
-    return user.liked_events[skip:skip+limit]
+    # Page through the association table instead of loading the user's whole collection
+    return _feed_query(db).join(
+        models.user.user_liked_event, models.user.user_liked_event.c.event_id == models.event.Event.id
+    ).filter(
+        models.user.user_liked_event.c.user_id == user_id
+    ).offset(skip).limit(limit).all()
+
+def get_events_version(db: Session, user_id: Optional[str] = None) -> str:
+    """
+    The version of the events lists, changing whenever an event or a user
+    shown in them changes. With `user_id`, also whenever that user attends,
+    likes or stops attending or liking an event.
+    """
+    return versions.list_version(db, ["events", "users"], user_id, models.user.User.activity_version)
+
+def get_attendee_avatars(db: Session, events: List[models.event.Event]) -> Dict[str, List[str]]:
+    """
+    Get the first few attendee avatars for a page of events.
+    
+    Runs one windowed query for the whole page instead of loading every
+    event's attendee collection. Attendee counts are read from
+    `Event.attendee_count`.
+    """
+    event_ids = [event.id for event in events]
+    attendee_avatars = {event_id: [] for event_id in event_ids}
+    if not event_ids:
+        return attendee_avatars
+    
+    user_event = models.user.user_event
+    
+    # Rank attendees with an avatar within each event and keep the first few
+    ranked = (
+        select(
+            user_event.c.event_id,
+            models.user.User.avatar,
+            func.row_number().over(
+                partition_by=user_event.c.event_id,
+                order_by=user_event.c.user_id
+            ).label("position")
+        )
+        .join(models.user.User, models.user.User.id == user_event.c.user_id)
+        .where(
+            user_event.c.event_id.in_(event_ids),
+            models.user.User.avatar.isnot(None)
+        )
+        .subquery()
+    )
+    avatars = db.execute(
+        select(ranked.c.event_id, ranked.c.avatar)
+        .where(ranked.c.position <= FEED_AVATAR_LIMIT)
+        .order_by(ranked.c.event_id, ranked.c.position)
+    )
+    for event_id, avatar in avatars:
+        attendee_avatars[event_id].append(avatar)
+    
+    return attendee_avatars
 
 def create_event(db: Session, event: schemas.event.EventCreate, user_id: str) -> models.event.Event:
-    """Create a new event."""
-    # Create the event
+    """Create a new event. Raises ValueError for an inline image that isn't a valid one."""
+    # Create the event, with an inline image moved to the blob store
     db_event = models.event.Event(
         title=event.title,
         description=event.description,
@@ -74,16 +309,41 @@ def create_event(db: Session, event: schemas.event.EventCreate, user_id: str) ->
         location=event.location,
         category=event.category,
         price=event.price,
-        image=event.image,
+        image=images.externalize(event.image),
         community_id=event.community_id,
-        organizer_id=user_id
+        latitude=event.latitude,
+        longitude=event.longitude,
+        organizer_id=user_id,
+        # Unparseable dates sort as if the event starts when it was created
+        starts_at=parse_event_start(event.date, event.time) or datetime.now(timezone.utc)
     )
     
-    # Add to database
+    # Add to database and the search and spatial indexes
     db.add(db_event)
+    db.flush()
+    search.index_event(db, db_event)
+    geo.locate(db, "events", db_event)
+    
+    # Change the events list's version and log it for sync
+    versions.bump(db, "events")
+    changes.record(db, "event", [(db_event.id, None)])
     db.commit()
-    db.refresh(db_event)
     
+    # Push it into the feeds it matches, off the request
+    feed.submit_event(db_event.id)
+    
+    # Reload with the organizer, so callers never lazy-load it
+    db_event = get_event(db, db_event.id)
+    
+    # Tell the community's members, off the request
+    if db_event.community_id:
+        fanout.submit(
+            [("community_members", db_event.community_id)],
+            f'posted a new event "{db_event.title}"',
+            "event",
+            sender_id=user_id,
+            reference_id=db_event.id
+        )
     return db_event
 
 def update_event(
@@ -92,7 +352,7 @@ def update_event(
     event_data: schemas.event.EventUpdate,
     user_id: str
 ) -> Optional[models.event.Event]:
-    """Update an event."""
+    """Update an event. Raises ValueError for an inline image that isn't a valid one."""
     # Get the event
     db_event = get_event(db, event_id)
     if not db_event:
@@ -102,15 +362,45 @@ def update_event(
     if db_event.organizer_id != user_id:
         return None
         
-    # Update event attributes
+    # Update event attributes, moving an inline image to the blob store
     update_data = event_data.dict(exclude_unset=True)
+    if "image" in update_data:
+        update_data["image"] = images.externalize(update_data["image"])
     for key, value in update_data.items():
         setattr(db_event, key, value)
     
-    # Commit changes
+    # Keep the typed start time in step with the date and time strings
+    if "date" in update_data or "time" in update_data:
+        starts_at = parse_event_start(db_event.date, db_event.time)
+        if starts_at is not None:
+            db_event.starts_at = starts_at
+    
+    # Refresh the search document and location, and commit changes
+    search.index_event(db, db_event)
+    if "latitude" in update_data or "longitude" in update_data:
+        geo.locate(db, "events", db_event)
+    
+    versions.bump(db, "events")
+    changes.record(db, "event", [(event_id, None)])
     db.commit()
-    db.refresh(db_event)
+    response_cache.invalidate("event", event_id)
+    
+    # Rescore it in the feeds when what it is scored on changes, off the request
+    if update_data.keys() & {"category", "community_id", "date", "time"}:
+        feed.submit_event(event_id)
+    
+    # Reload with the organizer, so callers never lazy-load it
+    db_event = get_event(db, event_id)
     
+    # Tell attendees and likers when the time or place changes, off the request
+    if update_data.keys() & {"date", "time", "location", "latitude", "longitude"}:
+        fanout.submit(
+            [("event_attendees", event_id), ("event_likers", event_id)],
+            f'updated the event "{db_event.title}"',
+            "event",
+            sender_id=user_id,
+            reference_id=event_id
+        )
     return db_event
 
 def delete_event(db: Session, event_id: str, user_id: str) -> bool:
@@ -123,85 +413,220 @@ def delete_event(db: Session, event_id: str, user_id: str) -> bool:
     # Check if user is the organizer
     if db_event.organizer_id != user_id:
         return False
+    
+    # Release the attendees' counters and drop the association rows in bulk;
+    # the event leaves the attendees' and likers' lists
+    user_event = models.user.user_event
+    user_liked_event = models.user.user_liked_event
+    attendees = select(user_event.c.user_id).where(user_event.c.event_id == event_id)
+    attendee_ids = list(db.scalars(attendees))
+    db.query(models.user.User).filter(models.user.User.id.in_(attendees)).update(
+        {
+            models.user.User.attending_count: models.user.User.attending_count - 1,
+            models.user.User.activity_version: models.user.User.activity_version + 1,
+        },
+        synchronize_session=False
+    )
+    versions.bump_user(
+        db, select(user_liked_event.c.user_id).where(user_liked_event.c.event_id == event_id),
+        models.user.User.activity_version
+    )
+    db.execute(delete(user_event).where(user_event.c.event_id == event_id))
+    db.execute(delete(user_liked_event).where(user_liked_event.c.event_id == event_id))
         
-    # Delete the event
+    # Delete the event and its search and spatial index entries
+    search.remove_event(db, event_id)
+    geo.remove(db, "events", event_id)
+    feed.remove_event(db, event_id)
     db.delete(db_event)
+    versions.bump(db, "events")
+    changes.record(db, "event", [(event_id, None)], deleted=True)
     db.commit()
     
+    # The event is gone, and its attendees' counts changed
+    response_cache.invalidate("event", event_id)
+    for attendee_id in attendee_ids:
+        response_cache.invalidate("user", attendee_id)
+    
     return True
 
-def attend_event(db: Session, event_id: str, user_id: str) -> bool:
-    """Add a user as an attendee to an event."""
-    # Get the event and user
-    event = get_event(db, event_id)
-    user = db.query(models.user.User).filter(models.user.User.id == user_id).first()
-    
-    if not event or not user:
-        return False
+def _event_exists(db: Session, event_id: str) -> bool:
+    """Check whether an event exists without loading it."""
+    return db.scalar(select(models.event.Event.id).where(models.event.Event.id == event_id)) is not None
+
+def _add_event_link(db: Session, link_table: Table, event_id: str, user_id: str) -> Optional[bool]:
+    """
+    Link a user to an event through `link_table` with a single INSERT ... SELECT.
     
-    # Check if user is already attending
-    if user in event.attendees:
+    Returns True if the row was added, False if it already existed and None
+    if the event doesn't exist.
+    """
+    # The SELECT yields no row for a missing event, so nothing is inserted
+    result = db.execute(
+        insert_ignore(db, link_table).from_select(
+            ["user_id", "event_id"],
+            select(literal(user_id, String), models.event.Event.id).where(models.event.Event.id == event_id)
+        )
+    )
+    if result.rowcount:
         return True
     
-    # Add user to attendees
-    event.attendees.append(user)
-    db.commit()
+    return False if _event_exists(db, event_id) else None
+
+def _remove_event_link(db: Session, link_table: Table, event_id: str, user_id: str) -> Optional[bool]:
+    """
+    Unlink a user from an event with a single DELETE on `link_table`.
     
-    return True
+    Returns True if the row was removed, False if there was none and None
+    if the event doesn't exist.
+    """
+    result = db.execute(
+        delete(link_table).where(link_table.c.event_id == event_id, link_table.c.user_id == user_id)
+    )
+    if result.rowcount:
+        return True
+    
+    return False if _event_exists(db, event_id) else None
+
+def _adjust_counters(db: Session, event_id: str, user_id: str, event_counter, user_counter, delta: int) -> None:
+    """Add `delta` to an event counter and, if given, the matching user counter."""
+    db.query(models.event.Event).filter(models.event.Event.id == event_id).update(
+        {event_counter: event_counter + delta},
+        synchronize_session=False
+    )
+    if user_counter is not None:
+        db.query(models.user.User).filter(models.user.User.id == user_id).update(
+            {user_counter: user_counter + delta},
+            synchronize_session=False
+        )
 
-def unattend_event(db: Session, event_id: str, user_id: str) -> bool:
-    """Remove a user as an attendee from an event."""
-    # Get the event and user
-    event = get_event(db, event_id)
-    user = db.query(models.user.User).filter(models.user.User.id == user_id).first()
+def _organizer_message(action: Tuple[str, str], title: str) -> Callable[[int], str]:
+    """
+    Notification text about an event for a number of users who did
+    `action`, given as its (singular, plural) verb, e.g. ("is attending", "are attending").
+    """
+    def message(actor_count: int) -> str:
+        others = actor_count - 1
+        if not others:
+            return f'{action[0]} your event "{title}"'
+        return f'and {others} {"other" if others == 1 else "others"} {action[1]} your event "{title}"'
+    return message
+
+def _notify_organizer(db: Session, event_id: str, user_id: str, notification_type: str, action: Tuple[str, str]) -> None:
+    """Tell an event's organizer that a user attended or liked it, aggregated per event."""
+    db_event = db.get(models.event.Event, event_id)
+    organizer = db.get(models.user.User, db_event.organizer_id)
+    if organizer.id == user_id or organizer.notifications_enabled is False:
+        return
     
-    if not event or not user:
-        return False
+    notification_crud.create_aggregated_notification(
+        db, organizer.id, notification_type, event_id, user_id, _organizer_message(action, db_event.title)
+    )
+
+def attend_event(db: Session, event_id: str, user_id: str) -> Optional[bool]:
+    """
+    Add a user as an attendee to an event.
     
-    # Check if user is attending
-    if user not in event.attendees:
-        return True
+    Returns whether the user was newly added, or None if the event doesn't exist.
+    """
+    # Insert the attendance row unless it already exists
+    added = _add_event_link(db, models.user.user_event, event_id, user_id)
     
-    # Remove user from attendees
-    event.attendees.remove(user)
+    # Bump both counters and the lists' versions, and log the new attendee
+    # count for sync, in the same transaction, only if the row is new
+    if added:
+        _adjust_counters(
+            db, event_id, user_id,
+            models.event.Event.attendee_count, models.user.User.attending_count, 1
+        )
+        versions.bump(db, "events")
+        versions.bump_user(db, [user_id], models.user.User.activity_version)
+        changes.record(db, "event", [(event_id, None)])
     db.commit()
     
-    return True
-
-def like_event(db: Session, event_id: str, user_id: str) -> bool:
-    """Add a user as a liker to an event."""
-    # Get the event and user
-    event = get_event(db, event_id)
-    user = db.query(models.user.User).filter(models.user.User.id == user_id).first()
+    # The event's attendees and the user's count changed
+    if added:
+        response_cache.invalidate("event", event_id)
+        response_cache.invalidate("user", user_id)
     
-    if not event or not user:
-        return False
+    # Rescore the event for the user's fellow members, off the request
+    if added:
+        feed.submit_attendance(event_id, user_id)
     
-    # Check if user already likes the event
-    if user in event.likers:
-        return True
+    # Tell the organizer, folded into their recent attendance notification
+    if added:
+        _notify_organizer(db, event_id, user_id, "event_attendance", ("is attending", "are attending"))
     
-    # Add user to likers
-    event.likers.append(user)
+    return added
+
+def unattend_event(db: Session, event_id: str, user_id: str) -> Optional[bool]:
+    """
+    Remove a user as an attendee from an event.
+    
+    Returns whether the user was attending, or None if the event doesn't exist.
+    """
+    # Delete the attendance row if there is one
+    removed = _remove_event_link(db, models.user.user_event, event_id, user_id)
+    
+    # Decrement both counters, bump the lists' versions and log the new
+    # attendee count for sync in the same transaction, only if a row was deleted
+    if removed:
+        _adjust_counters(
+            db, event_id, user_id,
+            models.event.Event.attendee_count, models.user.User.attending_count, -1
+        )
+        versions.bump(db, "events")
+        versions.bump_user(db, [user_id], models.user.User.activity_version)
+        changes.record(db, "event", [(event_id, None)])
     db.commit()
     
-    return True
+    # The event's attendees and the user's count changed
+    if removed:
+        response_cache.invalidate("event", event_id)
+        response_cache.invalidate("user", user_id)
+    
+    # Rescore the event for the user's fellow members, off the request
+    if removed:
+        feed.submit_attendance(event_id, user_id)
+    
+    return removed
 
-def unlike_event(db: Session, event_id: str, user_id: str) -> bool:
-    """Remove a user as a liker from an event."""
-    # Get the event and user
-    event = get_event(db, event_id)
-    user = db.query(models.user.User).filter(models.user.User.id == user_id).first()
+def like_event(db: Session, event_id: str, user_id: str) -> Optional[bool]:
+    """
+    Add a user as a liker to an event.
     
-    if not event or not user:
-        return False
+    Returns whether the like is new, or None if the event doesn't exist.
+    """
+    # Insert the like row unless it already exists
+    added = _add_event_link(db, models.user.user_liked_event, event_id, user_id)
     
-    # Check if user likes the event
-    if user not in event.likers:
-        return True
+    # Bump the counter and the user's favorites version in the same
+    # transaction, only if the row is new
+    if added:
+        _adjust_counters(db, event_id, user_id, models.event.Event.like_count, None, 1)
+        versions.bump_user(db, [user_id], models.user.User.activity_version)
+    db.commit()
+    
+    # Tell the organizer, folded into their recent like notification
+    if added:
+        _notify_organizer(db, event_id, user_id, "event_like", ("liked", "liked"))
+    
+    return added
+
+def unlike_event(db: Session, event_id: str, user_id: str) -> Optional[bool]:
+    """
+    Remove a user as a liker from an event.
+    
+    Returns whether the user had liked the event, or None if the event doesn't exist.
+    """
+    # Delete the like row if there is one
+    removed = _remove_event_link(db, models.user.user_liked_event, event_id, user_id)
     
-    # Remove user from likers
-    event.likers.remove(user)
+    # Decrement the counter and bump the user's favorites version in the same
+    # transaction, only if a row was deleted
+    if removed:
+        _adjust_counters(db, event_id, user_id, models.event.Event.like_count, None, -1)
+        versions.bump_user(db, [user_id], models.user.User.activity_version)
     db.commit()
     
-    return True 
\ No newline at end of file
+    return removed
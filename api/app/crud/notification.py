@@ -1,8 +1,17 @@
-from sqlalchemy.orm import Session
-from datetime import datetime
-from typing import List, Optional
+from sqlalchemy import delete, insert, select, tuple_
+from sqlalchemy.orm import Session, selectinload
+from datetime import datetime, timedelta, timezone
+from typing import Callable, List, Optional
 
 from .. import models, schemas
+from ..serializers import serialize_notification_message
+from ..utils import changes, pubsub, versions
+from ..utils.pagination import decode_datetime_cursor
+from ..utils.sql import insert_ignore
+
+# A notification with the same user, type and reference as one from within
+# this window is folded into it instead of adding a row
+AGGREGATION_WINDOW = timedelta(hours=24)
 
 def get_notification(db: Session, notification_id: str) -> Optional[models.notification.Notification]:
     """Get a notification by ID."""
@@ -10,15 +19,55 @@ def get_notification(db: Session, notification_id: str) -> Optional[models.notif
         models.notification.Notification.id == notification_id
     ).first()
 
+def get_notifications_by_ids(db: Session, user_id: str, notification_ids: List[str]) -> List[models.notification.Notification]:
+    """Get a user's notifications with the given IDs that exist, in no particular order."""
+    if not notification_ids:
+        return []
+    return db.query(models.notification.Notification).options(
+        selectinload(models.notification.Notification.sender)
+    ).filter(
+        models.notification.Notification.user_id == user_id,
+        models.notification.Notification.id.in_(notification_ids)
+    ).all()
+
+def get_unread_count(db: Session, user_id: str) -> int:
+    """Get a user's number of unread notifications, from the maintained counter."""
+    count = db.scalar(
+        select(models.user.User.unread_notification_count).where(models.user.User.id == user_id)
+    )
+    return count or 0
+
+def get_notifications_version(db: Session, user_id: str) -> str:
+    """The version of a user's notifications list, changing with their notifications and the senders shown."""
+    return versions.list_version(db, ["users"], user_id, models.user.User.notifications_version)
+
+def _notifications_changed(db: Session, user_id: str, unread_delta: int = 0) -> None:
+    """Bump the version of a user's notifications list and add `unread_delta` to their unread count."""
+    db.query(models.user.User).filter(models.user.User.id == user_id).update(
+        {
+            models.user.User.unread_notification_count: models.user.User.unread_notification_count + unread_delta,
+            models.user.User.notifications_version: models.user.User.notifications_version + 1,
+        },
+        synchronize_session=False
+    )
+
 def get_user_notifications(
     db: Session,
     user_id: str,
     skip: int = 0,
     limit: int = 100,
-    unread_only: bool = False
+    unread_only: bool = False,
+    cursor: Optional[str] = None
 ) -> List[models.notification.Notification]:
-    """Get notifications for a specific user."""
-    query = db.query(models.notification.Notification).filter(
+    """
+    Get notifications for a specific user.
+    
+    When `cursor` is given the page starts after the notification it points
+    at and `skip` is ignored. Raises ValueError for a malformed cursor.
+    """
+    query = db.query(models.notification.Notification).options(
+        selectinload(models.notification.Notification.sender)
+    ).filter(
         models.notification.Notification.user_id == user_id
     )
     
@@ -26,14 +75,59 @@ def get_user_notifications(
     if unread_only:
         query = query.filter(models.notification.Notification.read == False)
     
-    # Order by created_at (newest first)
-    query = query.order_by(models.notification.Notification.created_at.desc())
+    # Order by updated_at (latest activity first), with the ID as a stable tiebreaker
+    query = query.order_by(
+        models.notification.Notification.updated_at.desc(),
+        models.notification.Notification.id.desc()
+    )
     
-    # Apply pagination
-    query = query.offset(skip).limit(limit)
+    # Apply pagination: keyset when a cursor is given, offset otherwise
+    if cursor:
+        updated_at, notification_id = decode_datetime_cursor(cursor)
+        query = query.filter(
+            tuple_(models.notification.Notification.updated_at, models.notification.Notification.id)
+            < tuple_(updated_at, notification_id)
+        )
+    else:
+        query = query.offset(skip)
+    query = query.limit(limit)
     
     return query.all()
 
+def get_notifications_after(
+    db: Session,
+    user_id: str,
+    last_id: str,
+    limit: int = 100
+) -> Optional[List[models.notification.Notification]]:
+    """
+    Get a user's notifications created or updated after the live message
+    `last_id` (see `serializers.notification_resume_id`), oldest first, to
+    resume a live stream.
+    
+    A bare notification ID, as sent before messages carried resume IDs,
+    resumes after that notification's latest update. Returns None if it is
+    not the user's or no longer exists.
+    """
+    try:
+        updated_at, notification_id = decode_datetime_cursor(last_id)
+    except ValueError:
+        last = get_notification(db, last_id)
+        if last is None or last.user_id != user_id:
+            return None
+        updated_at, notification_id = last.updated_at, last.id
+    
+    return db.query(models.notification.Notification).options(
+        selectinload(models.notification.Notification.sender)
+    ).filter(
+        models.notification.Notification.user_id == user_id,
+        tuple_(models.notification.Notification.updated_at, models.notification.Notification.id)
+        > tuple_(updated_at, notification_id)
+    ).order_by(
+        models.notification.Notification.updated_at,
+        models.notification.Notification.id
+    ).limit(limit).all()
+
 def create_notification(
     db: Session,
     user_id: str,
@@ -44,20 +138,101 @@ def create_notification(
 ) -> models.notification.Notification:
     """Create a new notification."""
     # Create the notification
+    now = datetime.now(timezone.utc)
     db_notification = models.notification.Notification(
         user_id=user_id,
         sender_id=sender_id,
         message=message,
         notification_type=notification_type,
         reference_id=reference_id,
-        read=False
+        read=False,
+        created_at=now,
+        updated_at=now
     )
     
-    # Add to database
+    # Add to database, counting it as unread and logging it for sync
     db.add(db_notification)
+    db.flush()
+    _notifications_changed(db, user_id, 1)
+    changes.record(db, "notification", [(db_notification.id, user_id)])
     db.commit()
     db.refresh(db_notification)
     
+    # Push it to the user's open streams
+    pubsub.publish(pubsub.user_channel(user_id), serialize_notification_message(db_notification))
+    
+    return db_notification
+
+def create_aggregated_notification(
+    db: Session,
+    user_id: str,
+    notification_type: str,
+    reference_id: str,
+    sender_id: str,
+    message: Callable[[int], str],
+    window: timedelta = AGGREGATION_WINDOW
+) -> models.notification.Notification:
+    """
+    Notify a user of another user's action, folding it into their latest
+    notification with the same type and reference updated within `window`.
+    
+    An aggregated notification counts each actor once, names the latest as
+    its sender, moves to the top of the inbox and becomes unread again.
+    `message` gives the text for a number of actors.
+    """
+    Notification = models.notification.Notification
+    notification_actors = models.notification.notification_actors
+    now = datetime.now(timezone.utc)
+    
+    # Find the notification to fold into, if any
+    db_notification = db.query(Notification).filter(
+        Notification.user_id == user_id,
+        Notification.notification_type == notification_type,
+        Notification.reference_id == reference_id,
+        Notification.updated_at >= now - window
+    ).order_by(Notification.updated_at.desc()).first()
+    
+    if db_notification is None:
+        # Start a new notification with this actor
+        db_notification = Notification(
+            user_id=user_id,
+            sender_id=sender_id,
+            message=message(1),
+            notification_type=notification_type,
+            reference_id=reference_id,
+            read=False,
+            actor_count=1,
+            created_at=now,
+            updated_at=now
+        )
+        db.add(db_notification)
+        db.flush()
+        db.execute(insert(notification_actors), {"notification_id": db_notification.id, "user_id": sender_id})
+        _notifications_changed(db, user_id, 1)
+    else:
+        # An actor already counted changes nothing
+        added = db.execute(
+            insert_ignore(db, notification_actors),
+            {"notification_id": db_notification.id, "user_id": sender_id}
+        ).rowcount
+        if not added:
+            return db_notification
+        
+        # Fold the new actor in
+        db_notification.actor_count += 1
+        db_notification.sender_id = sender_id
+        db_notification.message = message(db_notification.actor_count)
+        db_notification.updated_at = now
+        _notifications_changed(db, user_id, 1 if db_notification.read else 0)
+        db_notification.read = False
+    
+    changes.record(db, "notification", [(db_notification.id, user_id)])
+    db.commit()
+    db.refresh(db_notification)
+    
+    # Push it to the user's open streams, replacing the earlier version by ID
+    pubsub.publish(pubsub.user_channel(user_id), serialize_notification_message(db_notification))
+    
     return db_notification
 
 def mark_notification_as_read(db: Session, notification_id: str, user_id: str) -> bool:
@@ -72,19 +247,29 @@ def mark_notification_as_read(db: Session, notification_id: str, user_id: str) -
     if notification.user_id != user_id:
         return False
     
-    # Mark as read
-    notification.read = True
-    db.commit()
+    # Mark as read, once
+    if not notification.read:
+        notification.read = True
+        _notifications_changed(db, user_id, -1)
+        changes.record(db, "notification", [(notification_id, user_id)])
+        db.commit()
     
     return True
 
 def mark_all_notifications_as_read(db: Session, user_id: str) -> int:
     """Mark all of a user's notifications as read."""
-    # Update all unread notifications for the user
+    # Log the unread notifications for sync, then mark them read
+    Notification = models.notification.Notification
+    changes.record(db, "notification", select(Notification.id, Notification.user_id).where(
+        Notification.user_id == user_id,
+        Notification.read == False
+    ))
     result = db.query(models.notification.Notification).filter(
         models.notification.Notification.user_id == user_id,
         models.notification.Notification.read == False
     ).update({"read": True})
+    if result:
+        _notifications_changed(db, user_id, -result)
     
     db.commit()
     
@@ -103,7 +288,12 @@ def delete_notification(db: Session, notification_id: str, user_id: str) -> bool
     if notification.user_id != user_id:
         return False
     
-    # Delete the notification
+    # Delete the notification, releasing the unread count and logging it for sync
+    _notifications_changed(db, user_id, 0 if notification.read else -1)
+    changes.record(db, "notification", [(notification_id, user_id)], deleted=True)
+    db.execute(delete(models.notification.notification_actors).where(
+        models.notification.notification_actors.c.notification_id == notification_id
+    ))
     db.delete(notification)
     db.commit()
     
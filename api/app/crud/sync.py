@@ -0,0 +1,72 @@
+from sqlalchemy.orm import Session
+from typing import Dict, List, NamedTuple, Optional, Set
+
+from .. import models
+from . import community as community_crud
+from . import event as event_crud
+from . import notification as notification_crud
+from ..utils import changes
+
+class Changes(NamedTuple):
+    """What changed for a user after a cursor: the current state of what changed and the IDs of what was deleted."""
+    cursor: int
+    reset: bool
+    has_more: bool
+    events: List[models.event.Event]
+    attendee_avatars: Dict[str, List[str]]
+    communities: List[models.community.Community]
+    joined_ids: Set[str]
+    memberships: List[str]
+    notifications: List[models.notification.Notification]
+    deleted: Dict[str, List[str]]
+
+def _in_log_order(found: list, ids: List[str], deleted: List[str]) -> list:
+    """`found` in the order of `ids`, adding the IDs of entities gone since to `deleted`."""
+    by_id = {entity.id: entity for entity in found}
+    ordered = []
+    for entity_id in ids:
+        if entity_id in by_id:
+            ordered.append(by_id[entity_id])
+        else:
+            deleted.append(entity_id)
+    return ordered
+
+def get_changes(db: Session, user_id: str, since: Optional[int], limit: int = 500) -> Changes:
+    """
+    Get what changed for a user after the `since` change ID, reading up to
+    `limit` log rows. Without `since`, only the cursor of the latest change,
+    to take before fetching the lists in full.
+    """
+    if since is None:
+        return Changes(changes.head(db), False, False, [], {}, [], set(), [], [], {kind: [] for kind in changes.KINDS})
+    
+    # Split the latest change to each entity into upserts and deletions
+    page = changes.read(db, user_id, since, limit)
+    upserted = {kind: [] for kind in changes.KINDS}
+    deleted = {kind: [] for kind in changes.KINDS}
+    for change in page.changes:
+        (deleted if change.deleted else upserted)[change.kind].append(change.entity_id)
+    
+    # Load the current state of what changed, in one query per kind
+    events = _in_log_order(event_crud.get_events_by_ids(db, upserted["event"]), upserted["event"], deleted["event"])
+    communities = _in_log_order(
+        community_crud.get_communities_by_ids(db, upserted["community"]), upserted["community"], deleted["community"]
+    )
+    notifications = _in_log_order(
+        notification_crud.get_notifications_by_ids(db, user_id, upserted["notification"]),
+        upserted["notification"],
+        deleted["notification"]
+    )
+    
+    return Changes(
+        cursor=page.cursor,
+        reset=page.reset,
+        has_more=page.has_more,
+        events=events,
+        attendee_avatars=event_crud.get_attendee_avatars(db, events),
+        communities=communities,
+        joined_ids=community_crud.get_joined_community_ids(db, user_id, [c.id for c in communities]),
+        memberships=upserted["membership"],
+        notifications=notifications,
+        deleted=deleted,
+    )
@@ -1,30 +1,91 @@
-from sqlalchemy.orm import Session
+from sqlalchemy import String, delete, insert, literal, select
+from sqlalchemy.orm import Session, selectinload
 from typing import List, Optional
+import uuid
 
 from .. import models, schemas
-from ..utils.security import get_password_hash
+from ..utils import changes, feed, images, response_cache, versions
+from ..utils.security import get_password_hash, invalidate_user
+from ..utils.sql import insert_ignore
+
+def _profile_query(db: Session):
+    """Base user query that eager-loads everything a profile response needs."""
+    return db.query(models.user.User).options(selectinload(models.user.User.interests))
 
 def get_user(db: Session, user_id: str) -> Optional[models.user.User]:
     """Get a user by ID."""
-    return db.query(models.user.User).filter(models.user.User.id == user_id).first()
+    return _profile_query(db).filter(models.user.User.id == user_id).first()
 
 def get_user_by_email(db: Session, email: str) -> Optional[models.user.User]:
     """Get a user by email."""
-    return db.query(models.user.User).filter(models.user.User.email == email).first()
+    return _profile_query(db).filter(models.user.User.email == email).first()
 
 def get_users(db: Session, skip: int = 0, limit: int = 100) -> List[models.user.User]:
     """Get multiple users with pagination."""
-    return db.query(models.user.User).offset(skip).limit(limit).all()
+    return _profile_query(db).offset(skip).limit(limit).all()
+
+def get_users_by_interest(db: Session, interest: str, skip: int = 0, limit: int = 100) -> List[models.user.User]:
+    """Get users interested in `interest`, matched case-insensitively."""
+    interested = (
+        select(models.user.user_interest.c.user_id)
+        .join(models.interest.Interest, models.interest.Interest.id == models.user.user_interest.c.interest_id)
+        .where(models.interest.Interest.key == models.interest.Interest.key_for(interest))
+    )
+    return (
+        _profile_query(db)
+        .filter(models.user.User.id.in_(interested))
+        .order_by(models.user.User.id)
+        .offset(skip)
+        .limit(limit)
+        .all()
+    )
 
-def create_user(db: Session, user: schemas.user.UserCreate) -> models.user.User:
-    """Create a new user."""
-    # Hash the password
-    hashed_password = get_password_hash(user.password)
+def set_user_interests(db: Session, user_id: str, interests: List[str]) -> None:
+    """
+    Replace a user's interests, creating any tags that don't exist yet.
     
-    # Convert interests list to comma-separated string if provided
-    interests_str = None
-    if user.interests:
-        interests_str = ",".join(user.interests)
+    Blank and repeated entries are dropped; the order is kept. Call before
+    committing.
+    """
+    user_interest = models.user.user_interest
+    interest_table = models.interest.Interest.__table__
+    names = list(dict.fromkeys(name for name in interests if name and name.strip()))
+    
+    # Drop the old links in bulk
+    db.execute(delete(user_interest).where(user_interest.c.user_id == user_id))
+    if not names:
+        return
+    
+    # Create missing tags, skipping those another user already created
+    db.execute(
+        insert_ignore(db, interest_table),
+        [{"id": str(uuid.uuid4()), "name": name, "key": models.interest.Interest.key_for(name)} for name in names]
+    )
+    interest_ids = dict(db.execute(select(interest_table.c.name, interest_table.c.id).where(interest_table.c.name.in_(names))).all())
+    
+    # Link them in the user's order
+    db.execute(
+        insert(user_interest),
+        [
+            {"user_id": user_id, "interest_id": interest_ids[name], "position": position}
+            for position, name in enumerate(names)
+        ]
+    )
+
+def create_user(
+    db: Session,
+    user: schemas.user.UserCreate,
+    hashed_password: Optional[str] = None
+) -> models.user.User:
+    """
+    Create a new user.
+    
+    Pass `hashed_password` when the password was already hashed, e.g. off
+    the event loop with `get_password_hash_async`.
+    """
+    # Hash the password unless the caller already did
+    if hashed_password is None:
+        hashed_password = get_password_hash(user.password)
     
     # Create the user
     db_user = models.user.User(
@@ -32,43 +93,62 @@ def create_user(db: Session, user: schemas.user.UserCreate) -> models.user.User:
         password=hashed_password,
         name=user.name,
         location=user.location,
-        interests=interests_str,
         notifications_enabled=user.notifications_enabled,
         location_sharing_enabled=user.location_sharing_enabled
     )
     
-    # Add to database
+    # Add to database, with the interest tags
     db.add(db_user)
+    db.flush()
+    if user.interests:
+        set_user_interests(db, db_user.id, user.interests)
     db.commit()
-    db.refresh(db_user)
     
-    return db_user
+    # Reload with the interests, so callers never lazy-load them
+    return get_user(db, db_user.id)
 
 def update_user(db: Session, user_id: str, user_data: schemas.user.UserUpdate) -> Optional[models.user.User]:
-    """Update a user's profile."""
+    """Update a user's profile. Raises ValueError for an inline avatar that isn't a valid image."""
     # Get the user
     db_user = get_user(db, user_id)
     if not db_user:
         return None
         
-    # Convert interests list to comma-separated string if provided
-    if user_data.interests is not None:
-        interests_str = ",".join(user_data.interests)
-        user_data_dict = user_data.dict(exclude={"interests"})
-        user_data_dict["interests"] = interests_str
-    else:
-        user_data_dict = user_data.dict(exclude_unset=True)
-    
-    # Update user attributes
+    # Update user attributes, moving an inline avatar to the blob store
+    user_data_dict = user_data.dict(exclude_unset=True, exclude={"interests"})
+    if "avatar" in user_data_dict:
+        user_data_dict["avatar"] = images.externalize(user_data_dict["avatar"])
     for key, value in user_data_dict.items():
         if value is not None:
             setattr(db_user, key, value)
     
+    # Replace the interest tags, and rescore the user's feed for them
+    if user_data.interests is not None:
+        set_user_interests(db, user_id, user_data.interests)
+        feed.user_changed(db, user_id)
+    
+    # Lists show users' names and avatars, as do the events and communities
+    # they organize, which are logged for sync
+    if user_data_dict.keys() & {"name", "avatar"}:
+        versions.bump(db, "users")
+        changes.record(db, "event", select(models.event.Event.id, literal(None, String)).where(
+            models.event.Event.organizer_id == user_id
+        ))
+        changes.record(db, "community", select(models.community.Community.id, literal(None, String)).where(
+            models.community.Community.creator_id == user_id
+        ))
+    
     # Commit changes
     db.commit()
-    db.refresh(db_user)
     
-    return db_user
+    # Drop the cached principal and profile, and the cached events the user
+    # organizes, so the next request sees the new profile
+    invalidate_user(user_id)
+    response_cache.invalidate("user", user_id)
+    
+    # Reload with the interests, so callers never lazy-load them
+    db.expire(db_user)
+    return get_user(db, user_id)
 
 def delete_user(db: Session, user_id: str) -> bool:
     """Delete a user."""
@@ -76,9 +156,43 @@ def delete_user(db: Session, user_id: str) -> bool:
     db_user = get_user(db, user_id)
     if not db_user:
         return False
+    
+    # Drop the user's interest links
+    db.execute(delete(models.user.user_interest).where(models.user.user_interest.c.user_id == user_id))
+    
+    # The events the user attended lose an attendee
+    attended_ids = list(db.scalars(
+        select(models.user.user_event.c.event_id).where(models.user.user_event.c.user_id == user_id)
+    ))
+    
+    # Log the events and communities losing an attendee or member for sync
+    changes.record(db, "event", [(event_id, None) for event_id in attended_ids])
+    changes.record(db, "community", select(models.user.user_community.c.community_id, literal(None, String)).where(
+        models.user.user_community.c.user_id == user_id
+    ))
+    
+    # Release the counters on everything the user attended, liked or joined
+    for association, model, counter, key in (
+        (models.user.user_event, models.event.Event, models.event.Event.attendee_count, "event_id"),
+        (models.user.user_liked_event, models.event.Event, models.event.Event.like_count, "event_id"),
+        (models.user.user_community, models.community.Community, models.community.Community.member_count, "community_id"),
+    ):
+        db.query(model).filter(
+            model.id.in_(select(association.c[key]).where(association.c.user_id == user_id))
+        ).update({counter: counter - 1}, synchronize_session=False)
+        db.execute(delete(association).where(association.c.user_id == user_id))
         
-    # Delete the user
+    # Delete the user and their feed; every list may have shown them
+    feed.remove_user(db, user_id)
     db.delete(db_user)
+    versions.bump(db, "events", "communities", "users")
     db.commit()
     
+    # Drop the cached principal so the user's tokens stop authenticating, and
+    # the cached responses that showed the user
+    invalidate_user(user_id)
+    response_cache.invalidate("user", user_id)
+    for event_id in attended_ids:
+        response_cache.invalidate("event", event_id)
+    
     return True 
\ No newline at end of file
@@ -1,19 +1,106 @@
-from sqlalchemy import create_engine
+import os
+from typing import Any, Callable, TypeVar
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm import Session, sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+from starlette.concurrency import run_in_threadpool
+
+from .utils.sql import check_dialect
 
-# SQLite database URL (for development)
+# Database URL, SQLite by default (for development)
 # For production, use PostgreSQL or another suitable database
-SQLALCHEMY_DATABASE_URL = "sqlite:///./sierra.db"
+SQLALCHEMY_DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./sierra.db")
+
+# Connection pool configuration (ignored for in-memory SQLite)
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() in ("1", "true", "yes")
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))  # Seconds, -1 disables
+
+# SQLite tuning applied to every new connection
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+SQLITE_MMAP_SIZE = int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024)))  # Bytes
+SQLITE_CACHE_SIZE = int(os.getenv("SQLITE_CACHE_SIZE", "-65536"))  # Negative means KiB (64 MiB)
+
+# Serve requests through the async engine (aiosqlite / asyncpg) instead of
+# running the synchronous engine in the threadpool
+DATABASE_ASYNC = os.getenv("DATABASE_ASYNC", "false").lower() in ("1", "true", "yes")
+
+# Async drivers for each supported backend
+ASYNC_DRIVERS = {
+    "sqlite": "sqlite+aiosqlite",
+    "postgresql": "postgresql+asyncpg",
+}
+
+def get_async_url(url: str) -> str:
+    """Swap the driver in a database URL for its async equivalent."""
+    scheme, rest = url.split("://", 1)
+    backend = scheme.split("+", 1)[0]
+    if backend not in ASYNC_DRIVERS:
+        raise ValueError(f"No async driver configured for {backend}")
+    return f"{ASYNC_DRIVERS[backend]}://{rest}"
+
+def _is_sqlite(url: str) -> bool:
+    return url.startswith("sqlite")
+
+def _engine_options(url: str, is_async: bool = False) -> dict:
+    """Pool and driver options for an engine on `url`."""
+    options = {
+        "pool_pre_ping": DB_POOL_PRE_PING,
+        "pool_recycle": DB_POOL_RECYCLE,
+    }
+    
+    # In-memory SQLite uses a single shared connection, not a sized pool
+    if not (_is_sqlite(url) and (url.endswith("://") or ":memory:" in url)):
+        options["pool_size"] = DB_POOL_SIZE
+        options["max_overflow"] = DB_MAX_OVERFLOW
+    
+    if _is_sqlite(url) and not is_async:
+        options["connect_args"] = {"check_same_thread": False}
+    elif _is_sqlite(url) and "pool_size" in options:
+        # aiosqlite defaults to opening a connection per checkout
+        options["poolclass"] = AsyncAdaptedQueuePool
+    
+    return options
+
+def _configure_sqlite_connection(dbapi_connection, connection_record):
+    """
+    Tune each SQLite connection for concurrent readers and writers.
+    
+    WAL lets readers proceed while a write is in progress, and the busy
+    timeout makes writers queue instead of failing with "database is locked".
+    """
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}")
+    cursor.execute(f"PRAGMA mmap_size={SQLITE_MMAP_SIZE}")
+    cursor.execute(f"PRAGMA cache_size={SQLITE_CACHE_SIZE}")
+    cursor.close()
 
 # Create a SQLAlchemy engine
-engine = create_engine(
-    SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False}
-)
+engine = create_engine(SQLALCHEMY_DATABASE_URL, **_engine_options(SQLALCHEMY_DATABASE_URL))
+check_dialect(engine.dialect.name)
+if _is_sqlite(SQLALCHEMY_DATABASE_URL):
+    event.listen(engine, "connect", _configure_sqlite_connection)
 
 # Create a SessionLocal class
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# The async engine is only built when enabled, so its driver stays optional
+async_engine = None
+AsyncSessionLocal = None
+if DATABASE_ASYNC:
+    ASYNC_DATABASE_URL = get_async_url(SQLALCHEMY_DATABASE_URL)
+    async_engine = create_async_engine(ASYNC_DATABASE_URL, **_engine_options(ASYNC_DATABASE_URL, is_async=True))
+    if _is_sqlite(ASYNC_DATABASE_URL):
+        event.listen(async_engine.sync_engine, "connect", _configure_sqlite_connection)
+    # Objects stay usable after commit; reloading them would need an await
+    AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
 # Create the Base class for models
 Base = declarative_base()
 
@@ -23,4 +110,35 @@ def get_db():
     try:
         yield db
     finally:
-        db.close() 
\ No newline at end of file
+        db.close()
+
+T = TypeVar("T")
+
+class ThreadedSession:
+    """
+    Gives a synchronous Session the `run_sync` interface of AsyncSession.
+
+    Used by `get_async_db` when the async engine is disabled, so the async
+    CRUD layer still keeps blocking database work off the event loop.
+    """
+
+    def __init__(self, session: Session):
+        self.sync_session = session
+
+    async def run_sync(self, fn: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+        return await run_in_threadpool(fn, self.sync_session, *args, **kwargs)
+
+    async def close(self) -> None:
+        await run_in_threadpool(self.sync_session.close)
+
+# Dependency to get an async DB session (see `app.crud.aio`)
+async def get_async_db():
+    if DATABASE_ASYNC:
+        async with AsyncSessionLocal() as session:
+            yield session
+    else:
+        db = SessionLocal()
+        try:
+            yield ThreadedSession(db)
+        finally:
+            db.close()
@@ -1,13 +1,19 @@
+import asyncio
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from .routes import auth, users, events, communities, notifications
+from .database import async_engine
+from .routes import auth, users, events, communities, notifications, images, sync
+from .utils import changes, metrics, retention
 from .utils.init_db import init_db
+from .utils.pagination import NEXT_CURSOR_HEADER
+from .utils.responses import FastJSONResponse
 
 # Create the FastAPI application
 app = FastAPI(
     title="Sierra API",
     description="Backend API for Sierra - A Community and Event Management Platform",
-    version="1.0.0"
+    version="1.0.0",
+    default_response_class=FastJSONResponse
 )
 
 # Configure CORS
@@ -17,6 +23,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=[NEXT_CURSOR_HEADER, "ETag"],
 )
 
 # Include routers with /api prefix to match frontend
@@ -25,10 +32,46 @@ app.include_router(users.router, prefix="/api/users", tags=["Users"])
 app.include_router(events.router, prefix="/api/events", tags=["Events"])
 app.include_router(communities.router, prefix="/api/communities", tags=["Communities"])
 app.include_router(notifications.router, prefix="/api/notifications", tags=["Notifications"])
+app.include_router(images.router, prefix="/api/images", tags=["Images"])
+app.include_router(sync.router, prefix="/api/sync", tags=["Sync"])
 
 # Initialize database tables
 init_db()
 
+@app.on_event("startup")
+async def start_notification_purge():
+    # Delete expired notifications in the background
+    if retention.PURGE_INTERVAL_SECONDS > 0:
+        app.state.notification_purge = asyncio.create_task(retention.purge_periodically())
+
+@app.on_event("shutdown")
+async def stop_notification_purge():
+    purge = getattr(app.state, "notification_purge", None)
+    if purge is not None:
+        purge.cancel()
+
+@app.on_event("startup")
+async def start_change_log_compaction():
+    # Compact the sync change log in the background
+    if changes.COMPACT_INTERVAL_SECONDS > 0:
+        app.state.change_log_compaction = asyncio.create_task(changes.compact_periodically())
+
+@app.on_event("shutdown")
+async def stop_change_log_compaction():
+    compaction = getattr(app.state, "change_log_compaction", None)
+    if compaction is not None:
+        compaction.cancel()
+
+@app.on_event("shutdown")
+async def dispose_async_engine():
+    # Pooled async connections hold driver threads open until disposed
+    if async_engine is not None:
+        await async_engine.dispose()
+
 @app.get("/")
 async def root():
-    return {"message": "Welcome to Sierra API - Connect with community events"}
\ No newline at end of file
+    return {"message": "Welcome to Sierra API - Connect with community events"}
+
+@app.get("/metrics", include_in_schema=False)
+async def get_metrics():
+    return metrics.snapshot()
\ No newline at end of file
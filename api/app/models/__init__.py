@@ -2,4 +2,8 @@
 from . import user
 from . import event
 from . import community
-from . import notification 
\ No newline at end of file
+from . import notification 
+from . import feed
+from . import interest
+from . import version
+from . import change
@@ -0,0 +1,38 @@
+from sqlalchemy import Boolean, Column, Index, Integer, String
+from sqlalchemy.sql.sqltypes import TIMESTAMP
+from sqlalchemy.sql import func
+from sqlalchemy.sql.expression import text
+from datetime import datetime, timezone
+
+from ..database import Base
+
+class Change(Base):
+    """
+    Append-only log of writes to what clients sync, one row per changed
+    entity per write, in commit order by ID (see app.utils.changes).
+    """
+    
+    __tablename__ = "change_log"
+    __table_args__ = (
+        # Reading the changes after a cursor: shared ones (no user) and a user's own
+        Index("ix_change_log_user_id_id", "user_id", "id"),
+        # Finding the rows a later change to the same entity supersedes
+        Index("ix_change_log_kind_entity_user_id", "kind", "entity_id", "user_id", "id"),
+        # Never reuse the IDs of compacted rows, which cursors point past
+        {"sqlite_autoincrement": True},
+    )
+    
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    # "event", "community", "membership" (a community joined) or "notification"
+    kind = Column(String, nullable=False)
+    entity_id = Column(String, nullable=False)
+    # The user a change is private to: the member or the recipient; None for shared entities
+    user_id = Column(String, nullable=True)
+    # Whether the entity was deleted (or the membership ended), rather than created or updated
+    deleted = Column(Boolean, nullable=False, default=False, server_default=text("false"))
+    created_at = Column(
+        TIMESTAMP(timezone=True),
+        nullable=False,
+        default=lambda: datetime.now(timezone.utc),
+        server_default=func.now()
+    )
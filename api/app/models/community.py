@@ -1,7 +1,9 @@
-from sqlalchemy import Column, String, Integer, ForeignKey
+from sqlalchemy import Column, String, Integer, Float, ForeignKey, Index
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql.sqltypes import TIMESTAMP
+from sqlalchemy.sql import func
 from sqlalchemy.sql.expression import text
+from datetime import datetime, timezone
 import uuid
 
 from ..database import Base
@@ -11,6 +13,16 @@ class Community(Base):
     """Community model representing user communities."""
     
     __tablename__ = "communities"
+    __table_args__ = (
+        # Keyset pagination over the communities list (created_at, then ID as tiebreaker)
+        Index("ix_communities_created_at_id", "created_at", "id"),
+        # Category-filtered communities list, in list order
+        Index("ix_communities_category_created_at_id", "category", "created_at", "id"),
+        # Communities created by a user
+        Index("ix_communities_creator_id", "creator_id"),
+        # Proximity queries on databases without a native spatial index
+        Index("ix_communities_geohash", "geohash"),
+    )
     
     id = Column(String, primary_key=True, default=lambda: str(uuid.uuid4()))
     name = Column(String, nullable=False)
@@ -18,10 +30,24 @@ class Community(Base):
     image = Column(String, nullable=True)
     category = Column(String, nullable=False)
     location = Column(String, nullable=True)
+    # Coordinates of the location, and their geohash (see app.utils.geo)
+    latitude = Column(Float, nullable=True)
+    longitude = Column(Float, nullable=True)
+    geohash = Column(String, nullable=True)
     guidelines = Column(String, nullable=True)
     creator_id = Column(String, ForeignKey("users.id"), nullable=False)
-    created_at = Column(TIMESTAMP(timezone=True), nullable=False, server_default=text("now()"))
-    updated_at = Column(TIMESTAMP(timezone=True), nullable=False, server_default=text("now()"))
+    
+    # Denormalized counter, maintained by the join/leave CRUD operations
+    member_count = Column(Integer, nullable=False, default=0, server_default=text("0"))
+    
+    # Set client-side so the stored precision matches the values cursors compare against
+    created_at = Column(
+        TIMESTAMP(timezone=True),
+        nullable=False,
+        default=lambda: datetime.now(timezone.utc),
+        server_default=func.now()
+    )
+    updated_at = Column(TIMESTAMP(timezone=True), nullable=False, server_default=func.now())
     
     # Relationships
     # Community creator
@@ -1,6 +1,7 @@
-from sqlalchemy import Column, String, Integer, Float, ForeignKey, DateTime
+from sqlalchemy import Column, String, Integer, Float, ForeignKey, DateTime, Index
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql.sqltypes import TIMESTAMP
+from sqlalchemy.sql import func
 from sqlalchemy.sql.expression import text
 import uuid
 
@@ -11,6 +12,19 @@ class Event(Base):
     """Event model representing community events."""
     
     __tablename__ = "events"
+    __table_args__ = (
+        # Keyset pagination and date-range filters over the events list
+        # (start time, then ID as tiebreaker)
+        Index("ix_events_starts_at_id", "starts_at", "id"),
+        # Category-filtered events list, in list order
+        Index("ix_events_category_starts_at_id", "category", "starts_at", "id"),
+        # Events created by a user
+        Index("ix_events_organizer_id", "organizer_id"),
+        # Events belonging to a community
+        Index("ix_events_community_id", "community_id"),
+        # Proximity queries on databases without a native spatial index
+        Index("ix_events_geohash", "geohash"),
+    )
     
     id = Column(String, primary_key=True, default=lambda: str(uuid.uuid4()))
     title = Column(String, nullable=False)
@@ -18,12 +32,23 @@ class Event(Base):
     image = Column(String, nullable=True)
     date = Column(String, nullable=False)  # ISO format date
     time = Column(String, nullable=False)  # ISO format time
+    # Typed start time parsed from `date` and `time` (UTC), for ordering and range queries
+    starts_at = Column(TIMESTAMP(timezone=True), nullable=True)
     location = Column(String, nullable=False)
+    # Coordinates of the location, and their geohash (see app.utils.geo)
+    latitude = Column(Float, nullable=True)
+    longitude = Column(Float, nullable=True)
+    geohash = Column(String, nullable=True)
     category = Column(String, nullable=False)
     price = Column(Float, default=0.0)
     organizer_id = Column(String, ForeignKey("users.id"), nullable=False)
-    created_at = Column(TIMESTAMP(timezone=True), nullable=False, server_default=text("now()"))
-    updated_at = Column(TIMESTAMP(timezone=True), nullable=False, server_default=text("now()"))
+    
+    # Denormalized counters, maintained by the attend/like CRUD operations
+    attendee_count = Column(Integer, nullable=False, default=0, server_default=text("0"))
+    like_count = Column(Integer, nullable=False, default=0, server_default=text("0"))
+    
+    created_at = Column(TIMESTAMP(timezone=True), nullable=False, server_default=func.now())
+    updated_at = Column(TIMESTAMP(timezone=True), nullable=False, server_default=func.now())
     
     # Relationships
     # Event organizer (creator)
@@ -0,0 +1,18 @@
+from sqlalchemy import Column, String, Float, ForeignKey, Index
+
+from ..database import Base
+
+class FeedItem(Base):
+    """A precomputed candidate in a user's home feed (see app.utils.feed)."""
+
+    __tablename__ = "feed_items"
+    __table_args__ = (
+        # Reading a user's feed, best first (score, then event ID as tiebreaker)
+        Index("ix_feed_items_user_score_event_id", "user_id", "score", "event_id"),
+        # Rescoring or dropping an event across feeds
+        Index("ix_feed_items_event_id", "event_id"),
+    )
+
+    user_id = Column(String, ForeignKey("users.id"), primary_key=True)
+    event_id = Column(String, ForeignKey("events.id"), primary_key=True)
+    score = Column(Float, nullable=False)
@@ -0,0 +1,33 @@
+from sqlalchemy import Column, String, Index
+from sqlalchemy.orm import relationship
+import uuid
+
+from ..database import Base
+from .user import user_interest
+
+class Interest(Base):
+    """Interest tag model, shared by every user who lists the interest."""
+
+    __tablename__ = "interests"
+    __table_args__ = (
+        # Case-insensitive lookups, e.g. matching an event category
+        Index("ix_interests_key", "key"),
+    )
+
+    id = Column(String, primary_key=True, default=lambda: str(uuid.uuid4()))
+    # The interest as users wrote it, and its normalized form (see `key_for`)
+    name = Column(String, unique=True, nullable=False)
+    key = Column(String, nullable=False)
+
+    # Relationships
+    # Users interested in this tag
+    users = relationship(
+        "User",
+        secondary=user_interest,
+        back_populates="interests"
+    )
+
+    @staticmethod
+    def key_for(name: str) -> str:
+        """Normalize an interest or category name for matching."""
+        return name.strip().lower()
@@ -1,15 +1,40 @@
-from sqlalchemy import Column, String, Integer, Boolean, ForeignKey
+from sqlalchemy import Column, String, Integer, Boolean, ForeignKey, Index, Table
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql.sqltypes import TIMESTAMP
+from sqlalchemy.sql import func
 from sqlalchemy.sql.expression import text
+from datetime import datetime, timezone
 import uuid
 
 from ..database import Base
 
+# Users whose actions were folded into an aggregated notification, so each
+# is counted once (see `crud.notification.create_aggregated_notification`)
+notification_actors = Table(
+    "notification_actors",
+    Base.metadata,
+    Column("notification_id", String, ForeignKey("notifications.id"), primary_key=True),
+    Column("user_id", String, ForeignKey("users.id"), primary_key=True),
+)
+
 class Notification(Base):
     """Notification model representing user notifications."""
     
     __tablename__ = "notifications"
+    __table_args__ = (
+        # Keyset pagination over a user's notifications (updated_at, then ID
+        # as tiebreaker), and resuming a live stream
+        Index("ix_notifications_user_updated_at_id", "user_id", "updated_at", "id"),
+        # Unread-only listing and mark-all-as-read
+        Index("ix_notifications_user_read_updated_at_id", "user_id", "read", "updated_at", "id"),
+        # Finding expired notifications of each type (see app.utils.retention)
+        Index("ix_notifications_type_updated_at", "notification_type", "updated_at"),
+        # Finding the recent notification a new one aggregates into
+        Index(
+            "ix_notifications_user_type_reference_updated_at",
+            "user_id", "notification_type", "reference_id", "updated_at"
+        ),
+    )
     
     id = Column(String, primary_key=True, default=lambda: str(uuid.uuid4()))
     user_id = Column(String, ForeignKey("users.id"), nullable=False)
@@ -18,7 +43,24 @@ class Notification(Base):
     notification_type = Column(String, nullable=False)  # e.g., "event", "community", "system"
     reference_id = Column(String, nullable=True)  # ID of related entity (event, community, etc.)
     read = Column(Boolean, default=False)
-    created_at = Column(TIMESTAMP(timezone=True), nullable=False, server_default=text("now()"))
+    # Users folded into this notification; the sender is the latest of them
+    actor_count = Column(Integer, nullable=False, default=1, server_default=text("1"))
+    # Set client-side so the stored precision matches the values cursors compare against
+    created_at = Column(
+        TIMESTAMP(timezone=True),
+        nullable=False,
+        default=lambda: datetime.now(timezone.utc),
+        server_default=func.now()
+    )
+    # When the notification was created or an action last folded into it.
+    # The inbox is ordered by it, retention and folding count from it, and
+    # live streams resume from it. Nullable only so the column can be added
+    # to an existing table, which then backfills it
+    updated_at = Column(
+        TIMESTAMP(timezone=True),
+        nullable=True,
+        default=lambda: datetime.now(timezone.utc)
+    )
     
     # Relationships
     # User receiving the notification
@@ -1,6 +1,7 @@
-from sqlalchemy import Boolean, Column, String, Integer, Table, ForeignKey
+from sqlalchemy import Boolean, Column, String, Integer, Table, ForeignKey, Index
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql.sqltypes import TIMESTAMP
+from sqlalchemy.sql import func
 from sqlalchemy.sql.expression import text
 import uuid
 
@@ -12,6 +13,8 @@ user_community = Table(
     Base.metadata,
     Column("user_id", String, ForeignKey("users.id"), primary_key=True),
     Column("community_id", String, ForeignKey("communities.id"), primary_key=True),
+    # The primary key serves lookups by user; this serves lookups by community
+    Index("ix_user_community_community_id_user_id", "community_id", "user_id"),
 )
 
 # Association table for event attendance (many-to-many)
@@ -20,6 +23,8 @@ user_event = Table(
     Base.metadata,
     Column("user_id", String, ForeignKey("users.id"), primary_key=True),
     Column("event_id", String, ForeignKey("events.id"), primary_key=True),
+    # The primary key serves lookups by user; this serves lookups by event
+    Index("ix_user_event_event_id_user_id", "event_id", "user_id"),
 )
 
 # Association table for event likes (many-to-many)
@@ -28,6 +33,19 @@ user_liked_event = Table(
     Base.metadata,
     Column("user_id", String, ForeignKey("users.id"), primary_key=True),
     Column("event_id", String, ForeignKey("events.id"), primary_key=True),
+    # The primary key serves lookups by user; this serves lookups by event
+    Index("ix_user_liked_event_event_id_user_id", "event_id", "user_id"),
+)
+
+# Association table for user interests (many-to-many), in the order the user listed them
+user_interest = Table(
+    "user_interest",
+    Base.metadata,
+    Column("user_id", String, ForeignKey("users.id"), primary_key=True),
+    Column("interest_id", String, ForeignKey("interests.id"), primary_key=True),
+    Column("position", Integer, nullable=False, default=0),
+    # The primary key serves lookups by user; this serves lookups by interest
+    Index("ix_user_interest_interest_id_user_id", "interest_id", "user_id"),
 )
 
 class User(Base):
@@ -42,16 +60,38 @@ class User(Base):
     avatar = Column(String, nullable=True)
     bio = Column(String, nullable=True)
     location = Column(String, nullable=True)
-    interests = Column(String, nullable=True)  # Comma-separated list of interests
     notifications_enabled = Column(Boolean, default=True)
     location_sharing_enabled = Column(Boolean, default=True)
-    created_at = Column(TIMESTAMP(timezone=True), nullable=False, server_default=text("now()"))
-    updated_at = Column(TIMESTAMP(timezone=True), nullable=False, server_default=text("now()"))
+    
+    # Denormalized counters, maintained by the attend/join and notification CRUD operations
+    attending_count = Column(Integer, nullable=False, default=0, server_default=text("0"))
+    community_count = Column(Integer, nullable=False, default=0, server_default=text("0"))
+    unread_notification_count = Column(Integer, nullable=False, default=0, server_default=text("0"))
+    
+    # Change counters of the user's own lists, bumped with each write to them
+    # (see app.utils.versions): notifications, and the events and communities
+    # the user attends, likes or joined
+    notifications_version = Column(Integer, nullable=False, default=0, server_default=text("0"))
+    activity_version = Column(Integer, nullable=False, default=0, server_default=text("0"))
+    
+    # When the user's home feed was last computed (see app.utils.feed)
+    feed_refreshed_at = Column(TIMESTAMP(timezone=True), nullable=True)
+    
+    created_at = Column(TIMESTAMP(timezone=True), nullable=False, server_default=func.now())
+    updated_at = Column(TIMESTAMP(timezone=True), nullable=False, server_default=func.now())
     
     # Relationships
     # Events created by the user
     created_events = relationship("Event", back_populates="organizer")
     
+    # Interest tags, in the order the user listed them
+    interests = relationship(
+        "Interest",
+        secondary=user_interest,
+        order_by=user_interest.c.position,
+        back_populates="users"
+    )
+    
     # Communities the user is a member of
     communities = relationship(
         "Community",
@@ -74,4 +114,4 @@ class User(Base):
     )
     
     # Notifications received by the user
-    notifications = relationship("Notification", back_populates="user")
\ No newline at end of file
+    notifications = relationship("Notification", foreign_keys="Notification.user_id", back_populates="user")
\ No newline at end of file
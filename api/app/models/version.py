@@ -0,0 +1,16 @@
+from sqlalchemy import Column, Integer, String
+from sqlalchemy.sql.expression import text
+
+from ..database import Base
+
+class CollectionVersion(Base):
+    """
+    Change counter of a collection shared by every user, such as "events",
+    bumped in the same transaction as each write to it (see app.utils.versions).
+    Also holds the sync change log's horizon (see app.utils.changes).
+    """
+
+    __tablename__ = "collection_versions"
+
+    name = Column(String, primary_key=True)
+    version = Column(Integer, nullable=False, default=0, server_default=text("0"))
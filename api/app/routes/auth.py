@@ -1,46 +1,57 @@
 from fastapi import APIRouter, Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordRequestForm
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import Dict, Any
 
-from .. import models, schemas
-from ..database import get_db
-from ..utils.security import verify_password, create_access_token, get_password_hash
-from ..crud import user as user_crud
+from .. import schemas
+from ..database import get_async_db
+from ..serializers import serialize_user
+from ..utils.security import verify_password_async, create_access_token, get_password_hash_async
+from ..utils.responses import FastJSONResponse
+from ..crud.aio import user as user_crud
 
 router = APIRouter()
 
 @router.post("/register", response_model=schemas.user.User, status_code=status.HTTP_201_CREATED)
-async def register(user_data: schemas.user.UserCreate, db: Session = Depends(get_db)):
+async def register(user_data: schemas.user.UserCreate, db: AsyncSession = Depends(get_async_db)):
     """
     Register a new user.
     """
     # Check if user with this email already exists
-    db_user = user_crud.get_user_by_email(db, email=user_data.email)
+    db_user = await user_crud.get_user_by_email(db, email=user_data.email)
     if db_user:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="User with this email already exists"
         )
     
-    # Create the user
-    return user_crud.create_user(db=db, user=user_data)
+    # Hash the password off the event loop, handing the connection back to
+    # the pool while it queues, then create the user
+    await db.close()
+    hashed_password = await get_password_hash_async(user_data.password)
+    user = await user_crud.create_user(db=db, user=user_data, hashed_password=hashed_password)
+    
+    return FastJSONResponse(serialize_user(user), status_code=status.HTTP_201_CREATED)
 
 @router.post("/login", response_model=schemas.token.Token)
-async def login(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
+async def login(form_data: OAuth2PasswordRequestForm = Depends(), db: AsyncSession = Depends(get_async_db)):
     """
     OAuth2 compatible token login, get an access token for future requests.
     """
     # Authenticate user
-    user = user_crud.get_user_by_email(db, email=form_data.username)
+    user = await user_crud.get_user_by_email(db, email=form_data.username)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect email or password",
             headers={"WWW-Authenticate": "Bearer"},
         )
-        
-    if not verify_password(form_data.password, user.password):
+    
+    # Hand the connection back to the pool while the password is checked,
+    # which can queue behind other logins for seconds
+    await db.close()
+    
+    if not await verify_password_async(form_data.password, user.password):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect email or password",
@@ -53,19 +64,23 @@ async def login(form_data: OAuth2PasswordRequestForm = Depends(), db: Session =
     return {"access_token": access_token, "token_type": "bearer"}
 
 @router.post("/login/json", response_model=schemas.token.Token)
-async def login_json(login_data: schemas.auth.Login, db: Session = Depends(get_db)):
+async def login_json(login_data: schemas.auth.Login, db: AsyncSession = Depends(get_async_db)):
     """
     JSON login endpoint, alternative to the OAuth2 form-based login.
     """
     # Authenticate user
-    user = user_crud.get_user_by_email(db, email=login_data.email)
+    user = await user_crud.get_user_by_email(db, email=login_data.email)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect email or password",
         )
-        
-    if not verify_password(login_data.password, user.password):
+    
+    # Hand the connection back to the pool while the password is checked,
+    # which can queue behind other logins for seconds
+    await db.close()
+    
+    if not await verify_password_async(login_data.password, user.password):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect email or password",
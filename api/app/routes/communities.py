@@ -1,191 +1,223 @@
-from fastapi import APIRouter, Depends, HTTPException, Query, status
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Request, Response, status
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import List, Optional
 
-from .. import models, schemas
-from ..database import get_db
-from ..utils.security import get_current_user
-from ..crud import community as community_crud
+from .. import schemas
+from ..database import get_async_db
+from ..serializers import serialize_communities, serialize_community
+from ..utils import geo, versions
+from ..utils.security import Principal, get_current_principal
+from ..utils.pagination import NEXT_CURSOR_HEADER, encode_cursor, next_cursor
+from ..utils.responses import FastJSONResponse, etag_matches
+from ..crud.aio import community as community_crud
 
 router = APIRouter()
 
 @router.get("/", response_model=List[schemas.community.Community])
 async def get_communities(
+    request: Request,
     skip: int = 0,
     limit: int = 100,
     category: Optional[str] = None,
     membership_filter: Optional[str] = None,
-    db: Session = Depends(get_db),
-    current_user: models.user.User = Depends(get_current_user)
+    near: Optional[str] = None,
+    radius_km: float = Query(10, gt=0, le=500),
+    cursor: Optional[str] = None,
+    if_none_match: Optional[str] = Header(None),
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Principal = Depends(get_current_principal)
 ):
     """
     Get all communities with optional filtering.
+    
+    `near` ("lat,lng") limits the list to communities within `radius_km` of
+    that point, nearest first, and fills in each community's `distance_km`.
+    
+    Pass the `X-Next-Cursor` response header back as `cursor` to fetch the next page.
+    Send the `ETag` back as `If-None-Match` to get an empty 304 while the page is unchanged.
     """
-    # Get communities from database
-    communities = community_crud.get_communities(
-        db=db,
-        skip=skip,
-        limit=limit,
-        category=category,
-        membership_filter=membership_filter,
-        user_id=current_user.id
-    )
+    # Answer from the list's version, without running the query, while nothing changed
+    version = await community_crud.get_communities_version(db, current_user.id)
+    etag = versions.list_etag(version, current_user.id, request.url.query)
+    headers = {"ETag": etag, "Cache-Control": versions.LIST_CACHE_CONTROL}
+    if etag_matches(if_none_match, etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    
+    filters = dict(category=category, membership_filter=membership_filter, user_id=current_user.id)
     
-    # Format response
-    community_responses = []
-    for community in communities:
-        # Check if user has joined this community
-        joined = current_user in community.members
-        
-        # Format community for response
-        community_response = schemas.community.Community(
-            id=community.id,
-            name=community.name,
-            description=community.description,
-            category=community.category,
-            location=community.location,
-            image=community.image,
-            guidelines=community.guidelines,
-            members=len(community.members),
-            joined=joined,
-            creator=schemas.user.UserInfo(
-                id=community.creator.id,
-                name=community.creator.name,
-                avatar=community.creator.avatar
-            ),
-            created_at=community.created_at
+    # Parse the point to search around, if any
+    point = None
+    if near is not None:
+        try:
+            point = geo.parse_point(near)
+        except ValueError:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Invalid near point"
+            )
+    
+    # Get communities from database
+    try:
+        if point:
+            matches = await community_crud.get_communities_near(
+                db, *point, radius_km, skip=skip, limit=limit, cursor=cursor, **filters
+            )
+            communities = [community for community, _ in matches]
+        else:
+            communities = await community_crud.get_communities(db=db, skip=skip, limit=limit, cursor=cursor, **filters)
+    except ValueError:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid cursor"
         )
-        
-        community_responses.append(community_response)
     
-    return community_responses
+    # Expose the cursor for the next page, if any
+    if point:
+        distances = {community.id: geo.distance_km(key) for community, key in matches}
+        page_cursor = encode_cursor(matches[-1][1], matches[-1][0].id) if len(matches) == limit else None
+    else:
+        distances = None
+        page_cursor = next_cursor(communities, "created_at", limit)
+    if page_cursor:
+        headers[NEXT_CURSOR_HEADER] = page_cursor
+    
+    # Look up the user's memberships for the whole page at once
+    joined_ids = await community_crud.get_joined_community_ids(db, current_user.id, [c.id for c in communities])
+    
+    return FastJSONResponse(serialize_communities(communities, joined_ids, distances), headers=headers)
 
 @router.post("/", response_model=schemas.community.Community, status_code=status.HTTP_201_CREATED)
 async def create_community(
     community_data: schemas.community.CommunityCreate,
-    db: Session = Depends(get_db),
-    current_user: models.user.User = Depends(get_current_user)
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Principal = Depends(get_current_principal)
 ):
     """
     Create a new community.
     """
     # Create community
-    community = community_crud.create_community(db=db, community=community_data, user_id=current_user.id)
-    
-    # Format response
-    community_response = schemas.community.Community(
-        id=community.id,
-        name=community.name,
-        description=community.description,
-        category=community.category,
-        location=community.location,
-        image=community.image,
-        guidelines=community.guidelines,
-        members=len(community.members),
-        joined=True,  # Creator is automatically a member
-        creator=schemas.user.UserInfo(
-            id=community.creator.id,
-            name=community.creator.name,
-            avatar=community.creator.avatar
-        ),
-        created_at=community.created_at
-    )
+    try:
+        community = await community_crud.create_community(db=db, community=community_data, user_id=current_user.id)
+    except ValueError as error:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(error)
+        )
     
-    return community_response
+    # Creator is automatically a member
+    return FastJSONResponse(serialize_community(community, True), status_code=status.HTTP_201_CREATED)
 
 @router.get("/user/{user_id}", response_model=List[schemas.community.Community])
 async def get_user_communities(
+    request: Request,
     user_id: str,
     skip: int = 0,
     limit: int = 100,
-    db: Session = Depends(get_db),
-    current_user: models.user.User = Depends(get_current_user)
+    if_none_match: Optional[str] = Header(None),
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Principal = Depends(get_current_principal)
 ):
     """
     Get communities created by a specific user.
+    
+    Send the `ETag` back as `If-None-Match` to get an empty 304 while the page is unchanged.
     """
+    # Answer from the list's version, without running the query, while nothing changed
+    version = await community_crud.get_communities_version(db, current_user.id)
+    etag = versions.list_etag(version, current_user.id, user_id, request.url.query)
+    headers = {"ETag": etag, "Cache-Control": versions.LIST_CACHE_CONTROL}
+    if etag_matches(if_none_match, etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    
     # Get communities from database
-    communities = community_crud.get_communities_by_user(db=db, user_id=user_id, skip=skip, limit=limit)
-    
-    # Format response
-    community_responses = []
-    for community in communities:
-        # Check if current user has joined this community
-        joined = current_user in community.members
-        
-        # Format community for response
-        community_response = schemas.community.Community(
-            id=community.id,
-            name=community.name,
-            description=community.description,
-            category=community.category,
-            location=community.location,
-            image=community.image,
-            guidelines=community.guidelines,
-            members=len(community.members),
-            joined=joined,
-            creator=schemas.user.UserInfo(
-                id=community.creator.id,
-                name=community.creator.name,
-                avatar=community.creator.avatar
-            ),
-            created_at=community.created_at
-        )
-        
-        community_responses.append(community_response)
+    communities = await community_crud.get_communities_by_user(db=db, user_id=user_id, skip=skip, limit=limit)
+    
+    # Look up the current user's memberships for the whole page at once
+    joined_ids = await community_crud.get_joined_community_ids(db, current_user.id, [c.id for c in communities])
     
-    return community_responses
+    return FastJSONResponse(serialize_communities(communities, joined_ids), headers=headers)
 
 @router.get("/joined", response_model=List[schemas.community.Community])
 async def get_joined_communities(
+    request: Request,
     skip: int = 0,
     limit: int = 100,
-    db: Session = Depends(get_db),
-    current_user: models.user.User = Depends(get_current_user)
+    if_none_match: Optional[str] = Header(None),
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Principal = Depends(get_current_principal)
 ):
     """
     Get communities that the current user is a member of.
+    
+    Send the `ETag` back as `If-None-Match` to get an empty 304 while the page is unchanged.
     """
+    # Answer from the list's version, without running the query, while nothing changed
+    version = await community_crud.get_communities_version(db, current_user.id)
+    etag = versions.list_etag(version, current_user.id, request.url.query)
+    headers = {"ETag": etag, "Cache-Control": versions.LIST_CACHE_CONTROL}
+    if etag_matches(if_none_match, etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    
     # Get communities from database
-    communities = community_crud.get_joined_communities(db=db, user_id=current_user.id, skip=skip, limit=limit)
-    
-    # Format response
-    community_responses = []
-    for community in communities:
-        # Format community for response
-        community_response = schemas.community.Community(
-            id=community.id,
-            name=community.name,
-            description=community.description,
-            category=community.category,
-            location=community.location,
-            image=community.image,
-            guidelines=community.guidelines,
-            members=len(community.members),
-            joined=True,  # User is definitely a member
-            creator=schemas.user.UserInfo(
-                id=community.creator.id,
-                name=community.creator.name,
-                avatar=community.creator.avatar
-            ),
-            created_at=community.created_at
+    communities = await community_crud.get_joined_communities(db=db, user_id=current_user.id, skip=skip, limit=limit)
+    
+    # User is definitely a member of every community here
+    return FastJSONResponse(serialize_communities(communities, {c.id for c in communities}), headers=headers)
+
+@router.get("/search", response_model=List[schemas.community.Community])
+async def search_communities(
+    request: Request,
+    q: str = Query(..., min_length=1),
+    limit: int = Query(20, ge=1, le=100),
+    cursor: Optional[str] = None,
+    if_none_match: Optional[str] = Header(None),
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Principal = Depends(get_current_principal)
+):
+    """
+    Search communities by name and description, best match first.
+    
+    Pass the `X-Next-Cursor` response header back as `cursor` to fetch the next page,
+    and the `ETag` back as `If-None-Match` to get an empty 304 while the page is unchanged.
+    """
+    # Answer from the list's version, without searching, while nothing changed
+    version = await community_crud.get_communities_version(db, current_user.id)
+    etag = versions.list_etag(version, current_user.id, request.url.query)
+    headers = {"ETag": etag, "Cache-Control": versions.LIST_CACHE_CONTROL}
+    if etag_matches(if_none_match, etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    
+    # Search the index
+    try:
+        matches = await community_crud.search_communities(db=db, query=q, limit=limit, cursor=cursor)
+    except ValueError:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid cursor"
         )
-        
-        community_responses.append(community_response)
+    communities = [community for community, _ in matches]
     
-    return community_responses
+    # Expose the cursor for the next page, if any
+    if len(matches) == limit:
+        last_community, last_rank = matches[-1]
+        headers[NEXT_CURSOR_HEADER] = encode_cursor(last_rank, last_community.id)
+    
+    # Look up the user's memberships for the whole page at once
+    joined_ids = await community_crud.get_joined_community_ids(db, current_user.id, [c.id for c in communities])
+    
+    return FastJSONResponse(serialize_communities(communities, joined_ids), headers=headers)
 
 @router.get("/{community_id}", response_model=schemas.community.Community)
 async def get_community(
     community_id: str,
-    db: Session = Depends(get_db),
-    current_user: models.user.User = Depends(get_current_user)
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Principal = Depends(get_current_principal)
 ):
     """
     Get a specific community by ID.
     """
     # Get community from database
-    community = community_crud.get_community(db=db, community_id=community_id)
+    community = await community_crud.get_community(db=db, community_id=community_id)
     
     if not community:
         raise HTTPException(
@@ -194,46 +226,33 @@ async def get_community(
         )
     
     # Check if user has joined this community
-    joined = current_user in community.members
-    
-    # Format response
-    community_response = schemas.community.Community(
-        id=community.id,
-        name=community.name,
-        description=community.description,
-        category=community.category,
-        location=community.location,
-        image=community.image,
-        guidelines=community.guidelines,
-        members=len(community.members),
-        joined=joined,
-        creator=schemas.user.UserInfo(
-            id=community.creator.id,
-            name=community.creator.name,
-            avatar=community.creator.avatar
-        ),
-        created_at=community.created_at
-    )
+    joined = community.id in await community_crud.get_joined_community_ids(db, current_user.id, [community.id])
     
-    return community_response
+    return FastJSONResponse(serialize_community(community, joined))
 
 @router.put("/{community_id}", response_model=schemas.community.Community)
 async def update_community(
     community_id: str,
     community_data: schemas.community.CommunityUpdate,
-    db: Session = Depends(get_db),
-    current_user: models.user.User = Depends(get_current_user)
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Principal = Depends(get_current_principal)
 ):
     """
     Update a specific community.
     """
     # Update community
-    updated_community = community_crud.update_community(
-        db=db,
-        community_id=community_id,
-        community_data=community_data,
-        user_id=current_user.id
-    )
+    try:
+        updated_community = await community_crud.update_community(
+            db=db,
+            community_id=community_id,
+            community_data=community_data,
+            user_id=current_user.id
+        )
+    except ValueError as error:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(error)
+        )
     
     if not updated_community:
         raise HTTPException(
@@ -242,40 +261,23 @@ async def update_community(
         )
     
     # Check if user has joined this community
-    joined = current_user in updated_community.members
-    
-    # Format response
-    community_response = schemas.community.Community(
-        id=updated_community.id,
-        name=updated_community.name,
-        description=updated_community.description,
-        category=updated_community.category,
-        location=updated_community.location,
-        image=updated_community.image,
-        guidelines=updated_community.guidelines,
-        members=len(updated_community.members),
-        joined=joined,
-        creator=schemas.user.UserInfo(
-            id=updated_community.creator.id,
-            name=updated_community.creator.name,
-            avatar=updated_community.creator.avatar
-        ),
-        created_at=updated_community.created_at
+    joined = updated_community.id in await community_crud.get_joined_community_ids(
+        db, current_user.id, [updated_community.id]
     )
     
-    return community_response
+    return FastJSONResponse(serialize_community(updated_community, joined))
 
 @router.delete("/{community_id}", status_code=status.HTTP_204_NO_CONTENT)
 async def delete_community(
     community_id: str,
-    db: Session = Depends(get_db),
-    current_user: models.user.User = Depends(get_current_user)
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Principal = Depends(get_current_principal)
 ):
     """
     Delete a specific community.
     """
     # Delete community
-    success = community_crud.delete_community(db=db, community_id=community_id, user_id=current_user.id)
+    success = await community_crud.delete_community(db=db, community_id=community_id, user_id=current_user.id)
     
     if not success:
         raise HTTPException(
@@ -288,20 +290,20 @@ async def delete_community(
 @router.post("/join", status_code=status.HTTP_200_OK)
 async def join_community(
     community_membership: schemas.community.CommunityMembership,
-    db: Session = Depends(get_db),
-    current_user: models.user.User = Depends(get_current_user)
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Principal = Depends(get_current_principal)
 ):
     """
     Join a community.
     """
     # Join community
-    success = community_crud.join_community(
+    result = await community_crud.join_community(
         db=db,
         community_id=community_membership.community_id,
         user_id=current_user.id
     )
     
-    if not success:
+    if result is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Community not found"
@@ -312,23 +314,29 @@ async def join_community(
 @router.post("/leave", status_code=status.HTTP_200_OK)
 async def leave_community(
     community_membership: schemas.community.CommunityMembership,
-    db: Session = Depends(get_db),
-    current_user: models.user.User = Depends(get_current_user)
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Principal = Depends(get_current_principal)
 ):
     """
     Leave a community.
     """
     # Leave community
-    success = community_crud.leave_community(
-        db=db,
-        community_id=community_membership.community_id,
-        user_id=current_user.id
-    )
-    
-    if not success:
+    try:
+        result = await community_crud.leave_community(
+            db=db,
+            community_id=community_membership.community_id,
+            user_id=current_user.id
+        )
+    except ValueError:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Unable to leave community. You may be the creator or the community doesn't exist."
+            detail="Unable to leave community. The creator can't leave their own community."
+        )
+    
+    if result is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Community not found"
         )
     
     return {"message": "Successfully left community"} 
\ No newline at end of file
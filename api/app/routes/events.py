@@ -1,310 +1,350 @@
-from fastapi import APIRouter, Depends, HTTPException, Query, status
-from sqlalchemy.orm import Session
-from typing import List, Optional
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Request, Response, status
+from sqlalchemy.ext.asyncio import AsyncSession
+from datetime import date, datetime
+from typing import List, Optional, Union
+import time
 
-from .. import models, schemas
-from ..database import get_db
-from ..utils.security import get_current_user
-from ..crud import event as event_crud
+from .. import schemas
+from ..database import get_async_db
+from ..serializers import serialize_event, serialize_events
+from ..utils import geo, response_cache, versions
+from ..utils.security import Principal, get_current_principal
+from ..utils.pagination import NEXT_CURSOR_HEADER, encode_cursor, next_cursor
+from ..utils.responses import FastJSONResponse, etag_matches
+from ..crud.aio import event as event_crud
 
 router = APIRouter()
 
 @router.get("/", response_model=List[schemas.event.Event])
 async def get_events(
+    request: Request,
     skip: int = 0,
     limit: int = 100,
     category: Optional[str] = None,
     location: Optional[str] = None,
     price_filter: Optional[str] = None,
-    db: Session = Depends(get_db),
-    current_user: models.user.User = Depends(get_current_user)
+    starts_from: Optional[Union[datetime, date]] = Query(None, alias="from"),
+    starts_before: Optional[Union[datetime, date]] = Query(None, alias="to"),
+    upcoming_only: bool = False,
+    near: Optional[str] = None,
+    radius_km: float = Query(10, gt=0, le=500),
+    cursor: Optional[str] = None,
+    if_none_match: Optional[str] = Header(None),
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Principal = Depends(get_current_principal)
 ):
     """
     Get all events with optional filtering.
+    
+    `from` (inclusive) and `to` (exclusive) bound the start time; dates mean
+    midnight UTC. `upcoming_only` hides started events and lists the soonest first.
+    
+    `near` ("lat,lng") limits the list to events within `radius_km` of that
+    point, nearest first, and fills in each event's `distance_km`.
+    
+    Pass the `X-Next-Cursor` response header back as `cursor` to fetch the next page.
+    Send the `ETag` back as `If-None-Match` to get an empty 304 while the page is unchanged.
     """
-    # Get events from database
-    events = event_crud.get_events(
-        db=db,
-        skip=skip,
-        limit=limit,
+    # Answer from the list's version, without running the query, while
+    # nothing changed; upcoming events drop off the list as they start, so
+    # that list also changes every minute
+    version = await event_crud.get_events_version(db)
+    etag = versions.list_etag(version, request.url.query, int(time.time() // 60) if upcoming_only else None)
+    headers = {"ETag": etag, "Cache-Control": versions.LIST_CACHE_CONTROL}
+    if etag_matches(if_none_match, etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    
+    filters = dict(
         category=category,
         location=location,
-        price_filter=price_filter
+        price_filter=price_filter,
+        starts_from=starts_from,
+        starts_before=starts_before,
+        upcoming_only=upcoming_only,
     )
     
-    # Format response
-    event_responses = []
-    for event in events:
-        # Get attendee avatars (limit to first 5)
-        attendee_avatars = [
-            attendee.avatar for attendee in event.attendees[:5]
-            if attendee.avatar is not None
-        ]
-        
-        # Format event for response
-        event_response = schemas.event.Event(
-            id=event.id,
-            title=event.title,
-            description=event.description,
-            date=event.date,
-            time=event.time,
-            location=event.location,
-            category=event.category,
-            price=event.price,
-            image=event.image,
-            attendees=len(event.attendees),
-            attendeeAvatars=attendee_avatars,
-            organizer=schemas.user.UserInfo(
-                id=event.organizer.id,
-                name=event.organizer.name,
-                avatar=event.organizer.avatar
-            ),
-            created_at=event.created_at
+    # Parse the point to search around, if any
+    point = None
+    if near is not None:
+        try:
+            point = geo.parse_point(near)
+        except ValueError:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Invalid near point"
+            )
+    
+    # Get events from database
+    try:
+        if point:
+            matches = await event_crud.get_events_near(
+                db, *point, radius_km, skip=skip, limit=limit, cursor=cursor, **filters
+            )
+            events = [event for event, _ in matches]
+        else:
+            events = await event_crud.get_events(db=db, skip=skip, limit=limit, cursor=cursor, **filters)
+    except ValueError:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid cursor"
         )
-        
-        event_responses.append(event_response)
     
-    return event_responses
+    # Expose the cursor for the next page, if any
+    if point:
+        distances = {event.id: geo.distance_km(key) for event, key in matches}
+        page_cursor = encode_cursor(matches[-1][1], matches[-1][0].id) if len(matches) == limit else None
+    else:
+        distances = None
+        page_cursor = next_cursor(events, "starts_at", limit)
+    if page_cursor:
+        headers[NEXT_CURSOR_HEADER] = page_cursor
+    
+    # Load attendee avatars for the whole page at once
+    avatars = await event_crud.get_attendee_avatars(db, events)
+    
+    return FastJSONResponse(serialize_events(events, avatars, distances), headers=headers)
 
 @router.post("/", response_model=schemas.event.Event, status_code=status.HTTP_201_CREATED)
 async def create_event(
     event_data: schemas.event.EventCreate,
-    db: Session = Depends(get_db),
-    current_user: models.user.User = Depends(get_current_user)
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Principal = Depends(get_current_principal)
 ):
     """
     Create a new event.
     """
     # Create event
-    event = event_crud.create_event(db=db, event=event_data, user_id=current_user.id)
-    
-    # Format response
-    event_response = schemas.event.Event(
-        id=event.id,
-        title=event.title,
-        description=event.description,
-        date=event.date,
-        time=event.time,
-        location=event.location,
-        category=event.category,
-        price=event.price,
-        image=event.image,
-        attendees=len(event.attendees),
-        attendeeAvatars=[],
-        organizer=schemas.user.UserInfo(
-            id=event.organizer.id,
-            name=event.organizer.name,
-            avatar=event.organizer.avatar
-        ),
-        created_at=event.created_at
-    )
+    try:
+        event = await event_crud.create_event(db=db, event=event_data, user_id=current_user.id)
+    except ValueError as error:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(error)
+        )
     
-    return event_response
+    # New events have no attendees yet
+    return FastJSONResponse(serialize_event(event, []), status_code=status.HTTP_201_CREATED)
 
 @router.get("/user/{user_id}", response_model=List[schemas.event.Event])
 async def get_user_events(
+    request: Request,
     user_id: str,
     skip: int = 0,
     limit: int = 100,
-    db: Session = Depends(get_db)
+    if_none_match: Optional[str] = Header(None),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     Get events created by a specific user.
+    
+    Send the `ETag` back as `If-None-Match` to get an empty 304 while the page is unchanged.
     """
+    # Answer from the list's version, without running the query, while nothing changed
+    etag = versions.list_etag(await event_crud.get_events_version(db), user_id, request.url.query)
+    headers = {"ETag": etag, "Cache-Control": versions.LIST_CACHE_CONTROL}
+    if etag_matches(if_none_match, etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    
     # Get events from database
-    events = event_crud.get_events_by_user(db=db, user_id=user_id, skip=skip, limit=limit)
+    events = await event_crud.get_events_by_user(db=db, user_id=user_id, skip=skip, limit=limit)
     
-    # Format response
-    event_responses = []
-    for event in events:
-        # Get attendee avatars (limit to first 5)
-        attendee_avatars = [
-            attendee.avatar for attendee in event.attendees[:5]
-            if attendee.avatar is not None
-        ]
-        
-        # Format event for response
-        event_response = schemas.event.Event(
-            id=event.id,
-            title=event.title,
-            description=event.description,
-            date=event.date,
-            time=event.time,
-            location=event.location,
-            category=event.category,
-            price=event.price,
-            image=event.image,
-            attendees=len(event.attendees),
-            attendeeAvatars=attendee_avatars,
-            organizer=schemas.user.UserInfo(
-                id=event.organizer.id,
-                name=event.organizer.name,
-                avatar=event.organizer.avatar
-            ),
-            created_at=event.created_at
-        )
-        
-        event_responses.append(event_response)
+    # Load attendee avatars for the whole page at once
+    avatars = await event_crud.get_attendee_avatars(db, events)
     
-    return event_responses
+    return FastJSONResponse(serialize_events(events, avatars), headers=headers)
 
 @router.get("/attending", response_model=List[schemas.event.Event])
 async def get_attending_events(
+    request: Request,
     skip: int = 0,
     limit: int = 100,
-    db: Session = Depends(get_db),
-    current_user: models.user.User = Depends(get_current_user)
+    if_none_match: Optional[str] = Header(None),
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Principal = Depends(get_current_principal)
 ):
     """
     Get events that the current user is attending.
+    
+    Send the `ETag` back as `If-None-Match` to get an empty 304 while the page is unchanged.
     """
+    # Answer from the list's version, without running the query, while nothing changed
+    version = await event_crud.get_events_version(db, current_user.id)
+    etag = versions.list_etag(version, current_user.id, request.url.query)
+    headers = {"ETag": etag, "Cache-Control": versions.LIST_CACHE_CONTROL}
+    if etag_matches(if_none_match, etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    
     # Get events from database
-    events = event_crud.get_attended_events(db=db, user_id=current_user.id, skip=skip, limit=limit)
+    events = await event_crud.get_attended_events(db=db, user_id=current_user.id, skip=skip, limit=limit)
     
-    # Format response
-    event_responses = []
-    for event in events:
-        # Get attendee avatars (limit to first 5)
-        attendee_avatars = [
-            attendee.avatar for attendee in event.attendees[:5]
-            if attendee.avatar is not None
-        ]
-        
-        # Format event for response
-        event_response = schemas.event.Event(
-            id=event.id,
-            title=event.title,
-            description=event.description,
-            date=event.date,
-            time=event.time,
-            location=event.location,
-            category=event.category,
-            price=event.price,
-            image=event.image,
-            attendees=len(event.attendees),
-            attendeeAvatars=attendee_avatars,
-            organizer=schemas.user.UserInfo(
-                id=event.organizer.id,
-                name=event.organizer.name,
-                avatar=event.organizer.avatar
-            ),
-            created_at=event.created_at
-        )
-        
-        event_responses.append(event_response)
+    # Load attendee avatars for the whole page at once
+    avatars = await event_crud.get_attendee_avatars(db, events)
     
-    return event_responses
+    return FastJSONResponse(serialize_events(events, avatars), headers=headers)
 
 @router.get("/favorites", response_model=List[schemas.event.Event])
 async def get_liked_events(
+    request: Request,
     skip: int = 0,
     limit: int = 100,
-    db: Session = Depends(get_db),
-    current_user: models.user.User = Depends(get_current_user)
+    if_none_match: Optional[str] = Header(None),
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Principal = Depends(get_current_principal)
 ):
     """
     Get events that the current user has liked/favorited.
+    
+    Send the `ETag` back as `If-None-Match` to get an empty 304 while the page is unchanged.
     """
+    # Answer from the list's version, without running the query, while nothing changed
+    version = await event_crud.get_events_version(db, current_user.id)
+    etag = versions.list_etag(version, current_user.id, request.url.query)
+    headers = {"ETag": etag, "Cache-Control": versions.LIST_CACHE_CONTROL}
+    if etag_matches(if_none_match, etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    
     # Get events from database
-    events = event_crud.get_liked_events(db=db, user_id=current_user.id, skip=skip, limit=limit)
+    events = await event_crud.get_liked_events(db=db, user_id=current_user.id, skip=skip, limit=limit)
     
-    # Format response
-    event_responses = []
-    for event in events:
-        # Get attendee avatars (limit to first 5)
-        attendee_avatars = [
-            attendee.avatar for attendee in event.attendees[:5]
-            if attendee.avatar is not None
-        ]
-        
-        # Format event for response
-        event_response = schemas.event.Event(
-            id=event.id,
-            title=event.title,
-            description=event.description,
-            date=event.date,
-            time=event.time,
-            location=event.location,
-            category=event.category,
-            price=event.price,
-            image=event.image,
-            attendees=len(event.attendees),
-            attendeeAvatars=attendee_avatars,
-            organizer=schemas.user.UserInfo(
-                id=event.organizer.id,
-                name=event.organizer.name,
-                avatar=event.organizer.avatar
-            ),
-            created_at=event.created_at
+    # Load attendee avatars for the whole page at once
+    avatars = await event_crud.get_attendee_avatars(db, events)
+    
+    return FastJSONResponse(serialize_events(events, avatars), headers=headers)
+
+@router.get("/search", response_model=List[schemas.event.Event])
+async def search_events(
+    request: Request,
+    q: str = Query(..., min_length=1),
+    limit: int = Query(20, ge=1, le=100),
+    cursor: Optional[str] = None,
+    if_none_match: Optional[str] = Header(None),
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Principal = Depends(get_current_principal)
+):
+    """
+    Search events by title, category, location and description, best match first.
+    
+    Pass the `X-Next-Cursor` response header back as `cursor` to fetch the next page,
+    and the `ETag` back as `If-None-Match` to get an empty 304 while the page is unchanged.
+    """
+    # Answer from the list's version, without searching, while nothing changed
+    etag = versions.list_etag(await event_crud.get_events_version(db), request.url.query)
+    headers = {"ETag": etag, "Cache-Control": versions.LIST_CACHE_CONTROL}
+    if etag_matches(if_none_match, etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    
+    # Search the index
+    try:
+        matches = await event_crud.search_events(db=db, query=q, limit=limit, cursor=cursor)
+    except ValueError:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid cursor"
         )
-        
-        event_responses.append(event_response)
+    events = [event for event, _ in matches]
+    
+    # Expose the cursor for the next page, if any
+    if len(matches) == limit:
+        last_event, last_rank = matches[-1]
+        headers[NEXT_CURSOR_HEADER] = encode_cursor(last_rank, last_event.id)
+    
+    # Load attendee avatars for the whole page at once
+    avatars = await event_crud.get_attendee_avatars(db, events)
+    
+    return FastJSONResponse(serialize_events(events, avatars), headers=headers)
+
+@router.get("/feed", response_model=List[schemas.event.Event])
+async def get_feed(
+    limit: int = Query(20, ge=1, le=100),
+    cursor: Optional[str] = None,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Principal = Depends(get_current_principal)
+):
+    """
+    Get the current user's personalized home feed, best first.
+    
+    Events are ranked by the user's interests, the communities they joined,
+    how many of their fellow community members attend, and recency.
+    
+    Pass the `X-Next-Cursor` response header back as `cursor` to fetch the next page.
+    """
+    # Read the precomputed feed
+    try:
+        items = await event_crud.get_feed(db=db, user_id=current_user.id, limit=limit, cursor=cursor)
+    except ValueError:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid cursor"
+        )
+    events = [event for event, _ in items]
+    
+    # Expose the cursor for the next page, if any
+    headers = {}
+    if len(items) == limit:
+        last_event, last_score = items[-1]
+        headers[NEXT_CURSOR_HEADER] = encode_cursor(last_score, last_event.id)
+    
+    # Load attendee avatars for the whole page at once
+    avatars = await event_crud.get_attendee_avatars(db, events)
     
-    return event_responses
+    return FastJSONResponse(serialize_events(events, avatars), headers=headers)
 
 @router.get("/{event_id}", response_model=schemas.event.Event)
 async def get_event(
     event_id: str,
-    db: Session = Depends(get_db)
+    if_none_match: Optional[str] = Header(None),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     Get a specific event by ID.
+    
+    Served from the response cache when possible. Send the `ETag` back as
+    `If-None-Match` to get an empty 304 while the event is unchanged.
     """
-    # Get event from database
-    event = event_crud.get_event(db=db, event_id=event_id)
+    async def load():
+        # Get event from database
+        event = await event_crud.get_event(db=db, event_id=event_id)
+        if not event:
+            return None
+        
+        # Get attendee avatars (limit to first 5)
+        attendee_avatars = (await event_crud.get_attendee_avatars(db, [event]))[event.id]
+        
+        # The organizer's name and avatar are part of the response
+        return serialize_event(event, attendee_avatars), [("user", event.organizer_id)]
     
-    if not event:
+    response = await response_cache.respond("event", event_id, load, if_none_match)
+    if response is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Event not found"
         )
     
-    # Get attendee avatars (limit to first 5)
-    attendee_avatars = [
-        attendee.avatar for attendee in event.attendees[:5]
-        if attendee.avatar is not None
-    ]
-    
-    # Format response
-    event_response = schemas.event.Event(
-        id=event.id,
-        title=event.title,
-        description=event.description,
-        date=event.date,
-        time=event.time,
-        location=event.location,
-        category=event.category,
-        price=event.price,
-        image=event.image,
-        attendees=len(event.attendees),
-        attendeeAvatars=attendee_avatars,
-        organizer=schemas.user.UserInfo(
-            id=event.organizer.id,
-            name=event.organizer.name,
-            avatar=event.organizer.avatar
-        ),
-        created_at=event.created_at
-    )
-    
-    return event_response
+    return response
 
 @router.put("/{event_id}", response_model=schemas.event.Event)
 async def update_event(
     event_id: str,
     event_data: schemas.event.EventUpdate,
-    db: Session = Depends(get_db),
-    current_user: models.user.User = Depends(get_current_user)
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Principal = Depends(get_current_principal)
 ):
     """
     Update a specific event.
     """
     # Update event
-    updated_event = event_crud.update_event(
-        db=db,
-        event_id=event_id,
-        event_data=event_data,
-        user_id=current_user.id
-    )
+    try:
+        updated_event = await event_crud.update_event(
+            db=db,
+            event_id=event_id,
+            event_data=event_data,
+            user_id=current_user.id
+        )
+    except ValueError as error:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(error)
+        )
     
     if not updated_event:
         raise HTTPException(
@@ -313,45 +353,21 @@ async def update_event(
         )
     
     # Get attendee avatars (limit to first 5)
-    attendee_avatars = [
-        attendee.avatar for attendee in updated_event.attendees[:5]
-        if attendee.avatar is not None
-    ]
-    
-    # Format response
-    event_response = schemas.event.Event(
-        id=updated_event.id,
-        title=updated_event.title,
-        description=updated_event.description,
-        date=updated_event.date,
-        time=updated_event.time,
-        location=updated_event.location,
-        category=updated_event.category,
-        price=updated_event.price,
-        image=updated_event.image,
-        attendees=len(updated_event.attendees),
-        attendeeAvatars=attendee_avatars,
-        organizer=schemas.user.UserInfo(
-            id=updated_event.organizer.id,
-            name=updated_event.organizer.name,
-            avatar=updated_event.organizer.avatar
-        ),
-        created_at=updated_event.created_at
-    )
+    attendee_avatars = (await event_crud.get_attendee_avatars(db, [updated_event]))[updated_event.id]
     
-    return event_response
+    return FastJSONResponse(serialize_event(updated_event, attendee_avatars))
 
 @router.delete("/{event_id}", status_code=status.HTTP_204_NO_CONTENT)
 async def delete_event(
     event_id: str,
-    db: Session = Depends(get_db),
-    current_user: models.user.User = Depends(get_current_user)
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Principal = Depends(get_current_principal)
 ):
     """
     Delete a specific event.
     """
     # Delete event
-    success = event_crud.delete_event(db=db, event_id=event_id, user_id=current_user.id)
+    success = await event_crud.delete_event(db=db, event_id=event_id, user_id=current_user.id)
     
     if not success:
         raise HTTPException(
@@ -364,20 +380,20 @@ async def delete_event(
 @router.post("/attend", status_code=status.HTTP_200_OK)
 async def attend_event(
     event_attendance: schemas.event.EventAttendance,
-    db: Session = Depends(get_db),
-    current_user: models.user.User = Depends(get_current_user)
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Principal = Depends(get_current_principal)
 ):
     """
     Attend an event.
     """
     # Attend event
-    success = event_crud.attend_event(
+    result = await event_crud.attend_event(
         db=db,
         event_id=event_attendance.event_id,
         user_id=current_user.id
     )
     
-    if not success:
+    if result is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Event not found"
@@ -388,20 +404,20 @@ async def attend_event(
 @router.post("/unattend", status_code=status.HTTP_200_OK)
 async def unattend_event(
     event_attendance: schemas.event.EventAttendance,
-    db: Session = Depends(get_db),
-    current_user: models.user.User = Depends(get_current_user)
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Principal = Depends(get_current_principal)
 ):
     """
     Unattend an event.
     """
     # Unattend event
-    success = event_crud.unattend_event(
+    result = await event_crud.unattend_event(
         db=db,
         event_id=event_attendance.event_id,
         user_id=current_user.id
     )
     
-    if not success:
+    if result is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Event not found"
@@ -412,20 +428,20 @@ async def unattend_event(
 @router.post("/like", status_code=status.HTTP_200_OK)
 async def like_event(
     event_like: schemas.event.EventLike,
-    db: Session = Depends(get_db),
-    current_user: models.user.User = Depends(get_current_user)
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Principal = Depends(get_current_principal)
 ):
     """
     Like/favorite an event.
     """
     # Like event
-    success = event_crud.like_event(
+    result = await event_crud.like_event(
         db=db,
         event_id=event_like.event_id,
         user_id=current_user.id
     )
     
-    if not success:
+    if result is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Event not found"
@@ -436,20 +452,20 @@ async def like_event(
 @router.post("/unlike", status_code=status.HTTP_200_OK)
 async def unlike_event(
     event_like: schemas.event.EventLike,
-    db: Session = Depends(get_db),
-    current_user: models.user.User = Depends(get_current_user)
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Principal = Depends(get_current_principal)
 ):
     """
     Unlike/unfavorite an event.
     """
     # Unlike event
-    success = event_crud.unlike_event(
+    result = await event_crud.unlike_event(
         db=db,
         event_id=event_like.event_id,
         user_id=current_user.id
     )
     
-    if not success:
+    if result is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Event not found"
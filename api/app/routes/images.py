@@ -0,0 +1,95 @@
+from fastapi import APIRouter, Depends, File, Header, HTTPException, Path, Query, Response, UploadFile, status
+from starlette.concurrency import run_in_threadpool
+from typing import Optional
+
+from .. import schemas
+from ..utils import images
+from ..utils.blobstore import get_blob_store
+from ..utils.security import Principal, get_current_principal
+from ..utils.responses import FastJSONResponse, RangeFileResponse, etag_matches
+
+router = APIRouter()
+
+# Images never change under their key, so caches may keep them for a year
+# without revalidating
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+@router.post("/", response_model=schemas.image.Image, status_code=status.HTTP_201_CREATED)
+async def upload_image(
+    file: UploadFile = File(...),
+    current_user: Principal = Depends(get_current_principal)
+):
+    """
+    Upload a JPEG, PNG, GIF or WebP image.
+    
+    Store the returned `url` in an event or community's `image`, or a user's
+    `avatar`. Uploading the same image again returns the same URL.
+    """
+    # Read one byte past the limit, to tell a too large image from one at the limit
+    data = await file.read(images.MAX_IMAGE_BYTES + 1)
+    if len(data) > images.MAX_IMAGE_BYTES:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail="Image too large"
+        )
+    
+    # Hashing and resizing take a while, so they run off the event loop
+    try:
+        key = await run_in_threadpool(images.store_image, data)
+    except ValueError as error:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(error)
+        )
+    
+    return FastJSONResponse(
+        {
+            "id": key,
+            "url": images.image_url(key),
+            "thumbnailUrl": images.sized_url(images.image_url(key), "thumb"),
+        },
+        status_code=status.HTTP_201_CREATED
+    )
+
+@router.get("/{key}", response_class=Response)
+async def get_image(
+    key: str = Path(..., pattern=images.KEY_PATTERN),
+    size: Optional[str] = Query(None, pattern=f"^({'|'.join(images.IMAGE_SIZES)})$"),
+    range_header: Optional[str] = Header(None, alias="Range"),
+    if_range: Optional[str] = Header(None),
+    if_none_match: Optional[str] = Header(None),
+):
+    """
+    Get an image, or with `size` a copy scaled down to fit a `thumb` (256px)
+    or `medium` (1024px) square.
+    
+    Keys are hashes of the image, so images are public and cacheable
+    forever; the `ETag` only saves the body when a cache revalidates anyway.
+    A single `Range` of bytes may be requested.
+    """
+    resolved = await run_in_threadpool(images.resolve, key, size)
+    if resolved is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Image not found"
+        )
+    
+    headers = {"ETag": images.etag(resolved), "Cache-Control": IMMUTABLE_CACHE_CONTROL}
+    if etag_matches(if_none_match, headers["ETag"]):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    
+    # Stream blobs on local disk straight from the file, never reading it whole
+    store = get_blob_store()
+    path = store.local_path(resolved)
+    if path is not None:
+        return RangeFileResponse(
+            path, range_header=range_header, if_range=if_range, headers=headers, media_type=images.media_type(resolved)
+        )
+    
+    data = await run_in_threadpool(store.get, resolved)
+    if data is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Image not found"
+        )
+    return Response(data, media_type=images.media_type(resolved), headers=headers)
@@ -1,75 +1,243 @@
-from fastapi import APIRouter, Depends, HTTPException, Query, status
-from sqlalchemy.orm import Session
-from typing import List, Optional
-from datetime import datetime
+from fastapi import APIRouter, Depends, Header, HTTPException, Request, Response, WebSocket, status
+from fastapi.responses import StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncSession
+from starlette.background import BackgroundTask
+from typing import AsyncIterator, List, Optional, Tuple
+import asyncio
 
-from .. import models, schemas
-from ..database import get_db
-from ..utils.security import get_current_user
-from ..crud import notification as notification_crud
+from .. import schemas
+from ..database import get_async_db
+from ..serializers import serialize_notification_message, serialize_notifications
+from ..utils import pubsub, versions
+from ..utils.security import Principal, get_current_principal, get_websocket_principal
+from ..utils.pagination import NEXT_CURSOR_HEADER, next_cursor
+from ..utils.responses import FastJSONResponse, dumps, etag_matches
+from ..crud.aio import notification as notification_crud
 
 router = APIRouter()
 
+# Seconds between keep-alive messages on an idle stream, and before an SSE
+# client reconnects after losing one
+HEARTBEAT_SECONDS = 15
+RETRY_MILLISECONDS = 3000
+
+# Missed notifications replayed when a stream resumes; past that the client
+# is told to refetch the list instead
+RESUME_LIMIT = 100
+RESET_MESSAGE = {"event": "reset", "id": None, "data": {}}
+PING_MESSAGE = {"event": "ping", "id": None, "data": {}}
+
+async def _open_stream(
+    db: AsyncSession,
+    user_id: str,
+    last_id: Optional[str]
+) -> Tuple[pubsub.Subscription, List[pubsub.Message]]:
+    """
+    Subscribe to a user's live updates and collect what they missed since
+    `last_id`, then hand the session's connection back to the pool, which
+    a long-lived stream must not hold.
+    """
+    # Subscribe first, so nothing published while the backlog loads is lost
+    subscription = pubsub.subscribe(pubsub.user_channel(user_id))
+    backlog = []
+    try:
+        if last_id:
+            missed = await notification_crud.get_notifications_after(
+                db, user_id, last_id, limit=RESUME_LIMIT + 1
+            )
+            if missed is None or len(missed) > RESUME_LIMIT:
+                backlog.append(RESET_MESSAGE)
+            else:
+                backlog.extend(serialize_notification_message(notification) for notification in missed)
+        await db.close()
+    except BaseException:
+        subscription.close()
+        raise
+    return subscription, backlog
+
+async def _stream_messages(
+    subscription: pubsub.Subscription,
+    backlog: List[pubsub.Message]
+) -> AsyncIterator[pubsub.Message]:
+    """
+    Yield the backlog, then live messages and a ping whenever the stream is
+    idle. Ends when the subscriber falls too far behind.
+    """
+    # Updates published while the backlog loaded arrive live as well; skip
+    # each once. Every update has its own ID, so later ones always pass, and
+    # once the stream goes idle the overlap is over
+    replayed = {message["id"] for message in backlog if message["id"]}
+    for message in backlog:
+        yield message
+    
+    while True:
+        try:
+            message = await subscription.get(HEARTBEAT_SECONDS)
+        except pubsub.Overflow:
+            return
+        if message is None:
+            replayed.clear()
+            yield PING_MESSAGE
+        elif message["id"] in replayed:
+            replayed.discard(message["id"])
+        else:
+            yield message
+
+def _format_sse(message: pubsub.Message) -> bytes:
+    """Encode a message as a server-sent event; pings are comments."""
+    if message is PING_MESSAGE:
+        return b": ping\n\n"
+    lines = [f"event: {message['event']}"]
+    if message["id"]:
+        lines.append(f"id: {message['id']}")
+    lines.append("data: " + dumps(message["data"]).decode("utf-8"))
+    return ("\n".join(lines) + "\n\n").encode("utf-8")
+
 @router.get("/", response_model=List[schemas.notification.Notification])
 async def get_notifications(
+    request: Request,
     skip: int = 0,
     limit: int = 100,
     unread_only: bool = False,
-    db: Session = Depends(get_db),
-    current_user: models.user.User = Depends(get_current_user)
+    cursor: Optional[str] = None,
+    if_none_match: Optional[str] = Header(None),
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Principal = Depends(get_current_principal)
 ):
     """
     Get notifications for the current user.
+    
+    Pass the `X-Next-Cursor` response header back as `cursor` to fetch the next page.
+    Send the `ETag` back as `If-None-Match` to get an empty 304 while the page is unchanged.
     """
+    # Answer from the list's version, without running the query, while nothing changed
+    version = await notification_crud.get_notifications_version(db, current_user.id)
+    etag = versions.list_etag(version, current_user.id, request.url.query)
+    headers = {"ETag": etag, "Cache-Control": versions.LIST_CACHE_CONTROL}
+    if etag_matches(if_none_match, etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    
     # Get notifications from database
-    notifications = notification_crud.get_user_notifications(
-        db=db,
-        user_id=current_user.id,
-        skip=skip,
-        limit=limit,
-        unread_only=unread_only
+    try:
+        notifications = await notification_crud.get_user_notifications(
+            db=db,
+            user_id=current_user.id,
+            skip=skip,
+            limit=limit,
+            unread_only=unread_only,
+            cursor=cursor
+        )
+    except ValueError:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid cursor"
+        )
+    
+    # Expose the cursor for the next page, if any
+    page_cursor = next_cursor(notifications, "updated_at", limit)
+    if page_cursor:
+        headers[NEXT_CURSOR_HEADER] = page_cursor
+    
+    return FastJSONResponse(serialize_notifications(notifications), headers=headers)
+
+@router.get("/unread-count", response_model=schemas.notification.UnreadCount)
+async def get_unread_count(
+    if_none_match: Optional[str] = Header(None),
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Principal = Depends(get_current_principal)
+):
+    """
+    Get the current user's number of unread notifications.
+    
+    The count is read from a maintained counter. Send the `ETag` back as
+    `If-None-Match` to get an empty 304 while the count is unchanged.
+    """
+    count = await notification_crud.get_unread_count(db=db, user_id=current_user.id)
+    
+    # The count is the whole representation, so it makes the validator;
+    # clients must revalidate on every use
+    headers = {"ETag": f'"unread-{count}"', "Cache-Control": "private, no-cache"}
+    if etag_matches(if_none_match, headers["ETag"]):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    
+    return FastJSONResponse({"count": count}, headers=headers)
+
+@router.get("/stream")
+async def stream_notifications(
+    last_id: Optional[str] = None,
+    last_event_id: Optional[str] = Header(None),
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Principal = Depends(get_current_principal)
+):
+    """
+    Stream the current user's new notifications as server-sent events.
+    
+    Reconnecting clients resume after the `Last-Event-ID` header (or the
+    `last_id` parameter); a `reset` event means more were missed than can be
+    replayed, and the list should be refetched.
+    """
+    subscription, backlog = await _open_stream(db, current_user.id, last_event_id or last_id)
+    
+    async def events():
+        yield f"retry: {RETRY_MILLISECONDS}\n\n".encode("utf-8")
+        async for message in _stream_messages(subscription, backlog):
+            yield _format_sse(message)
+    
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        # Keep proxies from caching or buffering the stream
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        background=BackgroundTask(subscription.close)
     )
+
+@router.websocket("/ws")
+async def notifications_websocket(
+    websocket: WebSocket,
+    last_id: Optional[str] = None,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Principal = Depends(get_websocket_principal)
+):
+    """
+    Stream the current user's new notifications over a WebSocket, as JSON
+    messages shaped like the server-sent events, resuming after `last_id`.
+    """
+    subscription, backlog = await _open_stream(db, current_user.id, last_id)
     
-    # Format response
-    notification_responses = []
-    for notification in notifications:
-        # Format time
-        formatted_time = notification.created_at.strftime("%Y-%m-%d %H:%M:%S")
-        
-        # Get sender info if applicable
-        sender_name = None
-        sender_avatar = None
-        if notification.sender_id:
-            sender_name = notification.sender.name
-            sender_avatar = notification.sender.avatar
-        
-        # Format notification for response
-        notification_response = schemas.notification.Notification(
-            id=notification.id,
-            message=notification.message,
-            sender=sender_name,
-            avatar=sender_avatar,
-            time=formatted_time,
-            read=notification.read,
-            notification_type=notification.notification_type,
-            reference_id=notification.reference_id
-        )
-        
-        notification_responses.append(notification_response)
+    async def send():
+        async for message in _stream_messages(subscription, backlog):
+            await websocket.send_text(dumps(message).decode("utf-8"))
     
-    return notification_responses
+    async def wait_for_disconnect():
+        # Client messages are ignored; reading them notices the disconnect
+        while (await websocket.receive())["type"] != "websocket.disconnect":
+            pass
+    
+    async with subscription:
+        await websocket.accept()
+        sender = asyncio.create_task(send())
+        receiver = asyncio.create_task(wait_for_disconnect())
+        try:
+            done, _ = await asyncio.wait({sender, receiver}, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            sender.cancel()
+            receiver.cancel()
+        
+        # The client fell too far behind; it reconnects and resumes
+        if sender in done and sender.exception() is None:
+            await websocket.close(code=status.WS_1013_TRY_AGAIN_LATER)
 
 @router.post("/read", status_code=status.HTTP_200_OK)
 async def mark_notification_as_read(
     notification_data: schemas.notification.NotificationRead,
-    db: Session = Depends(get_db),
-    current_user: models.user.User = Depends(get_current_user)
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Principal = Depends(get_current_principal)
 ):
     """
     Mark a notification as read.
     """
     # Mark notification as read
-    success = notification_crud.mark_notification_as_read(
+    success = await notification_crud.mark_notification_as_read(
         db=db,
         notification_id=notification_data.notification_id,
         user_id=current_user.id
@@ -85,14 +253,14 @@ async def mark_notification_as_read(
 
 @router.post("/read-all", status_code=status.HTTP_200_OK)
 async def mark_all_notifications_as_read(
-    db: Session = Depends(get_db),
-    current_user: models.user.User = Depends(get_current_user)
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Principal = Depends(get_current_principal)
 ):
     """
     Mark all notifications as read.
     """
     # Mark all notifications as read
-    count = notification_crud.mark_all_notifications_as_read(
+    count = await notification_crud.mark_all_notifications_as_read(
         db=db,
         user_id=current_user.id
     )
@@ -102,14 +270,14 @@ async def mark_all_notifications_as_read(
 @router.delete("/{notification_id}", status_code=status.HTTP_204_NO_CONTENT)
 async def delete_notification(
     notification_id: str,
-    db: Session = Depends(get_db),
-    current_user: models.user.User = Depends(get_current_user)
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Principal = Depends(get_current_principal)
 ):
     """
     Delete a notification.
     """
     # Delete notification
-    success = notification_crud.delete_notification(
+    success = await notification_crud.delete_notification(
         db=db,
         notification_id=notification_id,
         user_id=current_user.id
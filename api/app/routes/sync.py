@@ -0,0 +1,63 @@
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import Optional
+
+from .. import schemas
+from ..database import get_async_db
+from ..serializers import serialize_communities, serialize_events, serialize_notifications
+from ..utils.security import Principal, get_current_principal
+from ..utils.responses import FastJSONResponse
+from ..crud.aio import sync as sync_crud
+
+router = APIRouter()
+
+@router.get("", response_model=schemas.sync.Sync)
+async def sync(
+    since: Optional[str] = None,
+    limit: int = Query(500, ge=1, le=1000),
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Principal = Depends(get_current_principal)
+):
+    """
+    Get what changed in events, communities, the current user's memberships
+    and their notifications since the `since` cursor.
+    
+    Each kind lists the current state of what was created or updated, and
+    the IDs of what was deleted. Pass the returned `cursor` back as `since`
+    next time, right away while `hasMore` is set. Without `since`, only the
+    cursor is returned: take it before fetching the lists in full. When
+    `reset` is set, the cursor was too old: refetch the lists, then sync from
+    the returned cursor.
+    """
+    # Parse the cursor, a change log ID
+    try:
+        since_id = int(since) if since is not None else None
+    except ValueError:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid cursor"
+        )
+    
+    changes = await sync_crud.get_changes(db, current_user.id, since_id, limit)
+    
+    return FastJSONResponse({
+        "cursor": str(changes.cursor),
+        "reset": changes.reset,
+        "hasMore": changes.has_more,
+        "events": {
+            "upserts": serialize_events(changes.events, changes.attendee_avatars),
+            "deleted": changes.deleted["event"],
+        },
+        "communities": {
+            "upserts": serialize_communities(changes.communities, changes.joined_ids),
+            "deleted": changes.deleted["community"],
+        },
+        "memberships": {
+            "upserts": changes.memberships,
+            "deleted": changes.deleted["membership"],
+        },
+        "notifications": {
+            "upserts": serialize_notifications(changes.notifications),
+            "deleted": changes.deleted["notification"],
+        },
+    })
@@ -1,11 +1,14 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
-from typing import List
+from fastapi import APIRouter, Depends, Header, HTTPException, status
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List, Optional
 
 from .. import models, schemas
-from ..database import get_db
-from ..utils.security import get_current_user
-from ..crud import user as user_crud
+from ..database import get_async_db
+from ..serializers import serialize_user
+from ..utils import response_cache
+from ..utils.security import Principal, get_current_principal, get_current_user
+from ..utils.responses import FastJSONResponse
+from ..crud.aio import user as user_crud
 
 router = APIRouter()
 
@@ -14,45 +17,24 @@ async def get_current_user_profile(current_user: models.user.User = Depends(get_
     """
     Get the current user's profile.
     """
-    user = current_user
-    
-    # Calculate events attended
-    events_attended = len(user.attending_events)
-    
-    # Calculate communities joined
-    communities_joined = len(user.communities)
-    
-    # Convert comma-separated interests to list if present
-    interests_list = []
-    if user.interests:
-        interests_list = user.interests.split(",")
-    
-    # Create response
-    user_response = schemas.user.User(
-        id=user.id,
-        email=user.email,
-        name=user.name,
-        avatar=user.avatar,
-        bio=user.bio,
-        location=user.location,
-        interests=interests_list,
-        eventsAttended=events_attended,
-        communities=communities_joined,
-        created_at=user.created_at
-    )
-    
-    return user_response
+    return FastJSONResponse(serialize_user(current_user))
 
 @router.put("/me", response_model=schemas.user.User)
 async def update_user_profile(
     user_data: schemas.user.UserUpdate,
-    current_user: models.user.User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: Principal = Depends(get_current_principal),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     Update the current user's profile.
     """
-    updated_user = user_crud.update_user(db, current_user.id, user_data)
+    try:
+        updated_user = await user_crud.update_user(db, current_user.id, user_data)
+    except ValueError as error:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(error)
+        )
     
     if not updated_user:
         raise HTTPException(
@@ -60,72 +42,29 @@ async def update_user_profile(
             detail="User not found"
         )
     
-    # Calculate events attended
-    events_attended = len(updated_user.attending_events)
-    
-    # Calculate communities joined
-    communities_joined = len(updated_user.communities)
-    
-    # Convert comma-separated interests to list if present
-    interests_list = []
-    if updated_user.interests:
-        interests_list = updated_user.interests.split(",")
-    
-    # Create response
-    user_response = schemas.user.User(
-        id=updated_user.id,
-        email=updated_user.email,
-        name=updated_user.name,
-        avatar=updated_user.avatar,
-        bio=updated_user.bio,
-        location=updated_user.location,
-        interests=interests_list,
-        eventsAttended=events_attended,
-        communities=communities_joined,
-        created_at=updated_user.created_at
-    )
-    
-    return user_response
+    return FastJSONResponse(serialize_user(updated_user))
 
 @router.get("/{user_id}", response_model=schemas.user.User)
 async def get_user_profile(
     user_id: str,
-    db: Session = Depends(get_db)
+    if_none_match: Optional[str] = Header(None),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     Get a user's profile by ID.
+    
+    Served from the response cache when possible. Send the `ETag` back as
+    `If-None-Match` to get an empty 304 while the profile is unchanged.
     """
-    user = user_crud.get_user(db, user_id)
+    async def load():
+        user = await user_crud.get_user(db, user_id)
+        return (serialize_user(user), []) if user else None
     
-    if not user:
+    response = await response_cache.respond("user", user_id, load, if_none_match)
+    if response is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="User not found"
         )
     
-    # Calculate events attended
-    events_attended = len(user.attending_events)
-    
-    # Calculate communities joined
-    communities_joined = len(user.communities)
-    
-    # Convert comma-separated interests to list if present
-    interests_list = []
-    if user.interests:
-        interests_list = user.interests.split(",")
-    
-    # Create response
-    user_response = schemas.user.User(
-        id=user.id,
-        email=user.email,
-        name=user.name,
-        avatar=user.avatar,
-        bio=user.bio,
-        location=user.location,
-        interests=interests_list,
-        eventsAttended=events_attended,
-        communities=communities_joined,
-        created_at=user.created_at
-    )
-    
-    return user_response 
\ No newline at end of file
+    return response 
\ No newline at end of file
@@ -4,4 +4,6 @@ from . import event
 from . import community
 from . import notification
 from . import auth
-from . import token 
\ No newline at end of file
+from . import token 
+from . import image
+from . import sync
\ No newline at end of file
@@ -1,4 +1,4 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from typing import List, Optional
 from datetime import datetime
 
@@ -13,6 +13,8 @@ class CommunityBase(BaseModel):
 # Schema for community creation
 class CommunityCreate(CommunityBase):
     location: Optional[str] = None
+    latitude: Optional[float] = Field(None, ge=-90, le=90)
+    longitude: Optional[float] = Field(None, ge=-180, le=180)
     image: Optional[str] = None
     guidelines: Optional[str] = None
 
@@ -22,6 +24,8 @@ class CommunityUpdate(BaseModel):
     description: Optional[str] = None
     category: Optional[str] = None
     location: Optional[str] = None
+    latitude: Optional[float] = Field(None, ge=-90, le=90)
+    longitude: Optional[float] = Field(None, ge=-180, le=180)
     image: Optional[str] = None
     guidelines: Optional[str] = None
 
@@ -30,6 +34,9 @@ class Community(CommunityBase):
     id: str
     image: Optional[str] = None
     location: Optional[str] = None
+    latitude: Optional[float] = None
+    longitude: Optional[float] = None
+    distance_km: Optional[float] = None  # Only set for `near` queries
     guidelines: Optional[str] = None
     members: int = 0
     creator: UserInfo
@@ -18,6 +18,8 @@ class EventCreate(EventBase):
     price: float = 0
     image: Optional[str] = None
     community_id: Optional[str] = None
+    latitude: Optional[float] = Field(None, ge=-90, le=90)
+    longitude: Optional[float] = Field(None, ge=-180, le=180)
 
 # Schema for updating an event
 class EventUpdate(BaseModel):
@@ -30,6 +32,8 @@ class EventUpdate(BaseModel):
     price: Optional[float] = None
     image: Optional[str] = None
     community_id: Optional[str] = None
+    latitude: Optional[float] = Field(None, ge=-90, le=90)
+    longitude: Optional[float] = Field(None, ge=-180, le=180)
 
 # Schema for event response
 class Event(EventBase):
@@ -39,6 +43,10 @@ class Event(EventBase):
     attendees: int
     attendeeAvatars: List[str] = []
     organizer: UserInfo
+    starts_at: Optional[datetime] = None  # Parsed from date and time, UTC
+    latitude: Optional[float] = None
+    longitude: Optional[float] = None
+    distance_km: Optional[float] = None  # Only set for `near` queries
     created_at: datetime
     
     class Config:
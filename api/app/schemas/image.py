@@ -0,0 +1,7 @@
+from pydantic import BaseModel
+
+# Schema for a stored image (upload response)
+class Image(BaseModel):
+    id: str
+    url: str
+    thumbnailUrl: str
@@ -12,10 +12,15 @@ class Notification(BaseModel):
     read: bool
     notification_type: str
     reference_id: Optional[str] = None
+    actor_count: int = 1  # Users folded into an aggregated notification
     
     class Config:
         orm_mode = True
 
+# Schema for the unread badge count
+class UnreadCount(BaseModel):
+    count: int
+
 # Schema for marking notifications as read
 class NotificationRead(BaseModel):
     notification_id: str 
\ No newline at end of file
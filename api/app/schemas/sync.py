@@ -0,0 +1,35 @@
+from pydantic import BaseModel
+from typing import List
+
+from .event import Event
+from .community import Community
+from .notification import Notification
+
+# Schemas for what changed of each kind: the current state of what was
+# created or updated, and the IDs of what was deleted
+class EventChanges(BaseModel):
+    upserts: List[Event]
+    deleted: List[str]
+
+class CommunityChanges(BaseModel):
+    upserts: List[Community]
+    deleted: List[str]
+
+# Memberships are the IDs of communities joined and left
+class MembershipChanges(BaseModel):
+    upserts: List[str]
+    deleted: List[str]
+
+class NotificationChanges(BaseModel):
+    upserts: List[Notification]
+    deleted: List[str]
+
+# Schema for a delta sync response
+class Sync(BaseModel):
+    cursor: str  # Pass back as `since` on the next sync
+    reset: bool  # The cursor was too old; refetch the lists in full
+    hasMore: bool  # More changes are waiting; sync again right away
+    events: EventChanges
+    communities: CommunityChanges
+    memberships: MembershipChanges
+    notifications: NotificationChanges
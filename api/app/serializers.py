@@ -0,0 +1,150 @@
+"""
+Map ORM rows straight to response dicts.
+
+Each serializer produces exactly what the matching schema in `app.schemas`
+would, without building and re-validating a Pydantic model per item. Routes
+return the result in a `FastJSONResponse`, and keep `response_model` on the
+decorator for the OpenAPI docs.
+"""
+from datetime import datetime
+from typing import Any, Collection, Dict, List, Mapping, Optional
+
+from . import models
+from .utils.images import sized_url
+from .utils.pagination import encode_cursor
+
+def serialize_user_info(user: models.user.User) -> Dict[str, Any]:
+    """Serialize a user as `schemas.user.UserInfo`."""
+    return {
+        "id": user.id,
+        "name": user.name,
+        "avatar": user.avatar,
+    }
+
+def serialize_user(user: models.user.User) -> Dict[str, Any]:
+    """Serialize a user (with its interests loaded) as `schemas.user.User`, reading the maintained counters."""
+    return {
+        "email": user.email,
+        "name": user.name,
+        "id": user.id,
+        "avatar": user.avatar,
+        "bio": user.bio,
+        "location": user.location,
+        "interests": [interest.name for interest in user.interests],
+        "eventsAttended": user.attending_count,
+        "communities": user.community_count,
+        "created_at": user.created_at,
+    }
+
+def serialize_event(
+    event: models.event.Event,
+    attendee_avatars: List[str],
+    distance_km: Optional[float] = None
+) -> Dict[str, Any]:
+    """
+    Serialize an event (with its organizer loaded) as `schemas.event.Event`.
+    Attendee avatars are shown small, so they point at the thumbnails.
+    """
+    return {
+        "title": event.title,
+        "description": event.description,
+        "date": event.date,
+        "time": event.time,
+        "location": event.location,
+        "category": event.category,
+        "id": event.id,
+        "image": event.image,
+        "price": float(event.price),
+        "attendees": event.attendee_count,
+        "attendeeAvatars": [sized_url(avatar, "thumb") for avatar in attendee_avatars],
+        "organizer": serialize_user_info(event.organizer),
+        "starts_at": event.starts_at,
+        "latitude": event.latitude,
+        "longitude": event.longitude,
+        "distance_km": distance_km,
+        "created_at": event.created_at,
+    }
+
+def serialize_events(
+    events: List[models.event.Event],
+    avatars: Mapping[str, List[str]],
+    distances: Optional[Mapping[str, float]] = None
+) -> List[Dict[str, Any]]:
+    """
+    Serialize a page of events, given `crud.event.get_attendee_avatars` for
+    the page and, for proximity queries, each event's distance in km.
+    """
+    distances = distances or {}
+    return [serialize_event(event, avatars[event.id], distances.get(event.id)) for event in events]
+
+def serialize_community(
+    community: models.community.Community,
+    joined: bool,
+    distance_km: Optional[float] = None
+) -> Dict[str, Any]:
+    """Serialize a community (with its creator loaded) as `schemas.community.Community`."""
+    return {
+        "name": community.name,
+        "description": community.description,
+        "category": community.category,
+        "id": community.id,
+        "image": community.image,
+        "location": community.location,
+        "latitude": community.latitude,
+        "longitude": community.longitude,
+        "distance_km": distance_km,
+        "guidelines": community.guidelines,
+        "members": community.member_count,
+        "creator": serialize_user_info(community.creator),
+        "joined": joined,
+        "created_at": community.created_at,
+    }
+
+def serialize_communities(
+    communities: List[models.community.Community],
+    joined_ids: Collection[str],
+    distances: Optional[Mapping[str, float]] = None
+) -> List[Dict[str, Any]]:
+    """
+    Serialize a page of communities, given the IDs the requesting user has
+    joined and, for proximity queries, each community's distance in km.
+    """
+    distances = distances or {}
+    return [
+        serialize_community(community, community.id in joined_ids, distances.get(community.id))
+        for community in communities
+    ]
+
+def serialize_notification(notification: models.notification.Notification) -> Dict[str, Any]:
+    """Serialize a notification (with its sender loaded) as `schemas.notification.Notification`."""
+    sender = notification.sender if notification.sender_id else None
+    return {
+        "id": notification.id,
+        "message": notification.message,
+        "sender": sender.name if sender else None,
+        "avatar": sender.avatar if sender else None,
+        "time": notification.updated_at.strftime("%Y-%m-%d %H:%M:%S"),
+        "read": notification.read,
+        "notification_type": notification.notification_type,
+        "reference_id": notification.reference_id,
+        "actor_count": notification.actor_count,
+    }
+
+def serialize_notifications(notifications: List[models.notification.Notification]) -> List[Dict[str, Any]]:
+    """Serialize a page of notifications."""
+    return [serialize_notification(notification) for notification in notifications]
+
+def notification_resume_id(updated_at: datetime, notification_id: str) -> str:
+    """
+    The ID of the live update for a version of a notification, which a
+    reconnecting client resumes after. Each update gets a new one.
+    """
+    return encode_cursor(updated_at, notification_id)
+
+def serialize_notification_message(notification: models.notification.Notification) -> Dict[str, Any]:
+    """Wrap a notification (with its sender loaded) as a live update (see `app.utils.pubsub`)."""
+    return {
+        "event": "notification",
+        "id": notification_resume_id(notification.updated_at, notification.id),
+        "data": serialize_notification(notification),
+    }
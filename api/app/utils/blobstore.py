@@ -0,0 +1,110 @@
+import os
+import tempfile
+from abc import ABC, abstractmethod
+from typing import Optional
+
+from . import metrics
+
+# Directory the filesystem blob store keeps blobs under
+BLOB_STORE_DIR = os.getenv("BLOB_STORE_DIR", "./blobs")
+
+class BlobStore(ABC):
+    """
+    Immutable blobs under caller-chosen keys, shaped after S3's object API
+    (put, get, head, delete) so a bucket-backed store can replace the
+    filesystem one with `set_blob_store`.
+
+    Keys are content-addressed by callers, so putting an existing key is a
+    no-op and a blob never changes once stored.
+    """
+
+    @abstractmethod
+    def put(self, key: str, data: bytes) -> None:
+        """Store a blob under `key`, unless one is already stored there."""
+
+    @abstractmethod
+    def get(self, key: str) -> Optional[bytes]:
+        """A blob's contents, or None when there is none under `key`."""
+
+    @abstractmethod
+    def head(self, key: str) -> Optional[int]:
+        """A blob's size in bytes, or None when there is none under `key`."""
+
+    @abstractmethod
+    def delete(self, key: str) -> None:
+        """Remove a blob, if there is one."""
+
+    def local_path(self, key: str) -> Optional[str]:
+        """
+        A file holding the blob, for stores that keep blobs on the local
+        filesystem, so it can be served without reading it into memory.
+        """
+        return None
+
+class FileSystemBlobStore(BlobStore):
+    """Blobs as files under a directory, fanned out by the first two characters of their key."""
+
+    def __init__(self, root: str = BLOB_STORE_DIR):
+        self.root = root
+
+    def _path(self, key: str) -> str:
+        if not key or "/" in key or "\\" in key or key.startswith("."):
+            raise ValueError(f"Invalid blob key: {key!r}")
+        return os.path.join(self.root, key[:2], key)
+
+    def put(self, key: str, data: bytes) -> None:
+        path = self._path(key)
+        if os.path.exists(path):
+            metrics.increment("blobs.deduplicated")
+            return
+        directory = os.path.dirname(path)
+        os.makedirs(directory, exist_ok=True)
+
+        # Write to a temporary file and rename it into place, so readers
+        # never see a partly written blob
+        descriptor, temporary = tempfile.mkstemp(dir=directory, prefix=".")
+        try:
+            with os.fdopen(descriptor, "wb") as blob:
+                blob.write(data)
+                blob.flush()
+                os.fsync(blob.fileno())
+            os.replace(temporary, path)
+        except BaseException:
+            os.unlink(temporary)
+            raise
+        metrics.increment("blobs.stored")
+        metrics.increment("blobs.bytes_stored", len(data))
+
+    def get(self, key: str) -> Optional[bytes]:
+        try:
+            with open(self._path(key), "rb") as blob:
+                return blob.read()
+        except FileNotFoundError:
+            return None
+
+    def head(self, key: str) -> Optional[int]:
+        try:
+            return os.path.getsize(self._path(key))
+        except FileNotFoundError:
+            return None
+
+    def delete(self, key: str) -> None:
+        try:
+            os.unlink(self._path(key))
+        except FileNotFoundError:
+            pass
+
+    def local_path(self, key: str) -> Optional[str]:
+        path = self._path(key)
+        return path if os.path.exists(path) else None
+
+_store: BlobStore = FileSystemBlobStore()
+
+def get_blob_store() -> BlobStore:
+    """The blob store in use."""
+    return _store
+
+def set_blob_store(store: BlobStore) -> None:
+    """Replace the blob store, e.g. with one backed by an S3-compatible bucket. Call at startup."""
+    global _store
+    _store = store
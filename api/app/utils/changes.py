@@ -0,0 +1,216 @@
+import asyncio
+import logging
+import os
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, NamedTuple, Optional, Tuple, Union
+
+from sqlalchemy import Select, delete, exists, func, insert, literal, select
+from sqlalchemy.orm import Session, aliased
+from starlette.concurrency import run_in_threadpool
+
+from .. import models
+from ..database import SessionLocal
+from . import metrics
+from .dates import as_utc
+from .sql import conflict_insert
+
+logger = logging.getLogger(__name__)
+
+# Kinds of change logged: events and communities are shared; memberships (a
+# community joined) and notifications are private to their user
+KINDS = ("event", "community", "membership", "notification")
+
+# Days changes are kept; a client whose cursor is older is told to refetch its lists
+CHANGE_LOG_RETENTION_DAYS = int(os.getenv("CHANGE_LOG_RETENTION_DAYS", "30"))
+
+# Seconds a change is held back from sync. IDs are taken at insert but
+# become visible at commit, so a change committing late could otherwise
+# land behind a cursor already handed out
+SETTLE_SECONDS = float(os.getenv("CHANGE_LOG_SETTLE_SECONDS", "2"))
+
+# Rows examined per transaction during compaction, and the pause between
+# transactions that lets request writes take the write lock
+COMPACT_CHUNK = int(os.getenv("CHANGE_LOG_COMPACT_CHUNK", "1000"))
+COMPACT_PAUSE_SECONDS = float(os.getenv("CHANGE_LOG_COMPACT_PAUSE_SECONDS", "0.05"))
+
+# Seconds between compactions run by the server; 0 leaves compaction to
+# `python -m app.utils.changes`, e.g. from cron
+COMPACT_INTERVAL_SECONDS = int(os.getenv("CHANGE_LOG_COMPACT_INTERVAL_SECONDS", "3600"))
+
+# The `collection_versions` row holding the last change ID dropped for age;
+# cursors before it may have missed deletions
+HORIZON = "change_log.horizon"
+
+# (entity ID, user ID) pairs, given as a list or a SELECT of the two columns
+Entities = Union[List[Tuple[str, Optional[str]]], Select]
+
+class ChangePage(NamedTuple):
+    """A page of the log: the latest change to each entity on it, in log order."""
+    changes: List[models.change.Change]
+    cursor: int
+    has_more: bool
+    reset: bool
+
+def record(db: Session, kind: str, entities: Entities, deleted: bool = False) -> None:
+    """
+    Log changes of `kind` to `entities`, pairs of an entity ID and the user
+    the change is private to, None for shared entities. `deleted` marks
+    deletions, and memberships ended. Call just before committing.
+    """
+    table = models.change.Change.__table__
+    now = datetime.now(timezone.utc)
+    if isinstance(entities, list):
+        if entities:
+            db.execute(insert(table), [
+                {"kind": kind, "entity_id": entity_id, "user_id": user_id, "deleted": deleted, "created_at": now}
+                for entity_id, user_id in entities
+            ])
+        return
+
+    source = entities.subquery()
+    entity_id, user_id = source.c
+    db.execute(insert(table).from_select(
+        ["kind", "entity_id", "user_id", "deleted", "created_at"],
+        select(literal(kind), entity_id, user_id, literal(deleted), literal(now)).select_from(source)
+    ))
+
+def horizon(db: Session) -> int:
+    """The last change ID dropped for age; cursors before it must refetch their lists."""
+    CollectionVersion = models.version.CollectionVersion
+    return db.scalar(select(CollectionVersion.version).where(CollectionVersion.name == HORIZON)) or 0
+
+def head(db: Session) -> int:
+    """The ID of the latest change, or of the last one compacted away from an emptied log."""
+    return max(db.scalar(select(func.max(models.change.Change.id))) or 0, horizon(db))
+
+def read(db: Session, user_id: str, since: int, limit: int, now: Optional[datetime] = None) -> ChangePage:
+    """
+    The changes a user syncs after the `since` change ID: those to shared
+    entities and their own, up to `limit` log rows. A `since` behind the
+    horizon gives an empty page with `reset` set and the current head as cursor.
+    """
+    Change = models.change.Change
+    if since < horizon(db):
+        return ChangePage([], head(db), False, True)
+
+    # Merge the shared and the user's own changes in log order, one index
+    # range each
+    rows = []
+    for owner in (Change.user_id.is_(None), Change.user_id == user_id):
+        rows += db.scalars(select(Change).where(owner, Change.id > since).order_by(Change.id).limit(limit + 1))
+    rows.sort(key=lambda change: change.id)
+    has_more = len(rows) > limit
+
+    # Stop before the first unsettled change, leaving it and everything after
+    # for the next sync
+    settled = (now or datetime.now(timezone.utc)) - timedelta(seconds=SETTLE_SECONDS)
+    page = []
+    for change in rows[:limit]:
+        if as_utc(change.created_at) > settled:
+            has_more = False
+            break
+        page.append(change)
+
+    # Only the latest change to each entity matters
+    latest = {(change.kind, change.entity_id): change for change in page}
+    changes = sorted(latest.values(), key=lambda change: change.id)
+    return ChangePage(changes, page[-1].id if page else since, has_more, False)
+
+def _compact_superseded(db: Session) -> int:
+    """Delete changes followed by a later change to the same entity, returning how many."""
+    Change = models.change.Change
+    newer = aliased(Change)
+    removed = 0
+    after = 0
+    while True:
+        ids = list(db.scalars(select(Change.id).where(Change.id > after).order_by(Change.id).limit(COMPACT_CHUNK)))
+        if not ids:
+            break
+        superseded = list(db.scalars(select(Change.id).where(
+            Change.id.in_(ids),
+            exists().where(
+                newer.kind == Change.kind,
+                newer.entity_id == Change.entity_id,
+                newer.user_id.is_not_distinct_from(Change.user_id),
+                newer.id > Change.id
+            )
+        )))
+        if superseded:
+            db.execute(delete(Change).where(Change.id.in_(superseded)))
+        db.commit()
+        removed += len(superseded)
+        after = ids[-1]
+        if len(ids) < COMPACT_CHUNK:
+            break
+        time.sleep(COMPACT_PAUSE_SECONDS)
+    return removed
+
+def _drop_expired(db: Session, cutoff: datetime) -> int:
+    """
+    Delete changes from before `cutoff`, oldest first, moving the horizon
+    past them. Returns how many.
+    """
+    Change = models.change.Change
+    table = models.version.CollectionVersion.__table__
+    removed = 0
+    while True:
+        rows = db.execute(
+            select(Change.id, Change.created_at).where(Change.id > horizon(db)).order_by(Change.id).limit(COMPACT_CHUNK)
+        ).all()
+        expired = []
+        for change_id, created_at in rows:
+            if as_utc(created_at) >= cutoff:
+                break
+            expired.append(change_id)
+        if not expired:
+            break
+
+        db.execute(delete(Change).where(Change.id.in_(expired)))
+        upsert = conflict_insert(db, table).values(name=HORIZON, version=expired[-1])
+        db.execute(upsert.on_conflict_do_update(index_elements=[table.c.name], set_={"version": upsert.excluded.version}))
+        db.commit()
+        removed += len(expired)
+        if len(expired) < COMPACT_CHUNK:
+            break
+        time.sleep(COMPACT_PAUSE_SECONDS)
+    return removed
+
+def compact(db: Session, now: Optional[datetime] = None) -> Dict[str, int]:
+    """
+    Compact the log in COMPACT_CHUNK row transactions: drop changes a later
+    change to the same entity supersedes, which no client needs, then those
+    older than CHANGE_LOG_RETENTION_DAYS. Returns the number of rows removed each way.
+    """
+    now = now or datetime.now(timezone.utc)
+    compacted = {
+        "superseded": _compact_superseded(db),
+        "expired": _drop_expired(db, now - timedelta(days=CHANGE_LOG_RETENTION_DAYS)),
+    }
+    metrics.increment("change_log.superseded_removed", compacted["superseded"])
+    metrics.increment("change_log.expired_removed", compacted["expired"])
+    metrics.increment("change_log.compactions")
+    return compacted
+
+def _compact() -> Dict[str, int]:
+    db = SessionLocal()
+    try:
+        return compact(db)
+    finally:
+        db.close()
+
+async def compact_periodically() -> None:
+    """Compact every COMPACT_INTERVAL_SECONDS, off the event loop, until cancelled."""
+    while True:
+        await asyncio.sleep(COMPACT_INTERVAL_SECONDS)
+        try:
+            compacted = await run_in_threadpool(_compact)
+            logger.info("Compacted the change log: %s", compacted)
+        except Exception:
+            metrics.increment("change_log.compaction_failures")
+            logger.exception("Change log compaction failed")
+
+if __name__ == "__main__":
+    # Run with `python -m app.utils.changes` from the api directory
+    for reason, count in _compact().items():
+        print(f"{reason}: {count:,} removed")
@@ -0,0 +1,70 @@
+from typing import List
+
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+
+from .. import models
+from ..database import SessionLocal
+
+def _count(association, key, owner_column):
+    """Correlated subquery counting association rows for the owning row."""
+    return (
+        select(func.count())
+        .select_from(association)
+        .where(association.c[key] == owner_column)
+        .scalar_subquery()
+    )
+
+def _unread_count(owner_column):
+    """Correlated subquery counting the owning user's unread notifications."""
+    Notification = models.notification.Notification
+    return (
+        select(func.count())
+        .select_from(Notification)
+        .where(Notification.user_id == owner_column, Notification.read == False)
+        .scalar_subquery()
+    )
+
+def reconcile_unread_counts(db: Session, user_ids: List[str]) -> None:
+    """Recompute the unread notification count of the given users. Call before committing."""
+    User = models.user.User
+    db.query(User).filter(User.id.in_(user_ids)).update(
+        {User.unread_notification_count: _unread_count(User.id)},
+        synchronize_session=False
+    )
+
+def reconcile_counters(db: Session) -> None:
+    """
+    Recompute every denormalized counter from the association tables.
+
+    Each counter is rewritten with a single bulk UPDATE, so this is safe to
+    run against a live database to repair drift.
+    """
+    Event = models.event.Event
+    Community = models.community.Community
+    User = models.user.User
+
+    db.query(Event).update({
+        Event.attendee_count: _count(models.user.user_event, "event_id", Event.id),
+        Event.like_count: _count(models.user.user_liked_event, "event_id", Event.id),
+    }, synchronize_session=False)
+
+    db.query(Community).update({
+        Community.member_count: _count(models.user.user_community, "community_id", Community.id),
+    }, synchronize_session=False)
+
+    db.query(User).update({
+        User.attending_count: _count(models.user.user_event, "user_id", User.id),
+        User.community_count: _count(models.user.user_community, "user_id", User.id),
+        User.unread_notification_count: _unread_count(User.id),
+    }, synchronize_session=False)
+
+    db.commit()
+
+if __name__ == "__main__":
+    # Run with `python -m app.utils.counters` from the api directory
+    db = SessionLocal()
+    try:
+        reconcile_counters(db)
+    finally:
+        db.close()
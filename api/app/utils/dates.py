@@ -0,0 +1,62 @@
+from datetime import date, datetime, time, timezone
+from typing import Optional, Union
+
+# Date formats clients have sent in `Event.date`, ISO first
+DATE_FORMATS = ("%Y-%m-%d", "%Y/%m/%d", "%B %d, %Y", "%b %d, %Y", "%m/%d/%Y", "%d.%m.%Y")
+
+# Time formats clients have sent in `Event.time`
+TIME_FORMATS = ("%H:%M", "%H:%M:%S", "%I:%M %p", "%I:%M%p", "%I %p", "%I%p")
+
+def _parse_date(value: str) -> Optional[datetime]:
+    value = value.strip()
+    try:
+        return datetime.fromisoformat(value)
+    except ValueError:
+        pass
+
+    for date_format in DATE_FORMATS:
+        try:
+            return datetime.strptime(value, date_format)
+        except ValueError:
+            continue
+    return None
+
+def _parse_time(value: str) -> Optional[time]:
+    # Ranges like "6:00 PM - 9:00 PM" start at their first time
+    value = value.split(" - ")[0].strip().upper()
+    for time_format in TIME_FORMATS:
+        try:
+            return datetime.strptime(value, time_format).time()
+        except ValueError:
+            continue
+    return None
+
+def parse_event_start(start_date: Optional[str], start_time: Optional[str]) -> Optional[datetime]:
+    """
+    Combine an event's free-form `date` and `time` strings into a UTC timestamp.
+
+    Naive values are taken as UTC. An unparseable time falls back to midnight;
+    an unparseable date returns None.
+    """
+    if not start_date:
+        return None
+
+    starts_at = _parse_date(start_date)
+    if starts_at is None:
+        return None
+
+    # A date that already carries a time of day wins over the time field
+    if starts_at.time() == time.min and start_time:
+        parsed_time = _parse_time(start_time)
+        if parsed_time is not None:
+            starts_at = datetime.combine(starts_at.date(), parsed_time, starts_at.tzinfo)
+
+    return as_utc(starts_at)
+
+def as_utc(value: Union[date, datetime]) -> datetime:
+    """Convert a date (taken as midnight) or datetime to an aware UTC datetime; naive values are taken as UTC."""
+    if not isinstance(value, datetime):
+        value = datetime.combine(value, time.min)
+    if value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value.astimezone(timezone.utc)
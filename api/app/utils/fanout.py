@@ -0,0 +1,151 @@
+import logging
+import os
+import threading
+import uuid
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import datetime, timezone
+from typing import List, Optional, Tuple
+
+from sqlalchemy import insert, select, union
+from sqlalchemy.orm import Session
+
+from .. import models
+from ..database import SessionLocal
+from ..serializers import notification_resume_id, serialize_notification_message
+from . import changes, metrics, pubsub
+
+logger = logging.getLogger(__name__)
+
+# Notifications inserted per statement, and committed per transaction, so a
+# large fan-out never holds the write lock for long
+FAN_OUT_CHUNK = int(os.getenv("FAN_OUT_CHUNK", "1000"))
+
+# Fan-outs run off the request in a small pool; one worker keeps them in
+# order and stops them competing with each other for the write lock
+FAN_OUT_WORKERS = int(os.getenv("FAN_OUT_WORKERS", "1"))
+_executor = ThreadPoolExecutor(max_workers=FAN_OUT_WORKERS, thread_name_prefix="notification-fan-out")
+_pending_lock = threading.Lock()
+_pending = 0  # Submitted and not yet finished
+
+# (target, ID) pairs naming who to notify, e.g. ("event_attendees", event_id)
+Target = Tuple[str, str]
+
+def _target_users(target: str, target_id: str):
+    """A SELECT of the user IDs in a target: "community_members", "event_attendees" or "event_likers"."""
+    if target == "community_members":
+        user_community = models.user.user_community
+        return select(user_community.c.user_id).where(user_community.c.community_id == target_id)
+    if target == "event_attendees":
+        user_event = models.user.user_event
+        return select(user_event.c.user_id).where(user_event.c.event_id == target_id)
+    if target == "event_likers":
+        user_liked_event = models.user.user_liked_event
+        return select(user_liked_event.c.user_id).where(user_liked_event.c.event_id == target_id)
+    raise ValueError(f"Unknown fan-out target: {target}")
+
+def recipients(db: Session, targets: List[Target], sender_id: Optional[str] = None) -> List[str]:
+    """IDs of the users in any of `targets` who have notifications enabled, except the sender."""
+    User = models.user.User
+    members = union(*(_target_users(target, target_id) for target, target_id in targets)).subquery()
+    query = select(User.id).where(User.id.in_(select(members.c.user_id)), User.notifications_enabled.isnot(False))
+    if sender_id:
+        query = query.where(User.id != sender_id)
+    return list(db.scalars(query))
+
+def fan_out(
+    db: Session,
+    targets: List[Target],
+    message: str,
+    notification_type: str,
+    sender_id: Optional[str] = None,
+    reference_id: Optional[str] = None
+) -> int:
+    """
+    Notify every recipient of `targets`, inserting FAN_OUT_CHUNK rows per
+    statement and committing each chunk before pushing it to open streams.
+    Returns the number of notifications.
+    """
+    Notification = models.notification.Notification
+    user_ids = recipients(db, targets, sender_id)
+    
+    # Every notification reads the same apart from its ID and recipient
+    sender = db.get(models.user.User, sender_id) if sender_id else None
+    for start in range(0, len(user_ids), FAN_OUT_CHUNK):
+        created_at = datetime.now(timezone.utc)
+        rows = [
+            {
+                "id": str(uuid.uuid4()),
+                "user_id": user_id,
+                "sender_id": sender_id,
+                "message": message,
+                "notification_type": notification_type,
+                "reference_id": reference_id,
+                "read": False,
+                "actor_count": 1,
+                "created_at": created_at,
+                "updated_at": created_at,
+            }
+            for user_id in user_ids[start:start + FAN_OUT_CHUNK]
+        ]
+        db.execute(insert(Notification.__table__), rows)
+        db.query(models.user.User).filter(models.user.User.id.in_([row["user_id"] for row in rows])).update(
+            {
+                models.user.User.unread_notification_count: models.user.User.unread_notification_count + 1,
+                models.user.User.notifications_version: models.user.User.notifications_version + 1,
+            },
+            synchronize_session=False
+        )
+        changes.record(db, "notification", [(row["id"], row["user_id"]) for row in rows])
+        db.commit()
+        
+        template = serialize_notification_message(Notification(**rows[0], sender=sender))
+        for row in rows:
+            pubsub.publish(
+                pubsub.user_channel(row["user_id"]),
+                {
+                    **template,
+                    "id": notification_resume_id(created_at, row["id"]),
+                    "data": {**template["data"], "id": row["id"]},
+                }
+            )
+    return len(user_ids)
+
+def _run(*args) -> int:
+    """Fan out in a session of its own, inside the pool."""
+    global _pending
+    db = SessionLocal()
+    try:
+        count = fan_out(db, *args)
+        metrics.increment("notifications.fanned_out", count)
+        return count
+    except Exception:
+        metrics.increment("notifications.fan_out_failures")
+        logger.exception("Notification fan-out failed")
+        raise
+    finally:
+        db.close()
+        with _pending_lock:
+            _pending -= 1
+
+def submit(
+    targets: List[Target],
+    message: str,
+    notification_type: str,
+    sender_id: Optional[str] = None,
+    reference_id: Optional[str] = None
+) -> Future:
+    """
+    Queue a fan-out and return at once. Call after committing whatever the
+    notifications refer to.
+    """
+    global _pending
+    with _pending_lock:
+        _pending += 1
+    return _executor.submit(_run, targets, message, notification_type, sender_id, reference_id)
+
+def queue_depth() -> int:
+    """Number of fan-outs queued or running."""
+    with _pending_lock:
+        return _pending
+
+metrics.register_gauge("notification_fan_out.queue_depth", queue_depth)
@@ -0,0 +1,80 @@
+import os
+import sys
+import tempfile
+import time
+
+from sqlalchemy import create_engine, delete
+from sqlalchemy.orm import sessionmaker
+
+from .. import crud, models
+from ..database import Base
+from . import fanout
+
+# Community members notified, and how many of them the one-row-per-commit
+# baseline is timed on (it is extrapolated from there)
+RECIPIENT_COUNT = 100_000
+BASELINE_COUNT = 2_000
+INSERT_BATCH = 50_000
+
+# Chunk sizes timed for the batched fan-out
+CHUNK_SIZES = (100, 1000, 5000)
+
+def populate(engine, count: int) -> None:
+    """Insert `count` members of one community, bypassing the ORM; every tenth has notifications disabled."""
+    with engine.begin() as connection:
+        connection.exec_driver_sql(
+            "INSERT INTO users (id, email, password, name, attending_count, community_count) "
+            "VALUES ('organizer', 'organizer@example.com', '', 'Organizer', 0, 0)"
+        )
+        connection.exec_driver_sql(
+            "INSERT INTO communities (id, name, description, category, creator_id, member_count) "
+            "VALUES ('community', 'Community', '', 'music', 'organizer', 0)"
+        )
+        for start in range(0, count, INSERT_BATCH):
+            ids = [f"user-{i:07d}" for i in range(start, min(start + INSERT_BATCH, count))]
+            connection.exec_driver_sql(
+                "INSERT INTO users (id, email, password, name, notifications_enabled, attending_count, community_count) "
+                "VALUES (?, ?, '', 'Member', ?, 0, 1)",
+                [(user_id, f"{user_id}@example.com", int(user_id[-1]) != 0) for user_id in ids]
+            )
+            connection.exec_driver_sql(
+                "INSERT INTO user_community (user_id, community_id) VALUES (?, 'community')",
+                [(user_id,) for user_id in ids]
+            )
+        connection.exec_driver_sql("ANALYZE")
+
+if __name__ == "__main__":
+    # Run with `python -m app.utils.fanout_benchmark [recipient count]` from the api directory
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else RECIPIENT_COUNT
+    target = [("community_members", "community")]
+    with tempfile.TemporaryDirectory() as directory:
+        engine = create_engine(f"sqlite:///{os.path.join(directory, 'fanout.db')}")
+        Base.metadata.create_all(bind=engine)
+        populate(engine, count)
+
+        db = sessionmaker(bind=engine, autoflush=False)()
+        try:
+            user_ids = fanout.recipients(db, target, "organizer")
+            print(f"{len(user_ids):,} of {count:,} members have notifications enabled")
+
+            # One INSERT and commit per recipient, as create_notification does
+            sample = user_ids[:BASELINE_COUNT]
+            started = time.perf_counter()
+            for user_id in sample:
+                crud.notification.create_notification(db, user_id, "posted a new event", "event", "organizer", "event")
+            rate = len(sample) / (time.perf_counter() - started)
+            print(f"    create_notification per row   {rate:10,.0f} rows/s   ~{len(user_ids) / rate:6.1f} s for all")
+            db.execute(delete(models.notification.Notification))
+            db.commit()
+
+            for chunk in CHUNK_SIZES:
+                fanout.FAN_OUT_CHUNK = chunk
+                started = time.perf_counter()
+                fanout.fan_out(db, target, "posted a new event", "event", "organizer", "event")
+                elapsed = time.perf_counter() - started
+                print(f"    fan_out, {chunk:5} per chunk     {len(user_ids) / elapsed:10,.0f} rows/s   {elapsed:7.1f} s for all")
+                db.execute(delete(models.notification.Notification))
+                db.commit()
+        finally:
+            db.close()
+            engine.dispose()
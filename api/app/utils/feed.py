@@ -0,0 +1,370 @@
+import logging
+import os
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Set
+
+from sqlalchemy import delete, distinct, func, insert, or_, select
+from sqlalchemy.orm import Session, aliased
+
+from .. import models
+from ..database import SessionLocal
+from . import metrics
+from .dates import as_utc
+
+logger = logging.getLogger(__name__)
+
+# Candidates kept per user
+FEED_SIZE = 200
+
+# Score contributions. Recency adds one point per RECENCY_SECONDS of
+# creation time, so a newer event outranks an older one with the same
+# signals, and stored scores never need to decay.
+INTEREST_WEIGHT = 3.0
+COMMUNITY_WEIGHT = 4.0
+FRIEND_WEIGHT = 1.0
+FRIEND_CAP = 5
+RECENCY_SECONDS = 3 * 24 * 60 * 60
+
+# Feeds older than this are recomputed when next read, to pick up events
+# that matched no signal when they were created
+FEED_MAX_AGE = timedelta(hours=1)
+
+# Signal-matched events scored per full refresh, newest first
+CANDIDATE_LIMIT = 1000
+
+# Users rescored per statement, and per transaction off the request, when
+# an event changes
+_CHUNK = 500
+
+# Rescoring after an event or attendance change runs off the request in a
+# small pool; one worker keeps the jobs in order and stops them competing
+# with each other for the write lock
+FEED_WORKERS = int(os.getenv("FEED_WORKERS", "1"))
+_executor = ThreadPoolExecutor(max_workers=FEED_WORKERS, thread_name_prefix="feed-rescore")
+_pending_lock = threading.Lock()
+_pending = 0  # Submitted and not yet finished
+
+def score_event(event, interests: Set[str], community_ids: Set[str], friends_attending: int) -> float:
+    """
+    Score an event (anything with `category`, `community_id` and
+    `created_at`) for a user with the given interest keys and communities,
+    of whose fellow members `friends_attending` attend it.
+    """
+    score = as_utc(event.created_at).timestamp() / RECENCY_SECONDS
+    if event.category and models.interest.Interest.key_for(event.category) in interests:
+        score += INTEREST_WEIGHT
+    if event.community_id and event.community_id in community_ids:
+        score += COMMUNITY_WEIGHT
+    score += FRIEND_WEIGHT * min(friends_attending, FRIEND_CAP)
+    return score
+
+def _friends(user_id: str):
+    """
+    A SELECT of the users who share a community with `user_id`.
+
+    There is no explicit friendship; fellow community members stand in for it.
+    """
+    member = models.user.user_community.alias("member")
+    friend = models.user.user_community.alias("friend")
+    return (
+        select(friend.c.user_id)
+        .select_from(member.join(friend, friend.c.community_id == member.c.community_id))
+        .where(member.c.user_id == user_id, friend.c.user_id != user_id)
+    )
+
+def _interested_in(category: str):
+    """A SELECT of the users with an interest matching `category`."""
+    user_interest = models.user.user_interest
+    Interest = models.interest.Interest
+    return (
+        select(user_interest.c.user_id)
+        .join(Interest, Interest.id == user_interest.c.interest_id)
+        .where(Interest.key == Interest.key_for(category))
+    )
+
+def _scored_columns():
+    Event = models.event.Event
+    return select(Event.id, Event.category, Event.community_id, Event.created_at)
+
+def _trim(db: Session, user_ids: List[str]) -> None:
+    """Drop all but the best FEED_SIZE items of each user's feed."""
+    FeedItem = models.feed.FeedItem
+    ranked = aliased(FeedItem)
+    cutoff = (
+        select(ranked.score)
+        .where(ranked.user_id == FeedItem.user_id)
+        .order_by(ranked.score.desc())
+        .offset(FEED_SIZE - 1)
+        .limit(1)
+        .scalar_subquery()
+    )
+    db.execute(delete(FeedItem).where(FeedItem.user_id.in_(user_ids), FeedItem.score < cutoff))
+
+def refresh_user(db: Session, user_id: str) -> None:
+    """Recompute a user's whole feed. Call before committing."""
+    Event = models.event.Event
+    FeedItem = models.feed.FeedItem
+    Interest = models.interest.Interest
+    user_event = models.user.user_event
+    user_community = models.user.user_community
+    user_interest = models.user.user_interest
+
+    user = db.get(models.user.User, user_id)
+    if user is None:
+        return
+
+    now = datetime.now(timezone.utc)
+    interests = set(db.scalars(
+        select(Interest.key)
+        .join(user_interest, user_interest.c.interest_id == Interest.id)
+        .where(user_interest.c.user_id == user_id)
+    ))
+    community_ids = set(db.scalars(select(user_community.c.community_id).where(user_community.c.user_id == user_id)))
+
+    # Upcoming events the user's fellow community members attend, most attended first
+    friend_counts: Dict[str, int] = dict(db.execute(
+        select(user_event.c.event_id, func.count(distinct(user_event.c.user_id)).label("friends"))
+        .join(Event, Event.id == user_event.c.event_id)
+        .where(user_event.c.user_id.in_(_friends(user_id)), Event.starts_at >= now)
+        .group_by(user_event.c.event_id)
+        .order_by(func.count(distinct(user_event.c.user_id)).desc())
+        .limit(CANDIDATE_LIMIT)
+    ).all())
+
+    # Upcoming events matching any signal, then the newest upcoming events to
+    # fill the feed of users with few signals
+    upcoming = _scored_columns().where(Event.starts_at >= now, Event.organizer_id != user_id)
+    signals = []
+    if interests:
+        signals.append(func.lower(func.trim(Event.category)).in_(interests))
+    if community_ids:
+        signals.append(Event.community_id.in_(community_ids))
+    if friend_counts:
+        signals.append(Event.id.in_(list(friend_counts)))
+
+    candidates = {}
+    if signals:
+        matched = upcoming.where(or_(*signals)).order_by(Event.created_at.desc()).limit(CANDIDATE_LIMIT)
+        candidates.update((event.id, event) for event in db.execute(matched))
+    newest = upcoming.order_by(Event.created_at.desc()).limit(FEED_SIZE)
+    for event in db.execute(newest):
+        candidates.setdefault(event.id, event)
+
+    # Keep the best FEED_SIZE, replacing the user's previous feed
+    scored = sorted(
+        (
+            (score_event(event, interests, community_ids, friend_counts.get(event.id, 0)), event.id)
+            for event in candidates.values()
+        ),
+        reverse=True
+    )[:FEED_SIZE]
+    db.execute(delete(FeedItem).where(FeedItem.user_id == user_id))
+    if scored:
+        db.execute(
+            insert(FeedItem),
+            [{"user_id": user_id, "event_id": event_id, "score": score} for score, event_id in scored]
+        )
+    user.feed_refreshed_at = now
+
+def is_stale(user: models.user.User) -> bool:
+    """Whether a user's feed is missing or older than FEED_MAX_AGE."""
+    if user.feed_refreshed_at is None:
+        return True
+    return as_utc(user.feed_refreshed_at) < datetime.now(timezone.utc) - FEED_MAX_AGE
+
+def user_changed(db: Session, user_id: str) -> None:
+    """
+    Recompute the feed of a user whose interests or memberships changed, if
+    it has been computed. Call before committing the change.
+    """
+    user = db.get(models.user.User, user_id)
+    if user is not None and user.feed_refreshed_at is not None:
+        refresh_user(db, user_id)
+
+def _rescore(db: Session, event: models.event.Event, users, commit: bool = False) -> None:
+    """
+    Rescore an event for `users` (rows with an `id`), pushing it into or out
+    of their feeds. `commit` commits after each chunk of users.
+    """
+    FeedItem = models.feed.FeedItem
+    user_event = models.user.user_event
+    user_community = models.user.user_community
+
+    event_id = event.id
+    users = list(users)
+    for start in range(0, len(users), _CHUNK):
+        chunk = users[start:start + _CHUNK]
+        user_ids = [user.id for user in chunk]
+
+        # Matching interests, membership of the event's community, and
+        # attending fellow members
+        interested = set(db.scalars(
+            _interested_in(event.category).where(models.user.user_interest.c.user_id.in_(user_ids))
+        ))
+        members: Set[str] = set()
+        if event.community_id:
+            members = set(db.scalars(
+                select(user_community.c.user_id).where(
+                    user_community.c.community_id == event.community_id,
+                    user_community.c.user_id.in_(user_ids)
+                )
+            ))
+        member = user_community.alias("member")
+        friend = user_community.alias("friend")
+        friend_counts = dict(db.execute(
+            select(member.c.user_id, func.count(distinct(user_event.c.user_id)))
+            .select_from(
+                member.join(friend, friend.c.community_id == member.c.community_id)
+                .join(user_event, user_event.c.user_id == friend.c.user_id)
+            )
+            .where(
+                user_event.c.event_id == event_id,
+                member.c.user_id.in_(user_ids),
+                friend.c.user_id != member.c.user_id
+            )
+            .group_by(member.c.user_id)
+        ).all())
+
+        rows = [
+            {
+                "user_id": user.id,
+                "event_id": event_id,
+                "score": score_event(
+                    event,
+                    {models.interest.Interest.key_for(event.category)} if user.id in interested else set(),
+                    {event.community_id} if user.id in members else set(),
+                    friend_counts.get(user.id, 0)
+                ),
+            }
+            for user in chunk
+        ]
+        db.execute(delete(FeedItem).where(FeedItem.event_id == event_id, FeedItem.user_id.in_(user_ids)))
+        db.execute(insert(FeedItem), rows)
+        _trim(db, user_ids)
+        if commit:
+            db.commit()
+
+def _materialized_users():
+    """A query over the IDs of users whose feed has been computed."""
+    User = models.user.User
+    return select(User.id).where(User.feed_refreshed_at.isnot(None))
+
+def index_event(db: Session, event: models.event.Event, commit: bool = False) -> None:
+    """
+    Push a new or changed event into the feeds it belongs in: those of its
+    community's members, of users interested in its category, and of users
+    who already have it. `commit` commits after each chunk of users.
+    """
+    FeedItem = models.feed.FeedItem
+    User = models.user.User
+
+    # Events that already started drop out of every feed
+    if event.starts_at is None or as_utc(event.starts_at) < datetime.now(timezone.utc):
+        remove_event(db, event.id)
+        if commit:
+            db.commit()
+        return
+
+    signals = [
+        User.id.in_(select(FeedItem.user_id).where(FeedItem.event_id == event.id)),
+        User.id.in_(_interested_in(event.category)),
+    ]
+    if event.community_id:
+        user_community = models.user.user_community
+        signals.append(User.id.in_(
+            select(user_community.c.user_id).where(user_community.c.community_id == event.community_id)
+        ))
+    users = db.execute(_materialized_users().where(User.id != event.organizer_id, or_(*signals)))
+    _rescore(db, event, users, commit)
+
+def attendance_changed(db: Session, event_id: str, user_id: str, commit: bool = False) -> None:
+    """
+    Rescore an event for the fellow community members of a user who started
+    or stopped attending it. `commit` commits after each chunk of users.
+    """
+    User = models.user.User
+    event = db.get(models.event.Event, event_id)
+    if event is None or event.starts_at is None or as_utc(event.starts_at) < datetime.now(timezone.utc):
+        return
+
+    users = db.execute(
+        _materialized_users().where(User.id != event.organizer_id, User.id.in_(_friends(user_id)))
+    )
+    _rescore(db, event, users, commit)
+
+def _index_event_by_id(db: Session, event_id: str, commit: bool) -> None:
+    # An event deleted since it was queued already left every feed
+    event = db.get(models.event.Event, event_id)
+    if event is not None:
+        index_event(db, event, commit)
+
+def _run(job, *args) -> None:
+    """Run a rescoring job in a session of its own, inside the pool."""
+    global _pending
+    db = SessionLocal()
+    try:
+        job(db, *args, commit=True)
+        metrics.increment("feed.rescores")
+    except Exception:
+        db.rollback()
+        metrics.increment("feed.rescore_failures")
+        logger.exception("Feed rescoring failed")
+        raise
+    finally:
+        db.close()
+        with _pending_lock:
+            _pending -= 1
+
+def _submit(job, *args) -> Future:
+    global _pending
+    with _pending_lock:
+        _pending += 1
+    return _executor.submit(_run, job, *args)
+
+def submit_event(event_id: str) -> Future:
+    """
+    Queue pushing a new or changed event into the feeds it belongs in, and
+    return at once. Call after committing the event.
+    """
+    return _submit(_index_event_by_id, event_id)
+
+def submit_attendance(event_id: str, user_id: str) -> Future:
+    """
+    Queue rescoring an event for the fellow members of a user who started or
+    stopped attending it, and return at once. Call after committing the change.
+    """
+    return _submit(attendance_changed, event_id, user_id)
+
+def queue_depth() -> int:
+    """Number of rescoring jobs queued or running."""
+    with _pending_lock:
+        return _pending
+
+def remove_event(db: Session, event_id: str) -> None:
+    """Drop an event from every feed. Call before committing the deletion."""
+    FeedItem = models.feed.FeedItem
+    db.execute(delete(FeedItem).where(FeedItem.event_id == event_id))
+
+def remove_user(db: Session, user_id: str) -> None:
+    """Drop a user's feed. Call before committing the deletion."""
+    FeedItem = models.feed.FeedItem
+    db.execute(delete(FeedItem).where(FeedItem.user_id == user_id))
+
+def rebuild_all(db: Session) -> None:
+    """Recompute the feed of every user whose feed has been computed."""
+    user_ids = list(db.scalars(select(models.user.User.id).where(models.user.User.feed_refreshed_at.isnot(None))))
+    for user_id in user_ids:
+        refresh_user(db, user_id)
+        db.commit()
+
+metrics.register_gauge("feed_rescore.queue_depth", queue_depth)
+
+if __name__ == "__main__":
+    # Run with `python -m app.utils.feed` from the api directory
+    db = SessionLocal()
+    try:
+        rebuild_all(db)
+    finally:
+        db.close()
@@ -0,0 +1,375 @@
+import hashlib
+import math
+from abc import ABC, abstractmethod
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+from sqlalchemy import Float, Integer, String, column, or_, select, table, tuple_
+from sqlalchemy.engine import Connection
+from sqlalchemy.orm import Query, Session
+
+from .. import models
+
+# Mean Earth radius, and the length of one degree of latitude
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEGREE = math.pi * EARTH_RADIUS_KM / 180
+
+# Stored geohash length (cells of roughly 5m x 5m)
+GEOHASH_PRECISION = 9
+_GEOHASH_ALPHABET = "0123456789bcdefghjkmnpqrstuvwxyz"
+
+# Most geohash cells a radius query may expand to before using shorter prefixes
+MAX_COVER_CELLS = 16
+
+# Candidates ranked per round trip by `load_nearest`
+MIN_NEAREST_BATCH = 64
+MAX_NEAREST_BATCH = 1000
+
+# Models with a spatial index, by the kind name the index uses
+SPATIAL_MODELS = {
+    "events": models.event.Event,
+    "communities": models.community.Community,
+}
+
+class BoundingBox(NamedTuple):
+    min_lat: float
+    max_lat: float
+    min_lng: float
+    max_lng: float
+
+def parse_point(value: str) -> Tuple[float, float]:
+    """
+    Parse a "lat,lng" string.
+
+    Raises ValueError if it is malformed or out of range.
+    """
+    try:
+        lat, lng = (float(part) for part in value.split(","))
+    except ValueError as exc:
+        raise ValueError("Invalid point") from exc
+
+    if not (-90 <= lat <= 90 and -180 <= lng <= 180):
+        raise ValueError("Invalid point")
+    return lat, lng
+
+def bounding_box(lat: float, lng: float, radius_km: float) -> BoundingBox:
+    """The latitude/longitude box enclosing a circle (clamped at the poles and antimeridian)."""
+    lat_delta = radius_km / KM_PER_DEGREE
+    cos_lat = math.cos(math.radians(lat))
+    lng_delta = 180.0 if cos_lat < 1e-9 else min(180.0, lat_delta / cos_lat)
+    return BoundingBox(
+        max(-90.0, lat - lat_delta),
+        min(90.0, lat + lat_delta),
+        max(-180.0, lng - lng_delta),
+        min(180.0, lng + lng_delta),
+    )
+
+def distance_key(lat_column, lng_column, lat: float, lng: float):
+    """
+    SQL expression ordering rows by distance from (lat, lng).
+
+    Uses the equirectangular approximation, which needs only arithmetic, so
+    it runs on any database; it is accurate to well under 1% at city scale.
+    The value is in squared degrees of latitude; see `distance_km`.
+    """
+    cos_lat = math.cos(math.radians(lat))
+    lat_offset = lat_column - lat
+    lng_offset = (lng_column - lng) * cos_lat
+    return lat_offset * lat_offset + lng_offset * lng_offset
+
+def distance_key_for_radius(radius_km: float) -> float:
+    """The `distance_key` value at `radius_km`."""
+    return (radius_km / KM_PER_DEGREE) ** 2
+
+def distance_km(key: float) -> float:
+    """Convert a `distance_key` value back to kilometres."""
+    return math.sqrt(key) * KM_PER_DEGREE
+
+def encode_geohash(lat: float, lng: float, precision: int = GEOHASH_PRECISION) -> str:
+    """Encode a point as a geohash of `precision` characters."""
+    lat_range, lng_range = [-90.0, 90.0], [-180.0, 180.0]
+    geohash, bits, value, even = [], 0, 0, True
+    while len(geohash) < precision:
+        # Bits alternate between longitude and latitude, longitude first
+        bounds, coordinate = (lng_range, lng) if even else (lat_range, lat)
+        middle = (bounds[0] + bounds[1]) / 2
+        value <<= 1
+        if coordinate >= middle:
+            value |= 1
+            bounds[0] = middle
+        else:
+            bounds[1] = middle
+        even = not even
+        bits += 1
+        if bits == 5:
+            geohash.append(_GEOHASH_ALPHABET[value])
+            bits, value = 0, 0
+    return "".join(geohash)
+
+def _geohash_cell_size(precision: int) -> Tuple[float, float]:
+    """(height, width) in degrees of a geohash cell."""
+    lng_bits = (5 * precision + 1) // 2
+    lat_bits = 5 * precision // 2
+    return 180.0 / 2 ** lat_bits, 360.0 / 2 ** lng_bits
+
+def geohash_cover(box: BoundingBox) -> List[str]:
+    """
+    The geohash prefixes whose cells together cover `box`, using the longest
+    prefixes that need at most MAX_COVER_CELLS cells.
+    """
+    for precision in range(GEOHASH_PRECISION, 0, -1):
+        height, width = _geohash_cell_size(precision)
+        # Cells form a grid anchored at (-90, -180); find the rows and columns the box spans
+        last_row_index = round(180.0 / height) - 1
+        last_column_index = round(360.0 / width) - 1
+        first_row = min(int((box.min_lat + 90) // height), last_row_index)
+        last_row = min(int((box.max_lat + 90) // height), last_row_index)
+        first_column = min(int((box.min_lng + 180) // width), last_column_index)
+        last_column = min(int((box.max_lng + 180) // width), last_column_index)
+        if (last_row - first_row + 1) * (last_column - first_column + 1) > MAX_COVER_CELLS:
+            continue
+
+        # Encode the centre of each cell
+        return [
+            encode_geohash(-90 + (row + 0.5) * height, -180 + (column + 0.5) * width, precision)
+            for row in range(first_row, last_row + 1)
+            for column in range(first_column, last_column + 1)
+        ]
+
+    # The box is too large for any prefix; scan everything
+    return [""]
+
+class SpatialIndex(ABC):
+    """
+    Index of item locations answering nearest-first radius queries.
+
+    The CRUD layer keeps entries in sync inside its own transaction, so an
+    entry commits or rolls back together with the row it describes.
+    """
+
+    @abstractmethod
+    def create(self, connection: Connection) -> bool:
+        """Create the index structures if missing. Returns True if they were created."""
+
+    @abstractmethod
+    def index(self, db: Session, kind: str, item_id: str, lat: Optional[float], lng: Optional[float]) -> None:
+        """Add, move or (with no coordinates) drop an item."""
+
+    @abstractmethod
+    def remove(self, db: Session, kind: str, item_id: str) -> None:
+        """Drop an item, if present."""
+
+    @abstractmethod
+    def nearest(
+        self,
+        db: Session,
+        kind: str,
+        lat: float,
+        lng: float,
+        radius_km: float,
+        limit: int,
+        after: Optional[Tuple[float, str]] = None
+    ) -> List[Tuple[str, float]]:
+        """
+        Return up to `limit` (item ID, distance key) pairs within `radius_km`
+        of (lat, lng), nearest first, starting after `after`.
+        """
+
+def _nearest_statement(id_column, lat_column, lng_column, where, lat, lng, radius_km, limit, after):
+    distance = distance_key(lat_column, lng_column, lat, lng)
+    statement = (
+        select(id_column, distance.label("distance"))
+        .where(*where, distance <= distance_key_for_radius(radius_km))
+        .order_by(distance, id_column)
+        .limit(limit)
+    )
+    if after is not None:
+        statement = statement.where(tuple_(distance, id_column) > tuple_(*after))
+    return statement
+
+class GeohashSpatialIndex(SpatialIndex):
+    """
+    Portable fallback: range scans over the models' indexed `geohash` column,
+    one per prefix covering the query's bounding box. The column is kept up
+    to date by `locate`, so there is nothing else to maintain.
+    """
+
+    def create(self, connection):
+        return False
+
+    def index(self, db, kind, item_id, lat, lng):
+        pass
+
+    def remove(self, db, kind, item_id):
+        pass
+
+    def nearest(self, db, kind, lat, lng, radius_km, limit, after=None):
+        model = SPATIAL_MODELS[kind]
+        # "{" sorts just after "z", the last geohash character
+        cover = or_(*(
+            (model.geohash >= prefix) & (model.geohash < prefix + "{")
+            for prefix in geohash_cover(bounding_box(lat, lng, radius_km))
+        ))
+        statement = _nearest_statement(
+            model.id, model.latitude, model.longitude, [cover], lat, lng, radius_km, limit, after
+        )
+        return [(item_id, key) for item_id, key in db.execute(statement)]
+
+class RTreeSpatialIndex(SpatialIndex):
+    """
+    SQLite R*Tree index, one virtual table per kind.
+
+    R*Tree rows need integer IDs, so each item gets a stable 63-bit hash of
+    its ID, with the ID itself kept in an auxiliary column. Auxiliary columns
+    live outside the tree and cost a lookup each, so candidates are ranked on
+    the tree's own (32-bit, so accurate to about a metre) coordinates and
+    hashed IDs, and only the page kept is mapped back to item IDs. Ties in
+    distance are broken by hashed ID.
+    """
+
+    def _rtree(self, kind: str):
+        return table(
+            f"{kind}_rtree",
+            column("id", Integer),
+            column("min_lat", Float), column("max_lat", Float),
+            column("min_lng", Float), column("max_lng", Float),
+            column("item_id", String),
+        )
+
+    def _rowid(self, item_id: str) -> int:
+        digest = hashlib.blake2b(item_id.encode(), digest_size=8).digest()
+        return int.from_bytes(digest, "big") >> 1
+
+    def create(self, connection: Connection) -> bool:
+        created = False
+        for kind in SPATIAL_MODELS:
+            existing = connection.exec_driver_sql(
+                f"SELECT name FROM sqlite_master WHERE name = '{kind}_rtree'"
+            ).first()
+            if existing is None:
+                connection.exec_driver_sql(
+                    f"CREATE VIRTUAL TABLE {kind}_rtree USING rtree("
+                    "id, min_lat, max_lat, min_lng, max_lng, +item_id)"
+                )
+                created = True
+        return created
+
+    def index(self, db, kind, item_id, lat, lng):
+        rtree = self._rtree(kind)
+        rowid = self._rowid(item_id)
+        db.execute(rtree.delete().where(rtree.c.id == rowid))
+        if lat is not None and lng is not None:
+            db.execute(rtree.insert().values(
+                id=rowid, min_lat=lat, max_lat=lat, min_lng=lng, max_lng=lng, item_id=item_id
+            ))
+
+    def remove(self, db, kind, item_id):
+        rtree = self._rtree(kind)
+        db.execute(rtree.delete().where(rtree.c.id == self._rowid(item_id)))
+
+    def nearest(self, db, kind, lat, lng, radius_km, limit, after=None):
+        rtree = self._rtree(kind)
+        box = bounding_box(lat, lng, radius_km)
+        overlaps = [
+            rtree.c.max_lat >= box.min_lat,
+            rtree.c.min_lat <= box.max_lat,
+            rtree.c.max_lng >= box.min_lng,
+            rtree.c.min_lng <= box.max_lng,
+        ]
+        if after is not None:
+            after = (after[0], self._rowid(after[1]))
+
+        # Rank on the tree alone, then look up the item IDs of the page
+        ranked = _nearest_statement(
+            rtree.c.id,
+            (rtree.c.min_lat + rtree.c.max_lat) / 2,
+            (rtree.c.min_lng + rtree.c.max_lng) / 2,
+            overlaps, lat, lng, radius_km, limit, after
+        ).subquery()
+        item = rtree.alias("item")
+        statement = (
+            select(item.c.item_id, ranked.c.distance)
+            .join(ranked, item.c.id == ranked.c.id)
+            .order_by(ranked.c.distance, ranked.c.id)
+        )
+        return [(item_id, key) for item_id, key in db.execute(statement)]
+
+_GEOHASH_INDEX = GeohashSpatialIndex()
+
+# Spatial index for each database dialect; others use geohash prefixes
+SPATIAL_INDEXES: Dict[str, SpatialIndex] = {
+    "sqlite": RTreeSpatialIndex(),
+}
+
+def _index_for(dialect: str) -> SpatialIndex:
+    return SPATIAL_INDEXES.get(dialect, _GEOHASH_INDEX)
+
+def create_spatial_index(connection: Connection) -> bool:
+    """Create the spatial index if missing. Returns True if it was created and needs a `reindex_all`."""
+    return _index_for(connection.dialect.name).create(connection)
+
+def locate(db: Session, kind: str, item) -> None:
+    """
+    Refresh an item's geohash and spatial index entry from its latitude and
+    longitude. Call before committing the item.
+    """
+    if item.latitude is not None and item.longitude is not None:
+        item.geohash = encode_geohash(item.latitude, item.longitude)
+    else:
+        item.geohash = None
+    _index_for(db.get_bind().dialect.name).index(db, kind, item.id, item.latitude, item.longitude)
+
+def remove(db: Session, kind: str, item_id: str) -> None:
+    """Drop an item from the spatial index. Call before committing the deletion."""
+    _index_for(db.get_bind().dialect.name).remove(db, kind, item_id)
+
+def nearest(
+    db: Session,
+    kind: str,
+    lat: float,
+    lng: float,
+    radius_km: float,
+    limit: int,
+    after: Optional[Tuple[float, str]] = None
+) -> List[Tuple[str, float]]:
+    """Up to `limit` (item ID, distance key) pairs within `radius_km` of (lat, lng), nearest first."""
+    return _index_for(db.get_bind().dialect.name).nearest(db, kind, lat, lng, radius_km, limit, after)
+
+def load_nearest(
+    db: Session,
+    kind: str,
+    query: Query,
+    lat: float,
+    lng: float,
+    radius_km: float,
+    limit: int,
+    after: Optional[Tuple[float, str]] = None
+) -> List[Tuple[object, float]]:
+    """
+    Load up to `limit` (item, distance key) pairs within `radius_km` of
+    (lat, lng), nearest first, starting after `after`, keeping only the items
+    `query` (a filtered query over the kind's model) returns.
+
+    Candidates are ranked in the spatial index and loaded a batch at a time,
+    so a dense area costs one row lookup per item returned rather than one
+    per item in range. Batches grow when filters reject most candidates.
+    """
+    model = SPATIAL_MODELS[kind]
+    batch_size = min(max(limit, MIN_NEAREST_BATCH), MAX_NEAREST_BATCH)
+    results = []
+    while len(results) < limit:
+        matches = nearest(db, kind, lat, lng, radius_km, batch_size, after)
+        items = {item.id: item for item in query.filter(model.id.in_([item_id for item_id, _ in matches]))}
+        results.extend((items[item_id], key) for item_id, key in matches if item_id in items)
+        if len(matches) < batch_size:
+            break
+        # Matches are (item ID, key); the keyset cursor is (key, item ID)
+        after = (matches[-1][1], matches[-1][0])
+        batch_size = min(batch_size * 2, MAX_NEAREST_BATCH)
+    return results[:limit]
+
+def reindex_all(db: Session) -> None:
+    """Rebuild the geohash and spatial index entry of every located item."""
+    for kind, model in SPATIAL_MODELS.items():
+        for item in db.query(model).filter(model.latitude.isnot(None)).yield_per(1000):
+            locate(db, kind, item)
+    db.commit()
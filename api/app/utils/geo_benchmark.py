@@ -0,0 +1,172 @@
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Tuple
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session, sessionmaker
+
+from .. import crud
+from ..database import Base
+from . import geo
+
+# Synthetic events inserted, and radius queries timed per index
+EVENT_COUNT = 1_000_000
+QUERY_COUNT = 200
+INSERT_BATCH = 50_000
+
+# Radius and page size of the timed queries, matching the API defaults
+RADIUS_KM = 10
+PAGE_SIZE = 100
+
+# One event in this many is in the rare category, so a page filtered on it
+# ranks several batches of candidates; an odd count spreads them over
+# clustered and uniform events alike
+RARE_CATEGORY_EVERY = 25
+
+# Events are spread over a Europe-sized box, half of them clustered around
+# city centres so that some queries hit dense areas
+REGION = geo.BoundingBox(36.0, 60.0, -10.0, 30.0)
+CITY_COUNT = 40
+CITY_SPREAD_KM = 15
+
+def _points(count: int, rng: random.Random) -> Iterator[Tuple[float, float]]:
+    cities = [(rng.uniform(REGION.min_lat, REGION.max_lat), rng.uniform(REGION.min_lng, REGION.max_lng)) for _ in range(CITY_COUNT)]
+    spread = CITY_SPREAD_KM / geo.KM_PER_DEGREE
+    for i in range(count):
+        if i % 2:
+            lat, lng = rng.choice(cities)
+            yield rng.gauss(lat, spread), rng.gauss(lng, spread)
+        else:
+            yield rng.uniform(REGION.min_lat, REGION.max_lat), rng.uniform(REGION.min_lng, REGION.max_lng)
+
+def populate(engine, count: int, seed: int = 0) -> List[Tuple[float, float]]:
+    """
+    Insert `count` located events, bypassing the ORM, and index them in both
+    the R*Tree and the geohash column. Returns the city-weighted query centres.
+    """
+    rng = random.Random(seed)
+    rtree = geo.RTreeSpatialIndex()
+    # Every step-th event is a query centre; an odd step alternates between
+    # clustered and uniform events
+    step = max(1, count // QUERY_COUNT) | 1
+    centres = []
+
+    with engine.begin() as connection:
+        geo.create_spatial_index(connection)
+        connection.exec_driver_sql(
+            "INSERT INTO users (id, email, password, name, attending_count, community_count) "
+            "VALUES ('organizer', 'organizer@example.com', '', 'Organizer', 0, 0)"
+        )
+
+        events, entries = [], []
+        for i, (lat, lng) in enumerate(_points(count, rng)):
+            event_id = f"event-{i:07d}"
+            events.append((
+                event_id, f"Event {i}", "", "2024-06-01", "18:00", "2024-06-01 18:00:00",
+                "Somewhere", lat, lng, geo.encode_geohash(lat, lng),
+                "jazz" if i % RARE_CATEGORY_EVERY == 0 else "music", 0.0, "organizer"
+            ))
+            entries.append((rtree._rowid(event_id), lat, lat, lng, lng, event_id))
+            if i % step == 0:
+                centres.append((lat, lng))
+
+            if len(events) == INSERT_BATCH or i == count - 1:
+                connection.exec_driver_sql(
+                    "INSERT INTO events (id, title, description, date, time, starts_at, location, "
+                    "latitude, longitude, geohash, category, price, organizer_id, attendee_count, like_count) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, 0, 0)",
+                    events
+                )
+                connection.exec_driver_sql(
+                    "INSERT INTO events_rtree (id, min_lat, max_lat, min_lng, max_lng, item_id) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    entries
+                )
+                events, entries = [], []
+        connection.exec_driver_sql("ANALYZE")
+
+    return centres[:QUERY_COUNT]
+
+@contextmanager
+def _using(index: geo.SpatialIndex):
+    """Route SQLite proximity queries through `index` for the duration."""
+    previous = geo.SPATIAL_INDEXES["sqlite"]
+    geo.SPATIAL_INDEXES["sqlite"] = index
+    try:
+        yield
+    finally:
+        geo.SPATIAL_INDEXES["sqlite"] = previous
+
+def measure(db: Session, centres: List[Tuple[float, float]], **filters) -> Dict[str, object]:
+    """
+    Median and p95 latency of `get_events_near` with `filters` over
+    `centres`, in milliseconds, and the event IDs each query returned.
+    """
+    timings, found, pages = [], 0, []
+    for lat, lng in centres:
+        started = time.perf_counter()
+        matches = crud.event.get_events_near(db, lat, lng, RADIUS_KM, limit=PAGE_SIZE, **filters)
+        timings.append((time.perf_counter() - started) * 1000)
+        found += len(matches)
+        pages.append([event.id for event, _ in matches])
+        # Drop the loaded events so every query pays for its own loading
+        db.expunge_all()
+
+    timings.sort()
+    return {
+        "median": statistics.median(timings),
+        "p95": timings[int(len(timings) * 0.95) - 1],
+        "rows": found / len(centres),
+        "pages": pages,
+    }
+
+def check_pages(db: Session, centres: List[Tuple[float, float]], pages: List[List[str]], category: str = None) -> int:
+    """
+    Count the pages that differ from the index's whole ranking around their
+    centre, filtered after the fact; a page loaded in several batches that
+    skips or repeats candidates differs.
+    """
+    wrong = 0
+    for (lat, lng), page in zip(centres, pages):
+        ranked = [item_id for item_id, _ in geo.nearest(db, "events", lat, lng, RADIUS_KM, EVENT_COUNT)]
+        if category is not None:
+            ranked = [item_id for item_id in ranked if int(item_id.rsplit("-", 1)[1]) % RARE_CATEGORY_EVERY == 0]
+        wrong += page != ranked[:PAGE_SIZE]
+    return wrong
+
+if __name__ == "__main__":
+    # Run with `python -m app.utils.geo_benchmark [event count]` from the api directory
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else EVENT_COUNT
+    with tempfile.TemporaryDirectory() as directory:
+        engine = create_engine(f"sqlite:///{os.path.join(directory, 'geo.db')}")
+        Base.metadata.create_all(bind=engine)
+
+        started = time.perf_counter()
+        centres = populate(engine, count)
+        print(f"Inserted {count:,} events in {time.perf_counter() - started:.1f} s")
+
+        db = sessionmaker(bind=engine)()
+        try:
+            print(f"get_events_near, {RADIUS_KM} km radius, {PAGE_SIZE} per page, {len(centres)} queries:")
+            for label, filters in (("all", {}), (f"category, 1 in {RARE_CATEGORY_EVERY}", {"category": "jazz"})):
+                for name, index in (("R*Tree", geo.RTreeSpatialIndex()), ("geohash", geo.GeohashSpatialIndex())):
+                    with _using(index):
+                        # Warm the page cache before timing
+                        measure(db, centres[:10], **filters)
+                        result = measure(db, centres, **filters)
+                        wrong = check_pages(db, centres, result["pages"], **filters)
+                    print(
+                        f"    {label:17} {name:8} median {result['median']:6.2f} ms   p95 {result['p95']:6.2f} ms   "
+                        f"{result['rows']:.0f} events/query"
+                    )
+                    if wrong:
+                        print(f"    {wrong} of {len(centres)} pages skipped or repeated events")
+                        sys.exit(1)
+        finally:
+            db.close()
+            engine.dispose()
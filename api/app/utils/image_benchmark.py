@@ -0,0 +1,132 @@
+import asyncio
+import hashlib
+import os
+import resource
+import sys
+import tempfile
+import time
+
+from typing import Optional
+
+from fastapi import FastAPI, Header, Path, Query, Response
+from starlette.concurrency import run_in_threadpool
+
+from ..routes import images as image_routes
+from . import images
+from .blobstore import FileSystemBlobStore, get_blob_store, set_blob_store
+from .responses import etag_matches
+
+# Avatars stored, the sizes timed (a thumbnail as lists show, and an
+# original), and the requests made for them, CONCURRENCY at a time
+AVATAR_COUNT = 200
+AVATAR_SIZES = (("thumb", 24 * 1024), ("original", 512 * 1024))
+REQUEST_COUNT = 4000
+CONCURRENCY = 400
+
+# Bytes per second each simulated client downloads at, so many responses
+# are in flight at once as with real mobile clients
+CLIENT_BYTES_PER_SECOND = 4 * 1024 * 1024
+
+def _rss_mb() -> float:
+    """The process's resident memory now, in MB."""
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except OSError:  # pragma: no cover - not Linux; fall back to the peak so far
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+def _app() -> FastAPI:
+    """
+    The image route, next to a baseline taking the same parameters and
+    headers that reads whole blobs into memory, so the two differ only in
+    how the file is sent.
+    """
+    app = FastAPI()
+    app.include_router(image_routes.router, prefix="/api/images")
+
+    @app.get("/buffered/{key}")
+    async def get_buffered(
+        key: str = Path(..., pattern=images.KEY_PATTERN),
+        size: Optional[str] = Query(None, pattern=f"^({'|'.join(images.IMAGE_SIZES)})$"),
+        range_header: Optional[str] = Header(None, alias="Range"),
+        if_range: Optional[str] = Header(None),
+        if_none_match: Optional[str] = Header(None),
+    ):
+        resolved = await run_in_threadpool(images.resolve, key, size)
+        headers = {"ETag": images.etag(resolved), "Cache-Control": image_routes.IMMUTABLE_CACHE_CONTROL}
+        if etag_matches(if_none_match, headers["ETag"]):
+            return Response(status_code=304, headers=headers)
+        data = await run_in_threadpool(get_blob_store().get, resolved)
+        return Response(data, media_type=images.media_type(resolved), headers=headers)
+
+    return app
+
+async def _get(app: FastAPI, path: str) -> int:
+    """Make one GET through the ASGI app, returning the body size."""
+    received = 0
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        nonlocal received
+        if message["type"] == "http.response.body":
+            body = message.get("body", b"")
+            received += len(body)
+            await asyncio.sleep(len(body) / CLIENT_BYTES_PER_SECOND)
+
+    await app({
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET",
+        "scheme": "http", "path": path, "raw_path": path.encode(), "query_string": b"", "root_path": "",
+        "headers": [], "client": ("127.0.0.1", 50000), "server": ("127.0.0.1", 8000),
+    }, receive, send)
+    return received
+
+async def _run(app: FastAPI, paths, count: int):
+    """Make `count` requests over `paths`, CONCURRENCY at a time, returning (seconds, bytes, peak RSS in MB)."""
+    remaining = iter(range(count))
+    received = 0
+    peak = _rss_mb()
+
+    async def client():
+        nonlocal received
+        for i in remaining:
+            size = await _get(app, paths[i % len(paths)])
+            received += size
+
+    async def sample():
+        nonlocal peak
+        while True:
+            peak = max(peak, _rss_mb())
+            await asyncio.sleep(0.005)
+
+    sampler = asyncio.create_task(sample())
+    started = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(CONCURRENCY)))
+    elapsed = time.perf_counter() - started
+    sampler.cancel()
+    return elapsed, received, peak
+
+if __name__ == "__main__":
+    # Run with `python -m app.utils.image_benchmark [request count]` from the api directory
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else REQUEST_COUNT
+    with tempfile.TemporaryDirectory() as directory:
+        set_blob_store(FileSystemBlobStore(directory))
+        app = _app()
+        print(f"{count:,} requests for {AVATAR_COUNT} avatars, {CONCURRENCY} at a time")
+        for size_name, size in AVATAR_SIZES:
+            keys = []
+            for _ in range(AVATAR_COUNT):
+                data = os.urandom(size)
+                key = f"{hashlib.sha256(data).hexdigest()}.jpg"
+                get_blob_store().put(key, data)
+                keys.append(key)
+
+            # Streamed runs first: memory the buffered run takes is rarely handed back to the OS
+            for name, prefix in (("streamed", "/api/images/"), ("buffered", "/buffered/")):
+                baseline = _rss_mb()
+                elapsed, received, peak = asyncio.run(_run(app, [prefix + key for key in keys], count))
+                print(
+                    f"    {size_name:8} {size // 1024:4} KB {name:9} {count / elapsed:8,.0f} req/s"
+                    f"   {received / elapsed / 2**20:8,.0f} MB/s   peak RSS +{peak - baseline:6,.0f} MB"
+                )
@@ -0,0 +1,202 @@
+import base64
+import binascii
+import hashlib
+import io
+import os
+import re
+from typing import Dict, Optional
+
+from sqlalchemy import select, update
+from sqlalchemy.orm import Session
+
+from .. import models
+from ..database import SessionLocal
+from . import metrics
+from .blobstore import get_blob_store
+
+# Pillow is optional; without it images are stored and served as uploaded,
+# with no thumbnails
+try:
+    from PIL import Image as PILImage, ImageOps
+except ImportError:  # pragma: no cover - depends on the environment
+    PILImage = None
+
+# Largest image accepted, uploaded or as a data URI
+MAX_IMAGE_BYTES = int(os.getenv("MAX_IMAGE_BYTES", str(10 * 1024 * 1024)))
+
+# Where image URLs point: this API by default, or a CDN in front of the blob store
+IMAGE_URL_PREFIX = os.getenv("IMAGE_URL_PREFIX", "/api/images/")
+
+# Resized copies made of each image, by name, bounding box in pixels
+IMAGE_SIZES = {"thumb": 256, "medium": 1024}
+
+# Formats accepted, by file extension; SVG is refused, since it can carry script
+MEDIA_TYPES = {"jpg": "image/jpeg", "png": "image/png", "gif": "image/gif", "webp": "image/webp"}
+_PIL_FORMATS = {"jpg": "JPEG", "png": "PNG", "gif": "GIF", "webp": "WEBP"}
+
+# An image's key: the SHA-256 of its contents and its extension, and for a
+# resized copy the size's name between the two
+KEY_PATTERN = r"^[0-9a-f]{64}(-[a-z]+)?\.(jpg|png|gif|webp)$"
+
+_DATA_URI = re.compile(r"^data:(image/[a-z+.-]+);base64,", re.IGNORECASE)
+
+def sniff(data: bytes) -> Optional[str]:
+    """The extension of the format `data` is in, from its leading bytes, if it's one accepted."""
+    if data.startswith(b"\xff\xd8\xff"):
+        return "jpg"
+    if data.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "png"
+    if data.startswith((b"GIF87a", b"GIF89a")):
+        return "gif"
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+        return "webp"
+    return None
+
+def media_type(key: str) -> str:
+    """The Content-Type of the image under `key`."""
+    return MEDIA_TYPES[key.rsplit(".", 1)[1]]
+
+def sized_key(key: str, size: str) -> str:
+    """The key of an image's copy resized to `size`."""
+    digest, ext = key.split(".", 1)
+    return f"{digest.split('-', 1)[0]}-{size}.{ext}"
+
+def image_url(key: str) -> str:
+    """Where the image under `key` is served from."""
+    return f"{IMAGE_URL_PREFIX}{key}"
+
+def sized_url(url: Optional[str], size: str) -> Optional[str]:
+    """`url` pointing at the copy resized to `size`, for images in the store; other URLs as they are."""
+    if url and url.startswith(IMAGE_URL_PREFIX) and "?" not in url:
+        return f"{url}?size={size}"
+    return url
+
+def etag(key: str) -> str:
+    """A strong ETag for the image under `key`; its contents never change."""
+    return f'"{key.split(".", 1)[0]}"'
+
+def _resize(data: bytes, ext: str, size: int) -> Optional[bytes]:
+    """`data` scaled down to fit a `size` pixel square, or None when it already fits."""
+    with PILImage.open(io.BytesIO(data)) as image:
+        if max(image.size) <= size:
+            return None
+        # Phones store photos sideways with an EXIF rotation, which the copy drops
+        resized = ImageOps.exif_transpose(image)
+        resized.thumbnail((size, size))
+        if ext == "jpg" and resized.mode not in ("RGB", "L"):
+            resized = resized.convert("RGB")
+        options = {"quality": 85} if ext in ("jpg", "webp") else {}
+        output = io.BytesIO()
+        resized.save(output, format=_PIL_FORMATS[ext], **options)
+        return output.getvalue()
+
+def store_image(data: bytes) -> str:
+    """
+    Store an image and its resized copies in the blob store, returning its
+    key. Raises ValueError when `data` isn't an image in an accepted format.
+    """
+    ext = sniff(data)
+    if ext is None:
+        raise ValueError("Unsupported image format")
+    if len(data) > MAX_IMAGE_BYTES:
+        raise ValueError("Image too large")
+    if PILImage is not None:
+        try:
+            with PILImage.open(io.BytesIO(data)) as image:
+                image.verify()
+        except Exception:
+            raise ValueError("Invalid image")
+
+    # Identical images share one key, so storing one again stores nothing
+    store = get_blob_store()
+    key = f"{hashlib.sha256(data).hexdigest()}.{ext}"
+    if store.head(key) is None:
+        if PILImage is not None:
+            for size, pixels in IMAGE_SIZES.items():
+                resized = _resize(data, ext, pixels)
+                if resized is not None:
+                    store.put(sized_key(key, size), resized)
+        # The original goes last, so a stored original always has its copies
+        store.put(key, data)
+        metrics.increment("images.stored")
+    return key
+
+def resolve(key: str, size: Optional[str] = None) -> Optional[str]:
+    """
+    The key to serve for an image at `size`: the resized copy, or the
+    original when it was too small to resize. None when there is no such image.
+    """
+    store = get_blob_store()
+    if size is not None:
+        resized = sized_key(key, size)
+        if store.head(resized) is not None:
+            return resized
+    return key if store.head(key) is not None else None
+
+def decode_data_uri(value: str) -> bytes:
+    """The image in a base64 `data:` URI. Raises ValueError when it isn't one."""
+    match = _DATA_URI.match(value)
+    if match is None:
+        raise ValueError("Not a base64 image data URI")
+    if (len(value) - match.end()) * 3 // 4 > MAX_IMAGE_BYTES:
+        raise ValueError("Image too large")
+    try:
+        return base64.b64decode(value[match.end():], validate=True)
+    except binascii.Error:
+        raise ValueError("Invalid base64 in data URI")
+
+def externalize(value: Optional[str]) -> Optional[str]:
+    """
+    Move an inline `data:` URI image into the blob store, returning its URL
+    to store in its place. Other values, such as URLs, are returned as they are.
+    Raises ValueError for a data URI that doesn't hold an accepted image.
+    """
+    if value is None or value[:5].lower() != "data:":
+        return value
+    return image_url(store_image(decode_data_uri(value)))
+
+# Columns holding image URLs, which older clients filled with data URIs
+IMAGE_COLUMNS = (
+    (models.user.User, "avatar"),
+    (models.event.Event, "image"),
+    (models.community.Community, "image"),
+)
+
+# Rows rewritten per transaction by `migrate_data_uris`
+MIGRATE_CHUNK = 100
+
+def migrate_data_uris(db: Session) -> Dict[str, int]:
+    """
+    Move the data URIs already stored in image columns into the blob store,
+    replacing them with URLs. Values that aren't valid images are cleared.
+    Returns the number of values moved per column.
+    """
+    moved = {}
+    for model, column_name in IMAGE_COLUMNS:
+        column = getattr(model, column_name)
+        name = f"{model.__tablename__}.{column_name}"
+        moved[name] = 0
+        while True:
+            rows = db.execute(
+                select(model.id, column).where(column.like("data:%")).order_by(model.id).limit(MIGRATE_CHUNK)
+            ).all()
+            if not rows:
+                break
+            for row_id, value in rows:
+                try:
+                    url = externalize(value)
+                except ValueError:
+                    url = None
+                db.execute(update(model).where(model.id == row_id).values({column_name: url}))
+            db.commit()
+            moved[name] += len(rows)
+    return moved
+
+if __name__ == "__main__":
+    # Run with `python -m app.utils.images` from the api directory
+    db = SessionLocal()
+    try:
+        for name, count in migrate_data_uris(db).items():
+            print(f"{name}: {count:,} moved")
+    finally:
+        db.close()
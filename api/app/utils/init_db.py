@@ -1,8 +1,144 @@
-from ..database import Base, engine
+from sqlalchemy import inspect, text
+
+from .. import crud, models
+from ..database import Base, SessionLocal, engine
+from .counters import reconcile_counters
+from .dates import parse_event_start
+from . import geo
+from .search import check_backend, create_search_index, reindex_all
+
+# Indexes dropped from the models, which existing databases still have
+REPLACED_INDEXES = (
+    "ix_notifications_user_created_at_id",
+    "ix_notifications_user_read_created_at_id",
+    "ix_notifications_type_created_at",
+    "ix_notifications_user_type_reference_created_at",
+)
+
+def _add_missing_columns() -> set:
+    """
+    Add columns that are declared on the models but missing from existing tables.
+
+    `create_all` only creates missing tables, so columns added to a model later
+    have to be added to databases created by an earlier version. Returns the
+    set of "table.column" names that were added.
+    """
+    inspector = inspect(engine)
+    added = set()
+
+    with engine.begin() as connection:
+        for table in Base.metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                continue
+
+            existing = {column["name"] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing:
+                    continue
+
+                ddl = f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column.type.compile(dialect=engine.dialect)}"
+                if column.server_default is not None:
+                    ddl += f" DEFAULT {column.server_default.arg}"
+                    if not column.nullable:
+                        ddl += " NOT NULL"
+
+                connection.exec_driver_sql(ddl)
+                added.add(f"{table.name}.{column.name}")
+
+    return added
+
+def _backfill_event_start_times() -> None:
+    """Fill `Event.starts_at` from the `date` and `time` strings wherever it is missing."""
+    db = SessionLocal()
+    try:
+        events = db.query(models.event.Event).filter(models.event.Event.starts_at.is_(None))
+        for event in events.yield_per(1000):
+            # Unparseable dates sort as if the event starts when it was created
+            event.starts_at = parse_event_start(event.date, event.time) or event.created_at
+        db.commit()
+    finally:
+        db.close()
+
+def _backfill_notification_update_times() -> None:
+    """Fill `Notification.updated_at` from `created_at` wherever it is missing."""
+    with engine.begin() as connection:
+        connection.execute(text("UPDATE notifications SET updated_at = created_at WHERE updated_at IS NULL"))
+
+def _migrate_interests() -> None:
+    """
+    Copy the comma-separated `users.interests` column of a database created
+    by an earlier version into the interest tag table.
+
+    The old column is left in place, unused.
+    """
+    db = SessionLocal()
+    try:
+        rows = db.execute(text("SELECT id, interests FROM users WHERE interests IS NOT NULL AND interests != ''")).all()
+        for user_id, interests in rows:
+            crud.user.set_user_interests(db, user_id, [interest.strip() for interest in interests.split(",")])
+        db.commit()
+    finally:
+        db.close()
 
 def init_db():
     """
     Initialize the database by creating all tables.
     Call this function when starting the application to ensure all tables exist.
     """
-    Base.metadata.create_all(bind=engine) 
\ No newline at end of file
+    check_backend(engine.dialect.name)
+    added = _add_missing_columns()
+    inspector = inspect(engine)
+    interests_column = inspector.has_table("users") and not inspector.has_table("user_interest") and any(
+        column["name"] == "interests" for column in inspector.get_columns("users")
+    )
+    Base.metadata.create_all(bind=engine)
+    
+    # create_all skips indexes on tables that already exist
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind=engine, checkfirst=True)
+
+    # Drop indexes that later versions replaced
+    with engine.begin() as connection:
+        for name in REPLACED_INDEXES:
+            connection.execute(text(f"DROP INDEX IF EXISTS {name}"))
+
+    # Create the full-text search index, indexing existing rows the first time
+    with engine.begin() as connection:
+        search_index_created = create_search_index(connection)
+    if search_index_created:
+        db = SessionLocal()
+        try:
+            reindex_all(db)
+        finally:
+            db.close()
+
+    # Create the spatial index, indexing located rows the first time
+    with engine.begin() as connection:
+        spatial_index_created = geo.create_spatial_index(connection)
+    if spatial_index_created:
+        db = SessionLocal()
+        try:
+            geo.reindex_all(db)
+        finally:
+            db.close()
+
+    # Move comma-separated interests into the tag table
+    if interests_column:
+        _migrate_interests()
+
+    # Backfill the typed start time added to an existing database
+    if "events.starts_at" in added:
+        _backfill_event_start_times()
+
+    # Backfill the update time added to an existing database
+    if "notifications.updated_at" in added:
+        _backfill_notification_update_times()
+
+    # Backfill denormalized counters added to an existing database
+    if any(name.endswith("_count") for name in added):
+        db = SessionLocal()
+        try:
+            reconcile_counters(db)
+        finally:
+            db.close()
@@ -0,0 +1,149 @@
+import asyncio
+import os
+import statistics
+import sys
+import tempfile
+import time
+from typing import Dict, List
+
+import httpx
+from fastapi import Depends, FastAPI, HTTPException, status
+from sqlalchemy import create_engine
+
+from .. import schemas
+from ..crud.aio import user as user_crud
+from ..database import Base, SessionLocal, get_async_db
+from ..routes import auth as auth_routes
+from ..routes import events as event_routes
+from ..routes import notifications as notification_routes
+from ..routes import users as user_routes
+from . import security
+
+# Seconds each phase runs, clients logging in at once during a storm, and
+# clients probing the other endpoints throughout
+PHASE_SECONDS = 5
+LOGIN_CLIENTS = 16
+PROBE_CLIENTS = 4
+
+# Seconds each probing client waits between requests, like a user scrolling
+PROBE_PAUSE_SECONDS = 0.01
+
+# Events in the probed list
+EVENT_COUNT = 100
+
+# Endpoints probed while logins run: a public list, one resolving the token
+# through the principal cache, and one loading the user row every time
+PROBES = (
+    ("events list", "/api/events/?limit=20"),
+    ("unread count", "/api/notifications/unread-count"),
+    ("profile", "/api/users/me"),
+)
+
+PASSWORD = "benchmark-password"
+
+def _app() -> FastAPI:
+    """The routes probed and the login routes, next to a login that verifies on the event loop as a baseline."""
+    app = FastAPI()
+    app.include_router(auth_routes.router, prefix="/api")
+    app.include_router(user_routes.router, prefix="/api/users")
+    app.include_router(event_routes.router, prefix="/api/events")
+    app.include_router(notification_routes.router, prefix="/api/notifications")
+
+    @app.post("/baseline/login/json")
+    async def login_on_event_loop(login_data: schemas.auth.Login, db=Depends(get_async_db)):
+        user = await user_crud.get_user_by_email(db, email=login_data.email)
+        if not user or not security.verify_password(login_data.password, user.password):
+            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Incorrect email or password")
+        return {"access_token": security.create_access_token(data={"sub": user.id}), "token_type": "bearer"}
+
+    return app
+
+def populate(engine) -> None:
+    """Insert the user who logs in and probes, hashed once, and EVENT_COUNT upcoming events, bypassing the ORM."""
+    with engine.begin() as connection:
+        connection.exec_driver_sql(
+            "INSERT INTO users (id, email, password, name, attending_count, community_count) "
+            "VALUES ('user', 'user@example.com', ?, 'User', 0, 0)",
+            (security.get_password_hash(PASSWORD),)
+        )
+        connection.exec_driver_sql(
+            "INSERT INTO events (id, title, description, date, time, location, category, price, organizer_id, "
+            "attendee_count, starts_at, created_at) "
+            "VALUES (?, 'Event', '', '2099-01-01', '18:00', '', 'music', 0, 'user', 0, '2099-01-01 18:00:00', "
+            "CURRENT_TIMESTAMP)",
+            [(f"event-{i:03d}",) for i in range(EVENT_COUNT)]
+        )
+
+def _percentile(samples: List[float], percent: int) -> float:
+    return statistics.quantiles(samples, n=100)[percent - 1] if len(samples) > 1 else samples[0]
+
+async def run_phase(app: FastAPI, login_path: str = None) -> Dict[str, object]:
+    """
+    Probe PROBES for PHASE_SECONDS while LOGIN_CLIENTS log in through
+    `login_path`, or none when it is None. Returns each probe's latencies in
+    ms, the logins completed, and the deepest the hashing queue got.
+    """
+    token = security.create_access_token(data={"sub": "user"})
+    headers = {"Authorization": f"Bearer {token}"}
+    latencies = {name: [] for name, _ in PROBES}
+    logins = 0
+    deepest_queue = 0
+    deadline = time.perf_counter() + PHASE_SECONDS
+
+    async with httpx.AsyncClient(app=app, base_url="http://benchmark") as client:
+        async def probe(offset: int) -> None:
+            i = offset
+            while time.perf_counter() < deadline:
+                name, path = PROBES[i % len(PROBES)]
+                started = time.perf_counter()
+                response = await client.get(path, headers=headers)
+                response.raise_for_status()
+                latencies[name].append((time.perf_counter() - started) * 1000)
+                i += 1
+                await asyncio.sleep(PROBE_PAUSE_SECONDS)
+
+        async def log_in() -> None:
+            nonlocal logins, deepest_queue
+            while time.perf_counter() < deadline:
+                response = await client.post(login_path, json={"email": "user@example.com", "password": PASSWORD})
+                response.raise_for_status()
+                logins += 1
+                deepest_queue = max(deepest_queue, security.password_hash_queue_depth())
+
+        clients = [probe(offset) for offset in range(PROBE_CLIENTS)]
+        if login_path:
+            clients += [log_in() for _ in range(LOGIN_CLIENTS)]
+        await asyncio.gather(*clients)
+
+    return {"latencies": latencies, "logins": logins, "deepest_queue": deepest_queue}
+
+if __name__ == "__main__":
+    # Run with `python -m app.utils.login_benchmark [seconds per phase]` from the api directory
+    PHASE_SECONDS = float(sys.argv[1]) if len(sys.argv) > 1 else PHASE_SECONDS
+    phases = (
+        ("no logins", None),
+        ("login storm, hashing in the pool", "/api/login/json"),
+        ("login storm, hashing on the event loop", "/baseline/login/json"),
+    )
+    with tempfile.TemporaryDirectory() as directory:
+        engine = create_engine(
+            f"sqlite:///{os.path.join(directory, 'logins.db')}", connect_args={"check_same_thread": False}
+        )
+        Base.metadata.create_all(bind=engine)
+        populate(engine)
+        SessionLocal.configure(bind=engine)
+        app = _app()
+
+        print(
+            f"{PROBE_CLIENTS} clients probing for {PHASE_SECONDS:g} s per phase, against {LOGIN_CLIENTS} clients "
+            f"logging in; {security.PASSWORD_HASH_CONCURRENCY} hashing threads"
+        )
+        for label, login_path in phases:
+            result = asyncio.run(run_phase(app, login_path))
+            print(f"{label}: {result['logins'] / PHASE_SECONDS:,.1f} logins/s, hashing queue up to {result['deepest_queue']}")
+            for name, samples in result["latencies"].items():
+                print(
+                    f"    {name:13} p50 {_percentile(samples, 50):7.1f} ms   p99 {_percentile(samples, 99):7.1f} ms"
+                    f"   ({len(samples):,} requests)"
+                )
+        engine.dispose()
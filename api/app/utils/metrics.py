@@ -0,0 +1,26 @@
+import threading
+from typing import Callable, Dict
+
+# Monotonic counters, e.g. cache hits or rows purged
+_counters: Dict[str, int] = {}
+_counters_lock = threading.Lock()
+
+# Point-in-time values computed on read, e.g. queue depth
+_gauges: Dict[str, Callable[[], float]] = {}
+
+def increment(name: str, value: int = 1) -> None:
+    """Add `value` to a named counter."""
+    with _counters_lock:
+        _counters[name] = _counters.get(name, 0) + value
+
+def register_gauge(name: str, read: Callable[[], float]) -> None:
+    """Register a callable whose value is reported under `name`."""
+    _gauges[name] = read
+
+def snapshot() -> Dict[str, float]:
+    """Current value of every counter and gauge."""
+    with _counters_lock:
+        values = dict(_counters)
+    for name, read in _gauges.items():
+        values[name] = read()
+    return values
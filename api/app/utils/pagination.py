@@ -0,0 +1,48 @@
+import base64
+import json
+from datetime import datetime
+from typing import Any, List, Optional, Tuple
+
+# Response header carrying the cursor for the next page
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+def encode_cursor(sort_value: Any, item_id: str) -> str:
+    """Encode a sort key and ID tiebreaker into an opaque cursor token."""
+    if isinstance(sort_value, datetime):
+        sort_value = sort_value.isoformat()
+
+    payload = json.dumps([sort_value, item_id], separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(payload).decode().rstrip("=")
+
+def decode_cursor(cursor: str) -> Tuple[Any, str]:
+    """
+    Decode a cursor token back into its sort key and ID tiebreaker.
+
+    Raises ValueError if the token is malformed.
+    """
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        sort_value, item_id = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except (ValueError, TypeError) as exc:
+        raise ValueError("Invalid cursor") from exc
+
+    if not isinstance(item_id, str):
+        raise ValueError("Invalid cursor")
+
+    return sort_value, item_id
+
+def decode_datetime_cursor(cursor: str) -> Tuple[datetime, str]:
+    """Decode a cursor whose sort key is a timestamp."""
+    sort_value, item_id = decode_cursor(cursor)
+    if not isinstance(sort_value, str):
+        raise ValueError("Invalid cursor")
+
+    return datetime.fromisoformat(sort_value), item_id
+
+def next_cursor(items: List[Any], sort_attribute: str, limit: int) -> Optional[str]:
+    """Build the cursor for the page after `items`, or None on the last page."""
+    if not items or len(items) < limit:
+        return None
+
+    last = items[-1]
+    return encode_cursor(getattr(last, sort_attribute), last.id)
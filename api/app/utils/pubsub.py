@@ -0,0 +1,161 @@
+import asyncio
+import os
+import threading
+from abc import ABC, abstractmethod
+from typing import Any, Dict, Optional, Set
+
+from . import metrics
+
+# Messages buffered per subscriber. A subscriber that falls this far behind
+# is dropped rather than buffering without bound; it reconnects and resumes
+# from the last message it received.
+SUBSCRIBER_QUEUE_SIZE = int(os.getenv("PUBSUB_QUEUE_SIZE", "256"))
+
+# A message: {"event": name, "id": ID to resume from, "data": JSON-able payload}
+Message = Dict[str, Any]
+
+def user_channel(user_id: str) -> str:
+    """The channel carrying a user's live updates."""
+    return f"user:{user_id}"
+
+class Overflow(Exception):
+    """Raised by `Subscription.get` once the subscriber fell too far behind."""
+
+class Subscription:
+    """
+    One subscriber's bounded queue on a channel, owned by the event loop it
+    was created on. Brokers may deliver to it from any thread.
+    """
+
+    def __init__(self, broker: "Broker", channel: str, maxsize: int = SUBSCRIBER_QUEUE_SIZE):
+        self.broker = broker
+        self.channel = channel
+        self.overflowed = False
+        self._loop = asyncio.get_running_loop()
+        self._queue: "asyncio.Queue[Optional[Message]]" = asyncio.Queue(maxsize)
+        self._closed = False
+
+    def deliver(self, message: Message) -> None:
+        """Queue a message for the subscriber; safe to call from any thread."""
+        try:
+            self._loop.call_soon_threadsafe(self._put, message)
+        except RuntimeError:
+            # The subscriber's loop is gone
+            self.close()
+
+    def _put(self, message: Message) -> None:
+        if self.overflowed:
+            return
+        try:
+            self._queue.put_nowait(message)
+        except asyncio.QueueFull:
+            # Drop the backlog and wake the subscriber so it disconnects
+            self.overflowed = True
+            metrics.increment("pubsub.overflows")
+            while not self._queue.empty():
+                self._queue.get_nowait()
+            self._queue.put_nowait(None)
+
+    async def get(self, timeout: float) -> Optional[Message]:
+        """
+        The next message, or None when `timeout` seconds pass without one.
+        Raises Overflow once messages were dropped.
+        """
+        try:
+            message = await asyncio.wait_for(self._queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+        if message is None:
+            raise Overflow()
+        return message
+
+    def close(self) -> None:
+        """Stop receiving messages. Safe to call more than once."""
+        if not self._closed:
+            self._closed = True
+            self.broker.unsubscribe(self)
+
+    async def __aenter__(self) -> "Subscription":
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        self.close()
+
+class Broker(ABC):
+    """
+    Delivers messages published on a channel to that channel's subscribers.
+
+    The in-process broker only reaches subscribers of the same process. When
+    running several workers, install a broker backed by a shared message bus
+    with `set_broker`; it delivers to local subscribers through
+    `Subscription.deliver`.
+    """
+
+    @abstractmethod
+    def publish(self, channel: str, message: Message) -> None:
+        """Send a message to every subscriber of a channel; safe to call from any thread."""
+
+    @abstractmethod
+    def subscribe(self, channel: str) -> Subscription:
+        """Start receiving a channel's messages; call from the subscriber's event loop."""
+
+    @abstractmethod
+    def unsubscribe(self, subscription: Subscription) -> None:
+        """Stop delivering to a subscription."""
+
+class InProcessBroker(Broker):
+    """Broker for a single process, delivering straight to subscriber queues."""
+
+    def __init__(self):
+        self._subscriptions: Dict[str, Set[Subscription]] = {}
+        self._lock = threading.Lock()
+
+    def publish(self, channel: str, message: Message) -> None:
+        with self._lock:
+            subscriptions = list(self._subscriptions.get(channel, ()))
+        for subscription in subscriptions:
+            subscription.deliver(message)
+
+    def subscribe(self, channel: str) -> Subscription:
+        subscription = Subscription(self, channel)
+        with self._lock:
+            self._subscriptions.setdefault(channel, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        with self._lock:
+            subscriptions = self._subscriptions.get(subscription.channel)
+            if subscriptions is not None:
+                subscriptions.discard(subscription)
+                if not subscriptions:
+                    del self._subscriptions[subscription.channel]
+
+    def subscriber_count(self) -> int:
+        """Number of open subscriptions."""
+        with self._lock:
+            return sum(len(subscriptions) for subscriptions in self._subscriptions.values())
+
+_broker: Broker = InProcessBroker()
+
+def get_broker() -> Broker:
+    """The broker in use."""
+    return _broker
+
+def set_broker(broker: Broker) -> None:
+    """Replace the broker, e.g. with one shared by several workers. Call at startup."""
+    global _broker
+    _broker = broker
+
+def publish(channel: str, message: Message) -> None:
+    """Publish a message through the broker in use."""
+    _broker.publish(channel, message)
+
+def subscribe(channel: str) -> Subscription:
+    """Subscribe to a channel through the broker in use."""
+    return _broker.subscribe(channel)
+
+def _subscriber_count() -> int:
+    counter = getattr(_broker, "subscriber_count", None)
+    return counter() if counter is not None else 0
+
+metrics.register_gauge("pubsub.subscribers", _subscriber_count)
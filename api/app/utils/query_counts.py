@@ -0,0 +1,184 @@
+import sys
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Dict, List, Tuple
+
+from sqlalchemy import create_engine, event, insert
+from sqlalchemy.orm import Session, sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from .. import crud, models
+from ..database import Base
+from ..serializers import serialize_communities, serialize_events, serialize_notifications
+from . import geo
+from .search import create_search_index
+
+# Page sizes each list is loaded at; a page's statement count must not
+# depend on its size
+PAGE_SIZES = (5, 50)
+
+# Statements each page may issue, pinned at their current counts. Lower a
+# count when a change saves a query; a count that grows fails the check
+EXPECTED_COUNTS = {
+    "events.get_events": 3,
+    "events.get_events_near": 4,
+    "events.get_feed": 4,
+    "events.get_events_by_user": 3,
+    "events.get_attended_events": 3,
+    "events.get_liked_events": 3,
+    "communities.get_communities": 3,
+    "communities.get_joined_communities": 2,
+    "notifications.get_user_notifications": 2,
+}
+
+# Rows seeded per list; the user organizes half the events, and their feed
+# holds the other half, so each list has more than the largest page
+ROWS = 2 * max(PAGE_SIZES) + 10
+ATTENDEES_PER_EVENT = 8
+
+def _seed(db: Session) -> None:
+    """
+    Add a user who attends and likes every event, organizes every other one,
+    joined every community and has a notification from each other user. The
+    other events each have a different organizer, and all have several
+    attendees, so per-row loads show.
+    """
+    now = datetime.now(timezone.utc)
+    user_ids = ["user"] + [f"other-{i:03d}" for i in range(ROWS)]
+    db.execute(insert(models.user.User), [
+        {"id": user_id, "email": f"{user_id}@example.com", "password": "", "name": user_id, "avatar": f"/{user_id}.jpg"}
+        for user_id in user_ids
+    ])
+
+    for i in range(ROWS):
+        event_row = models.event.Event(
+            id=f"event-{i:03d}", title="", description="", date="2099-01-01", time="18:00", location="",
+            category="music", organizer_id="user" if i % 2 == 0 else user_ids[1 + i], community_id=f"community-{i:03d}",
+            latitude=52.52 + i * 0.0001, longitude=13.405, attendee_count=ATTENDEES_PER_EVENT + 1,
+            starts_at=now + timedelta(days=1, minutes=i), created_at=now - timedelta(minutes=i)
+        )
+        db.add(event_row)
+        geo.locate(db, "events", event_row)
+        db.add(models.community.Community(
+            id=f"community-{i:03d}", name="", description="", category="music",
+            creator_id=user_ids[1 + i], member_count=1, created_at=now - timedelta(minutes=i)
+        ))
+        db.add(models.notification.Notification(
+            user_id="user", sender_id=user_ids[1 + i], message="", notification_type="system",
+            created_at=now - timedelta(minutes=i), updated_at=now - timedelta(minutes=i)
+        ))
+    db.flush()
+
+    event_ids = [f"event-{i:03d}" for i in range(ROWS)]
+    db.execute(insert(models.user.user_event), [
+        {"user_id": user_id, "event_id": event_id}
+        for event_id in event_ids
+        for user_id in ["user"] + user_ids[1:ATTENDEES_PER_EVENT + 1]
+    ])
+    db.execute(insert(models.user.user_liked_event), [{"user_id": "user", "event_id": event_id} for event_id in event_ids])
+    db.execute(insert(models.user.user_community), [
+        {"user_id": "user", "community_id": f"community-{i:03d}"} for i in range(ROWS)
+    ])
+    db.commit()
+
+def _event_page(db: Session, events) -> list:
+    return serialize_events(events, crud.event.get_attendee_avatars(db, events))
+
+def _pages() -> List[Tuple[str, Callable[[Session, int], object]]]:
+    """Each list endpoint's page, built from the same calls its route makes after the ETag check."""
+    def near(db, limit):
+        matches = crud.event.get_events_near(db, 52.52, 13.405, 10, limit=limit)
+        return _event_page(db, [event for event, _ in matches])
+
+    def communities(db, limit):
+        page = crud.community.get_communities(db, limit=limit)
+        return serialize_communities(page, crud.community.get_joined_community_ids(db, "user", [c.id for c in page]))
+
+    def joined(db, limit):
+        page = crud.community.get_joined_communities(db, "user", limit=limit)
+        return serialize_communities(page, {c.id for c in page})
+
+    return [
+        ("events.get_events", lambda db, limit: _event_page(db, crud.event.get_events(db, limit=limit))),
+        ("events.get_events_near", near),
+        ("events.get_feed", lambda db, limit: _event_page(db, [event for event, _ in crud.event.get_feed(db, "user", limit=limit)])),
+        ("events.get_events_by_user", lambda db, limit: _event_page(db, crud.event.get_events_by_user(db, "user", limit=limit))),
+        ("events.get_attended_events", lambda db, limit: _event_page(db, crud.event.get_attended_events(db, "user", limit=limit))),
+        ("events.get_liked_events", lambda db, limit: _event_page(db, crud.event.get_liked_events(db, "user", limit=limit))),
+        ("communities.get_communities", communities),
+        ("communities.get_joined_communities", joined),
+        ("notifications.get_user_notifications", lambda db, limit: serialize_notifications(
+            crud.notification.get_user_notifications(db, "user", limit=limit)
+        )),
+    ]
+
+def collect_query_counts() -> Dict[str, Dict[int, int]]:
+    """
+    Build each list page at every PAGE_SIZES size against a seeded in-memory
+    SQLite database and return the number of statements each issued.
+    """
+    engine = create_engine(
+        "sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool
+    )
+    Base.metadata.create_all(bind=engine)
+    with engine.begin() as connection:
+        create_search_index(connection)
+        geo.create_spatial_index(connection)
+    TestingSession = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+    db = TestingSession()
+    try:
+        _seed(db)
+        # Compute the feed up front, as a returning user's would be
+        crud.event.get_feed(db, "user")
+        db.commit()
+    finally:
+        db.close()
+
+    statements: List[str] = []
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def count(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    counts = {}
+    for name, page in _pages():
+        counts[name] = {}
+        for limit in PAGE_SIZES:
+            statements.clear()
+            db = TestingSession()
+            try:
+                rows = page(db, limit)
+            finally:
+                db.close()
+            assert len(rows) == limit, f"{name} returned {len(rows)} rows, not {limit}"
+            counts[name][limit] = len(statements)
+
+    engine.dispose()
+    return counts
+
+def find_regressions(counts: Dict[str, Dict[int, int]]) -> Dict[str, str]:
+    """Return why each page that issues more statements than pinned, or more for bigger pages, fails."""
+    regressions = {}
+    for name, by_size in counts.items():
+        expected = EXPECTED_COUNTS.get(name)
+        if expected is None:
+            regressions[name] = "no pinned count"
+        elif len(set(by_size.values())) > 1:
+            regressions[name] = "grows with the page size"
+        elif max(by_size.values()) > expected:
+            regressions[name] = f"{max(by_size.values())} statements, pinned at {expected}"
+    return regressions
+
+if __name__ == "__main__":
+    # Run with `python -m app.utils.query_counts` from the api directory
+    counts = collect_query_counts()
+    for name, by_size in counts.items():
+        sizes = ", ".join(f"{count} at {limit}" for limit, count in by_size.items())
+        print(f"{name}: {sizes} (pinned at {EXPECTED_COUNTS.get(name)})")
+
+    regressions = find_regressions(counts)
+    if regressions:
+        print("\nQuery count regressions found:")
+        for name, reason in regressions.items():
+            print(f"    {name}: {reason}")
+        sys.exit(1)
@@ -0,0 +1,193 @@
+import re
+import sys
+from datetime import datetime
+from typing import Callable, Dict, List, Tuple
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import Session, sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from .. import crud, models
+from ..database import Base
+from . import changes, fanout, feed, geo, retention
+from .pagination import encode_cursor
+from .search import create_search_index
+
+# Matches a plan step that walks a whole table without an index
+FULL_SCAN = re.compile(r"^SCAN (\w+)$")
+
+def _with_user(db: Session) -> Session:
+    """Add an uncommitted user with a computed feed, for checks that need one."""
+    db.add(models.user.User(
+        id="user", email="user@example.com", password="", name="User", feed_refreshed_at=datetime(2024, 1, 1)
+    ))
+    db.flush()
+    return db
+
+def _with_notification(db: Session) -> Session:
+    """Add an uncommitted notification for "user", for checks that resume after one."""
+    db.add(models.notification.Notification(
+        id="notification", user_id="user", message="", notification_type="system",
+        created_at=datetime(2024, 1, 1), updated_at=datetime(2024, 1, 1)
+    ))
+    db.flush()
+    return db
+
+def _with_nearby_events(db: Session) -> Session:
+    """
+    Add uncommitted events around the checked point, none in the "jazz"
+    category, so a proximity query filtered on it ranks several batches.
+    """
+    for i in range(geo.MIN_NEAREST_BATCH + 1):
+        event = models.event.Event(
+            id=f"nearby-{i:03d}", title="", description="", date="2024-06-01", time="18:00",
+            location="", category="music", organizer_id="organizer",
+            latitude=52.52 + i * 0.0001, longitude=13.405
+        )
+        db.add(event)
+        geo.locate(db, "events", event)
+    db.flush()
+    return db
+
+def _with_changes(db: Session) -> Session:
+    """Add two uncommitted changes to the same event, for checks that compact the log."""
+    for _ in range(2):
+        db.add(models.change.Change(kind="event", entity_id="event", created_at=datetime(2024, 1, 1)))
+    db.flush()
+    return db
+
+def _checks() -> List[Tuple[str, Callable[[Session], object]]]:
+    """The CRUD read paths whose query plans must stay index-backed."""
+    event_stub = models.event.Event(id="event")
+    upcoming_stub = models.event.Event(
+        id="event", category="music", community_id="community", organizer_id="organizer", starts_at=datetime(2999, 1, 1)
+    )
+    event_cursor = encode_cursor("2024-01-01T00:00:00", "event")
+    community_cursor = encode_cursor("2024-01-01T00:00:00", "community")
+    notification_cursor = encode_cursor("2024-01-01T00:00:00", "notification")
+    search_cursor = encode_cursor(-1.5, "event")
+    near_cursor = encode_cursor(0.001, "event")
+    feed_cursor = encode_cursor(6000.5, "event")
+
+    return [
+        ("user.get_user_by_email", lambda db: crud.user.get_user_by_email(db, "user@example.com")),
+        ("user.get_users_by_interest", lambda db: crud.user.get_users_by_interest(db, "Music")),
+        ("event.get_event", lambda db: crud.event.get_event(db, "event")),
+        ("event.get_events", lambda db: crud.event.get_events(db)),
+        ("event.get_events[category]", lambda db: crud.event.get_events(db, category="music")),
+        ("event.get_events[cursor]", lambda db: crud.event.get_events(db, cursor=event_cursor)),
+        ("event.get_events[category,cursor]", lambda db: crud.event.get_events(db, category="music", cursor=event_cursor)),
+        ("event.get_events[upcoming]", lambda db: crud.event.get_events(db, upcoming_only=True)),
+        ("event.get_events[upcoming,cursor]", lambda db: crud.event.get_events(db, upcoming_only=True, cursor=event_cursor)),
+        ("event.get_events[range]", lambda db: crud.event.get_events(db, starts_from=datetime(2024, 6, 1), starts_before=datetime(2024, 6, 3))),
+        ("event.get_events[category,range]", lambda db: crud.event.get_events(db, category="music", starts_from=datetime(2024, 6, 1), starts_before=datetime(2024, 6, 3))),
+        ("event.get_events[location]", lambda db: crud.event.get_events(db, location="park")),
+        ("event.get_events_near", lambda db: crud.event.get_events_near(db, 52.52, 13.405, 10)),
+        ("event.get_events_near[category,cursor]", lambda db: crud.event.get_events_near(db, 52.52, 13.405, 10, category="music", cursor=near_cursor)),
+        ("event.get_events_near[category,batches]", lambda db: crud.event.get_events_near(_with_nearby_events(db), 52.52, 13.405, 10, limit=10, category="jazz")),
+        ("geo.GeohashSpatialIndex.nearest", lambda db: geo.GeohashSpatialIndex().nearest(db, "events", 52.52, 13.405, 10, 100)),
+        ("event.search_events", lambda db: crud.event.search_events(db, "jazz night")),
+        ("event.search_events[cursor]", lambda db: crud.event.search_events(db, "jazz", cursor=search_cursor)),
+        ("event.get_feed", lambda db: crud.event.get_feed(db, "user")),
+        ("event.get_feed[cursor]", lambda db: crud.event.get_feed(db, "user", cursor=feed_cursor)),
+        ("feed.refresh_user", lambda db: feed.refresh_user(_with_user(db), "user")),
+        ("feed.index_event", lambda db: feed.index_event(_with_user(db), upcoming_stub)),
+        ("feed.attendance_changed", lambda db: feed.attendance_changed(db, "event", "user")),
+        ("event.get_events_by_user", lambda db: crud.event.get_events_by_user(db, "user")),
+        ("event.get_attended_events", lambda db: crud.event.get_attended_events(db, "user")),
+        ("event.get_liked_events", lambda db: crud.event.get_liked_events(db, "user")),
+        ("event.get_events_version", lambda db: crud.event.get_events_version(db, "user")),
+        ("event.get_attendee_avatars", lambda db: crud.event.get_attendee_avatars(db, [event_stub])),
+        ("event.attend_event", lambda db: crud.event.attend_event(db, "event", "user")),
+        ("event.unlike_event", lambda db: crud.event.unlike_event(db, "event", "user")),
+        ("community.get_community", lambda db: crud.community.get_community(db, "community")),
+        ("community.get_communities", lambda db: crud.community.get_communities(db)),
+        ("community.get_communities[category]", lambda db: crud.community.get_communities(db, category="music")),
+        ("community.get_communities[cursor]", lambda db: crud.community.get_communities(db, cursor=community_cursor)),
+        ("community.get_communities[joined]", lambda db: crud.community.get_communities(db, membership_filter="joined", user_id="user")),
+        ("community.get_communities_near", lambda db: crud.community.get_communities_near(db, 52.52, 13.405, 10)),
+        ("community.search_communities", lambda db: crud.community.search_communities(db, "hiking")),
+        ("community.get_communities_by_user", lambda db: crud.community.get_communities_by_user(db, "user")),
+        ("community.get_joined_communities", lambda db: crud.community.get_joined_communities(db, "user")),
+        ("community.get_communities_version", lambda db: crud.community.get_communities_version(db, "user")),
+        ("community.get_joined_community_ids", lambda db: crud.community.get_joined_community_ids(db, "user", ["community"])),
+        ("community.join_community", lambda db: crud.community.join_community(db, "community", "user")),
+        ("community.leave_community", lambda db: crud.community.leave_community(db, "community", "user")),
+        ("fanout.recipients", lambda db: fanout.recipients(db, [("community_members", "community"), ("event_attendees", "event"), ("event_likers", "event")], "user")),
+        ("notification.get_unread_count", lambda db: crud.notification.get_unread_count(db, "user")),
+        ("notification.get_notifications_version", lambda db: crud.notification.get_notifications_version(db, "user")),
+        ("notification.get_user_notifications", lambda db: crud.notification.get_user_notifications(db, "user")),
+        ("notification.get_user_notifications[unread]", lambda db: crud.notification.get_user_notifications(db, "user", unread_only=True)),
+        ("notification.get_user_notifications[cursor]", lambda db: crud.notification.get_user_notifications(db, "user", cursor=notification_cursor)),
+        ("notification.get_notifications_after", lambda db: crud.notification.get_notifications_after(_with_notification(db), "user", "notification")),
+        ("notification.get_notifications_after[resume_id]", lambda db: crud.notification.get_notifications_after(db, "user", notification_cursor)),
+        ("notification.create_aggregated_notification", lambda db: crud.notification.create_aggregated_notification(_with_user(db), "user", "event_like", "event", "sender", lambda count: "liked")),
+        ("retention.purge_expired", lambda db: retention.purge_expired(_with_notification(db), archive_dir=None)),
+        ("notification.mark_all_notifications_as_read", lambda db: crud.notification.mark_all_notifications_as_read(db, "user")),
+        ("sync.get_changes", lambda db: crud.sync.get_changes(db, "user", 0)),
+        ("changes.compact", lambda db: changes.compact(_with_changes(db))),
+    ]
+
+def collect_query_plans() -> Dict[str, List[str]]:
+    """
+    Run each checked CRUD call against an empty in-memory SQLite database
+    and return the EXPLAIN QUERY PLAN steps of every statement it issued.
+    """
+    engine = create_engine(
+        "sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool
+    )
+    Base.metadata.create_all(bind=engine)
+    with engine.begin() as connection:
+        create_search_index(connection)
+        geo.create_spatial_index(connection)
+    TestingSession = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+    current_plan: List[str] = []
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def explain(conn, cursor, statement, parameters, context, executemany):
+        if executemany or not statement.lstrip().upper().startswith(("SELECT", "UPDATE", "DELETE")):
+            return
+        raw = conn.connection.driver_connection.execute(f"EXPLAIN QUERY PLAN {statement}", parameters)
+        current_plan.extend(row[3] for row in raw.fetchall())
+
+    plans = {}
+    for name, check in _checks():
+        current_plan.clear()
+        db = TestingSession()
+        try:
+            check(db)
+        finally:
+            db.close()
+        plans[name] = list(current_plan)
+
+    engine.dispose()
+    return plans
+
+def find_full_scans(plans: Dict[str, List[str]]) -> Dict[str, List[str]]:
+    """Return the plan steps that scan an application table without an index."""
+    tables = set(Base.metadata.tables)
+    full_scans = {}
+    for name, steps in plans.items():
+        offending = [
+            step for step in steps
+            if (match := FULL_SCAN.match(step)) and match.group(1) in tables
+        ]
+        if offending:
+            full_scans[name] = offending
+    return full_scans
+
+if __name__ == "__main__":
+    # Run with `python -m app.utils.query_plans` from the api directory
+    plans = collect_query_plans()
+    for name, steps in plans.items():
+        print(name)
+        for step in steps:
+            print(f"    {step}")
+
+    full_scans = find_full_scans(plans)
+    if full_scans:
+        print("\nFull table scans found:")
+        for name, steps in full_scans.items():
+            print(f"    {name}: {'; '.join(steps)}")
+        sys.exit(1)
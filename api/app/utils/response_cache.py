@@ -0,0 +1,138 @@
+import hashlib
+import os
+import uuid
+from abc import ABC, abstractmethod
+from typing import Any, Awaitable, Callable, Dict, List, NamedTuple, Optional, Tuple
+
+from fastapi import Response, status
+
+from . import metrics
+from .cache import TTLCache
+from .responses import dumps, etag_matches
+
+# Cached responses kept, and how long they live; the TTL also bounds how
+# stale a response can get from writes that don't invalidate it, such as an
+# attendee changing their avatar
+RESPONSE_CACHE_SIZE = int(os.getenv("RESPONSE_CACHE_SIZE", "10000"))
+RESPONSE_CACHE_TTL_SECONDS = int(os.getenv("RESPONSE_CACHE_TTL_SECONDS", "300"))
+
+# Clients and shared caches may store the responses, but must revalidate
+# them with the ETag before each use
+CACHE_CONTROL = "public, no-cache"
+
+# An entity a response is built from: (kind, ID), e.g. ("event", event_id)
+Entity = Tuple[str, str]
+
+class CachedResponse(NamedTuple):
+    """An encoded response and the version of each entity it was built from."""
+    body: bytes
+    etag: str
+    versions: Dict[Entity, str]
+
+class CacheBackend(ABC):
+    """
+    Stores cached responses and entity versions by string key.
+
+    The local backend only serves the process it runs in, so a write on one
+    worker leaves the other workers' copies to expire. When running several
+    workers, install a backend shared between them, e.g. on Redis, with
+    `set_cache_backend`; calls are made on the event loop, so they must be quick.
+    """
+
+    @abstractmethod
+    def get(self, key: str) -> Any:
+        """The value under `key`, or None."""
+
+    @abstractmethod
+    def set(self, key: str, value: Any, ttl: float) -> None:
+        """Store a value under `key` for `ttl` seconds."""
+
+class LocalCacheBackend(CacheBackend):
+    """In-process LRU backend."""
+
+    def __init__(self, maxsize: int = RESPONSE_CACHE_SIZE):
+        self._cache = TTLCache(maxsize=maxsize, ttl=RESPONSE_CACHE_TTL_SECONDS)
+
+    def get(self, key: str) -> Any:
+        return self._cache.get(key)
+
+    def set(self, key: str, value: Any, ttl: float) -> None:
+        self._cache.set(key, value, ttl=ttl)
+
+    def __len__(self) -> int:
+        return len(self._cache)
+
+_backend: CacheBackend = LocalCacheBackend()
+
+def set_cache_backend(backend: CacheBackend) -> None:
+    """Replace the cache backend, e.g. with one shared by several workers. Call at startup."""
+    global _backend
+    _backend = backend
+
+def _version_key(entity: Entity) -> str:
+    return f"version:{entity[0]}:{entity[1]}"
+
+def _version(entity: Entity) -> str:
+    """An entity's current version, starting a new one if it has none."""
+    version = _backend.get(_version_key(entity))
+    if version is None:
+        version = uuid.uuid4().hex
+        _backend.set(_version_key(entity), version, RESPONSE_CACHE_TTL_SECONDS)
+    return version
+
+def invalidate(kind: str, entity_id: str) -> None:
+    """
+    Start a new version of an entity, so every cached response built from
+    it misses. Call after committing a change to it.
+    """
+    # The new version outlives any response cached under the old one
+    _backend.set(_version_key((kind, entity_id)), uuid.uuid4().hex, RESPONSE_CACHE_TTL_SECONDS)
+    metrics.increment("response_cache.invalidations")
+
+def _is_current(cached: CachedResponse) -> bool:
+    return all(_backend.get(_version_key(entity)) == version for entity, version in cached.versions.items())
+
+async def respond(
+    kind: str,
+    entity_id: str,
+    load: Callable[[], Awaitable[Optional[Tuple[Any, List[Entity]]]]],
+    if_none_match: Optional[str] = None
+) -> Optional[Response]:
+    """
+    Respond with an entity's JSON from the cache, or else from `load`, with
+    an ETag and a 304 when it matches `if_none_match`.
+
+    `load` returns the response content and the other entities it was built
+    from, or None when the entity doesn't exist, in which case so does this.
+    """
+    key = f"response:{kind}:{entity_id}"
+    cached = _backend.get(key)
+    if cached is not None and _is_current(cached):
+        metrics.increment("response_cache.hits")
+    else:
+        metrics.increment("response_cache.misses")
+        # Read the version before loading, so a write that commits during
+        # the load leaves this response stale on arrival rather than cached
+        version = _version((kind, entity_id))
+        loaded = await load()
+        if loaded is None:
+            return None
+        content, dependencies = loaded
+        body = dumps(content)
+        cached = CachedResponse(
+            body=body,
+            etag=f'"{hashlib.blake2b(body, digest_size=12).hexdigest()}"',
+            versions={(kind, entity_id): version, **{entity: _version(entity) for entity in dependencies}}
+        )
+        _backend.set(key, cached, RESPONSE_CACHE_TTL_SECONDS)
+
+    headers = {"ETag": cached.etag, "Cache-Control": CACHE_CONTROL}
+    if etag_matches(if_none_match, cached.etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return Response(cached.body, media_type="application/json", headers=headers)
+
+def _entry_count() -> int:
+    counter = getattr(_backend, "__len__", None)
+    return counter() if counter is not None else 0
+
+metrics.register_gauge("response_cache.entries", _entry_count)
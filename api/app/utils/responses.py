@@ -0,0 +1,177 @@
+import json
+import os
+import re
+from datetime import date, datetime
+from typing import Any, BinaryIO, Mapping, Optional, Tuple
+
+import anyio
+from fastapi.responses import JSONResponse, Response
+from starlette.types import Receive, Scope, Send
+
+# orjson is optional; without it responses fall back to the standard library
+try:
+    import orjson
+except ImportError:  # pragma: no cover - depends on the environment
+    orjson = None
+
+def _default(value: Any) -> Any:
+    """Encode the non-JSON types serializers emit, matching orjson's output."""
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+def dumps(content: Any) -> bytes:
+    """Encode `content` as compact UTF-8 JSON."""
+    if orjson is not None:
+        return orjson.dumps(content, default=_default)
+    return json.dumps(
+        content, default=_default, ensure_ascii=False, allow_nan=False, separators=(",", ":")
+    ).encode("utf-8")
+
+class FastJSONResponse(JSONResponse):
+    """
+    JSON response encoded with orjson when it is installed.
+
+    Handlers that return one directly skip FastAPI's `response_model`
+    validation, so its content must already be plain dicts and lists (see
+    `app.serializers`).
+    """
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Whether an If-None-Match header matches `etag`, comparing weakly as RFC 9110 requires."""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    opaque = etag[2:] if etag.startswith("W/") else etag
+    return any(
+        (candidate[2:] if candidate.startswith("W/") else candidate) == opaque
+        for candidate in (part.strip() for part in if_none_match.split(","))
+    )
+
+_BYTE_RANGE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+class RangeNotSatisfiable(Exception):
+    """Raised by `parse_range` for a range that lies wholly past the end of the file."""
+
+def parse_range(range_header: Optional[str], size: int) -> Optional[Tuple[int, int]]:
+    """
+    The bytes a `Range` header asks for from a file of `size` bytes, as a
+    (start, end) pair with `end` exclusive, or None to send the whole file.
+
+    Malformed and multi-range headers are ignored, as RFC 9110 allows.
+    Raises RangeNotSatisfiable when the range starts past the end.
+    """
+    match = _BYTE_RANGE.match(range_header.strip()) if range_header else None
+    if match is None:
+        return None
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    if not first:
+        # A suffix: the last N bytes, of which an empty file has none
+        if int(last) == 0 or size == 0:
+            raise RangeNotSatisfiable()
+        return max(size - int(last), 0), size
+    start = int(first)
+    end = min(int(last) + 1, size) if last else size
+    if last and int(last) < start:
+        return None
+    if start >= size:
+        raise RangeNotSatisfiable()
+    return start, end
+
+def _open(path: str, read_limit: int) -> Tuple[BinaryIO, int, Optional[bytes]]:
+    """
+    Open a file for reading, with its size and, when it is no larger than
+    `read_limit` bytes, its contents.
+    """
+    file = open(path, "rb")
+    try:
+        size = os.fstat(file.fileno()).st_size
+        return file, size, file.read() if size <= read_limit else None
+    except BaseException:
+        file.close()
+        raise
+
+def _read_at(file: BinaryIO, offset: int, size: int) -> bytes:
+    """Read up to `size` bytes of a file from `offset`."""
+    file.seek(offset)
+    return file.read(size)
+
+class RangeFileResponse(Response):
+    """
+    A file sent in `chunk_size` pieces, or a single byte range of it, without
+    ever holding more than a chunk in memory.
+
+    A file no larger than a chunk, like a thumbnail, is read as it is opened
+    and sent whole. For larger files, when the server offers the ASGI
+    zero-copy extension, the kernel copies the file to the socket instead. `range_header` is ignored unless
+    `if_range` is absent or matches the response's ETag, so a client never
+    splices ranges of two different files.
+    """
+
+    chunk_size = 64 * 1024
+
+    def __init__(
+        self,
+        path: str,
+        range_header: Optional[str] = None,
+        if_range: Optional[str] = None,
+        headers: Optional[Mapping[str, str]] = None,
+        media_type: Optional[str] = None
+    ):
+        self.path = path
+        self.status_code = 200
+        self.media_type = media_type
+        self.background = None
+        self.init_headers(headers)
+        self.headers["accept-ranges"] = "bytes"
+        self.range_header = range_header if if_range is None or if_range == self.headers.get("etag") else None
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        # Each step that touches the disk is one hop to a worker thread, so a
+        # file that fits in a chunk is read in the same hop that opens it
+        file, size, data = await anyio.to_thread.run_sync(_open, self.path, self.chunk_size)
+        try:
+            await self._send_file(scope, send, file, size, data)
+        finally:
+            file.close()
+
+    async def _send_file(self, scope: Scope, send: Send, file: BinaryIO, size: int, data: Optional[bytes]) -> None:
+        try:
+            span = parse_range(self.range_header, size)
+        except RangeNotSatisfiable:
+            self.status_code = 416
+            self.headers["content-range"] = f"bytes */{size}"
+            self.headers["content-length"] = "0"
+            await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+            await send({"type": "http.response.body", "body": b""})
+            return
+
+        start, end = span or (0, size)
+        if span is not None:
+            self.status_code = 206
+            self.headers["content-range"] = f"bytes {start}-{end - 1}/{size}"
+        self.headers["content-length"] = str(end - start)
+        await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+        if scope["method"].upper() == "HEAD" or end == start:
+            await send({"type": "http.response.body", "body": b""})
+            return
+
+        if data is not None:
+            await send({"type": "http.response.body", "body": data[start:end]})
+            return
+
+        if "http.response.zerocopy" in scope.get("extensions", {}):
+            await send({"type": "http.response.zerocopy", "file": file, "offset": start, "count": end - start})
+            return
+
+        offset = start
+        while offset < end:
+            chunk = await anyio.to_thread.run_sync(_read_at, file, offset, min(self.chunk_size, end - offset))
+            offset = offset + len(chunk) if chunk else end
+            await send({"type": "http.response.body", "body": chunk, "more_body": offset < end})
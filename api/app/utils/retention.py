@@ -0,0 +1,158 @@
+import asyncio
+import gzip
+import logging
+import os
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional
+
+from sqlalchemy import delete, func, select
+from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+
+from .. import models
+from ..database import SessionLocal
+from . import changes, metrics, versions
+from .counters import reconcile_unread_counts
+from .responses import dumps
+
+logger = logging.getLogger(__name__)
+
+def _parse_retention(value: str) -> Dict[str, int]:
+    """Parse "type=days,..." into a dict."""
+    retention = {}
+    for entry in value.split(","):
+        notification_type, _, days = entry.partition("=")
+        if notification_type.strip() and days.strip():
+            retention[notification_type.strip()] = int(days)
+    return retention
+
+# Days notifications are kept, per notification type; other types use the
+# default. NOTIFICATION_RETENTION overrides types as "type=days,...".
+DEFAULT_RETENTION_DAYS = int(os.getenv("NOTIFICATION_RETENTION_DAYS", "90"))
+RETENTION_DAYS = {
+    "system": 30,
+    "event": 60,
+    **_parse_retention(os.getenv("NOTIFICATION_RETENTION", "")),
+}
+
+# Rows deleted per transaction, and the pause between transactions that
+# lets request writes take the write lock
+PURGE_CHUNK = int(os.getenv("NOTIFICATION_PURGE_CHUNK", "1000"))
+PURGE_PAUSE_SECONDS = float(os.getenv("NOTIFICATION_PURGE_PAUSE_SECONDS", "0.05"))
+
+# Seconds between purges run by the server; 0 leaves purging to
+# `python -m app.utils.retention`, e.g. from cron
+PURGE_INTERVAL_SECONDS = int(os.getenv("NOTIFICATION_PURGE_INTERVAL_SECONDS", "3600"))
+
+# Directory purged rows are archived to as gzip-compressed JSONL, if set
+ARCHIVE_DIR = os.getenv("NOTIFICATION_ARCHIVE_DIR")
+
+# Rows removed by the most recent purge
+_last_purged = 0
+
+def retention(notification_type: str) -> timedelta:
+    """How long notifications of a type are kept."""
+    return timedelta(days=RETENTION_DAYS.get(notification_type, DEFAULT_RETENTION_DAYS))
+
+def _notification_types(db: Session) -> List[str]:
+    """
+    The distinct notification types stored, found with one index seek per
+    type instead of a scan over every notification.
+    """
+    notification_type = models.notification.Notification.notification_type
+    types = []
+    current = db.scalar(select(func.min(notification_type)))
+    while current is not None:
+        types.append(current)
+        current = db.scalar(select(func.min(notification_type)).where(notification_type > current))
+    return types
+
+def _archive(path: str, rows: List) -> None:
+    """Append rows to a gzip-compressed JSONL file, flushed to disk before they are deleted."""
+    with open(path, "ab") as raw:
+        # Each call appends a gzip member; readers decompress them as one stream
+        with gzip.GzipFile(fileobj=raw, mode="ab") as archive:
+            for row in rows:
+                archive.write(dumps(dict(row._mapping)) + b"\n")
+        raw.flush()
+        os.fsync(raw.fileno())
+
+def purge_expired(db: Session, now: Optional[datetime] = None, archive_dir: Optional[str] = ARCHIVE_DIR) -> Dict[str, int]:
+    """
+    Delete notifications older than their type's retention, oldest first,
+    PURGE_CHUNK rows per transaction, archiving them to `archive_dir` first
+    when given. Returns the number of rows removed per type.
+    """
+    global _last_purged
+    Notification = models.notification.Notification
+    now = now or datetime.now(timezone.utc)
+    archive_path = None
+    if archive_dir:
+        os.makedirs(archive_dir, exist_ok=True)
+        archive_path = os.path.join(archive_dir, f"notifications-{now:%Y%m%dT%H%M%SZ}.jsonl.gz")
+
+    purged = {}
+    for notification_type in _notification_types(db):
+        cutoff = now - retention(notification_type)
+        expired = (
+            select(Notification.__table__)
+            .where(Notification.notification_type == notification_type, Notification.updated_at < cutoff)
+            .order_by(Notification.updated_at)
+            .limit(PURGE_CHUNK)
+        )
+        while True:
+            rows = db.execute(expired).all()
+            if not rows:
+                break
+            if archive_path:
+                _archive(archive_path, rows)
+
+            # Delete the chunk, releasing the unread counts it held, changing
+            # its users' notification lists and logging it for sync
+            ids = [row.id for row in rows]
+            notification_actors = models.notification.notification_actors
+            db.execute(delete(notification_actors).where(notification_actors.c.notification_id.in_(ids)))
+            db.execute(delete(Notification).where(Notification.id.in_(ids)))
+            reconcile_unread_counts(db, list({row.user_id for row in rows if not row.read}))
+            versions.bump_user(db, list({row.user_id for row in rows}), models.user.User.notifications_version)
+            changes.record(db, "notification", [(row.id, row.user_id) for row in rows], deleted=True)
+            db.commit()
+
+            purged[notification_type] = purged.get(notification_type, 0) + len(rows)
+            metrics.increment("notifications.purged", len(rows))
+            if archive_path:
+                metrics.increment("notifications.archived", len(rows))
+            if len(rows) < PURGE_CHUNK:
+                break
+            time.sleep(PURGE_PAUSE_SECONDS)
+
+    _last_purged = sum(purged.values())
+    metrics.increment("notifications.purge_runs")
+    return purged
+
+metrics.register_gauge("notifications.last_purge_removed", lambda: _last_purged)
+
+def _purge() -> Dict[str, int]:
+    db = SessionLocal()
+    try:
+        return purge_expired(db)
+    finally:
+        db.close()
+
+async def purge_periodically() -> None:
+    """Purge every PURGE_INTERVAL_SECONDS, off the event loop, until cancelled."""
+    while True:
+        await asyncio.sleep(PURGE_INTERVAL_SECONDS)
+        try:
+            purged = await run_in_threadpool(_purge)
+            if purged:
+                logger.info("Purged expired notifications: %s", purged)
+        except Exception:
+            metrics.increment("notifications.purge_failures")
+            logger.exception("Notification purge failed")
+
+if __name__ == "__main__":
+    # Run with `python -m app.utils.retention` from the api directory
+    for notification_type, count in sorted(_purge().items()):
+        print(f"{notification_type}: {count:,} removed")
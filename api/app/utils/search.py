@@ -0,0 +1,302 @@
+import re
+from abc import ABC, abstractmethod
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import Float, Integer, String, column, false, func, literal_column, select, table, text, tuple_
+from sqlalchemy.engine import Connection
+from sqlalchemy.orm import Session
+from sqlalchemy.sql import Select
+
+from .. import models
+from ..database import SessionLocal
+
+# Indexed fields per document kind, most important first. Backends weight
+# matches by position, so a title match outranks a description match.
+SEARCH_FIELDS = {
+    "events": ("title", "category", "location", "description"),
+    "communities": ("name", "description"),
+}
+
+# Words in a user query; everything else (quotes, operators) is dropped
+_TERM = re.compile(r"\w+", re.UNICODE)
+
+def _terms(query: str) -> List[str]:
+    return _TERM.findall(query.lower())
+
+class SearchBackend(ABC):
+    """
+    Full-text index over events and communities.
+
+    The CRUD layer keeps documents in sync inside its own transaction, so an
+    index entry commits or rolls back together with the row it describes.
+    Ranks are ascending: lower is a better match.
+    """
+
+    @abstractmethod
+    def create(self, connection: Connection) -> bool:
+        """Create the index structures if missing. Returns True if they were created."""
+
+    @abstractmethod
+    def index(self, db: Session, kind: str, item_id: str, fields: Dict[str, Optional[str]]) -> None:
+        """Add or replace the document for an item."""
+
+    @abstractmethod
+    def remove(self, db: Session, kind: str, item_id: str) -> None:
+        """Drop the document for an item, if any."""
+
+    @abstractmethod
+    def search(
+        self,
+        db: Session,
+        kind: str,
+        query: str,
+        limit: int,
+        after: Optional[Tuple[float, str]] = None
+    ) -> List[Tuple[str, float]]:
+        """Return up to `limit` (item ID, rank) matches, best first, starting after `after`."""
+
+    @abstractmethod
+    def matching_ids(self, db: Session, kind: str, field: str, query: str) -> Select:
+        """A SELECT of the IDs whose `field` matches `query`, for use in an IN filter."""
+
+class SQLiteSearchBackend(SearchBackend):
+    """
+    SQLite FTS5 backend.
+
+    Each kind has its own FTS5 table. FTS rowids are allocated in
+    `search_documents`, which maps them to item IDs so updates and deletes
+    address index rows by rowid instead of scanning the index.
+    """
+
+    # Relative bm25 weight of each field, by position in SEARCH_FIELDS
+    WEIGHTS = (10.0, 4.0, 2.0, 1.0)
+
+    documents = table("search_documents", column("doc_id", Integer), column("kind", String), column("item_id", String))
+
+    def _fts(self, kind: str):
+        return table(f"{kind}_fts", column("rowid", Integer), *(column(field) for field in SEARCH_FIELDS[kind]))
+
+    def _match(self, kind: str, terms: List[str], field: Optional[str] = None):
+        # Every term must match, as a prefix, optionally within one field
+        expression = " ".join(f'"{term}"*' for term in terms)
+        if field is not None:
+            expression = f"{field} : ({expression})"
+        return literal_column(f"{kind}_fts").op("MATCH")(expression)
+
+    def create(self, connection: Connection) -> bool:
+        existing = connection.exec_driver_sql(
+            "SELECT name FROM sqlite_master WHERE name = 'search_documents'"
+        ).first()
+        if existing is not None:
+            return False
+
+        connection.exec_driver_sql(
+            "CREATE TABLE search_documents ("
+            "doc_id INTEGER PRIMARY KEY, kind TEXT NOT NULL, item_id TEXT NOT NULL, "
+            "UNIQUE (kind, item_id))"
+        )
+        for kind, fields in SEARCH_FIELDS.items():
+            connection.exec_driver_sql(
+                f"CREATE VIRTUAL TABLE {kind}_fts USING fts5("
+                f"{', '.join(fields)}, tokenize = 'unicode61 remove_diacritics 2')"
+            )
+        return True
+
+    def _doc_id(self, db: Session, kind: str, item_id: str) -> Optional[int]:
+        return db.scalar(
+            select(self.documents.c.doc_id).where(
+                self.documents.c.kind == kind, self.documents.c.item_id == item_id
+            )
+        )
+
+    def index(self, db: Session, kind: str, item_id: str, fields: Dict[str, Optional[str]]) -> None:
+        fts = self._fts(kind)
+        doc_id = self._doc_id(db, kind, item_id)
+        if doc_id is None:
+            doc_id = db.execute(self.documents.insert().values(kind=kind, item_id=item_id)).lastrowid
+        else:
+            db.execute(fts.delete().where(fts.c.rowid == doc_id))
+
+        db.execute(fts.insert().values(rowid=doc_id, **{field: fields[field] or "" for field in SEARCH_FIELDS[kind]}))
+
+    def remove(self, db: Session, kind: str, item_id: str) -> None:
+        doc_id = self._doc_id(db, kind, item_id)
+        if doc_id is None:
+            return
+
+        fts = self._fts(kind)
+        db.execute(fts.delete().where(fts.c.rowid == doc_id))
+        db.execute(self.documents.delete().where(self.documents.c.doc_id == doc_id))
+
+    def search(self, db, kind, query, limit, after=None):
+        terms = _terms(query)
+        if not terms:
+            return []
+
+        fts = self._fts(kind)
+        weights = self.WEIGHTS[:len(SEARCH_FIELDS[kind])]
+        ranked = (
+            select(
+                self.documents.c.item_id.label("item_id"),
+                func.bm25(literal_column(f"{kind}_fts"), *weights).label("rank")
+            )
+            .select_from(fts.join(self.documents, self.documents.c.doc_id == fts.c.rowid))
+            .where(self._match(kind, terms))
+            .subquery()
+        )
+        statement = select(ranked.c.item_id, ranked.c.rank).order_by(ranked.c.rank, ranked.c.item_id).limit(limit)
+        if after is not None:
+            statement = statement.where(tuple_(ranked.c.rank, ranked.c.item_id) > tuple_(*after))
+        return [(item_id, rank) for item_id, rank in db.execute(statement)]
+
+    def matching_ids(self, db, kind, field, query):
+        terms = _terms(query)
+        fts = self._fts(kind)
+        return (
+            select(self.documents.c.item_id)
+            .select_from(fts.join(self.documents, self.documents.c.doc_id == fts.c.rowid))
+            .where(self._match(kind, terms, field) if terms else false())
+        )
+
+class PostgresSearchBackend(SearchBackend):
+    """
+    PostgreSQL `tsvector` backend.
+
+    Documents live in one `search_documents` table with a GIN index. Each
+    field is weighted A-D by its position in SEARCH_FIELDS, which also lets
+    a query be restricted to one field.
+    """
+
+    WEIGHTS = "ABCD"
+
+    # Prefix matching, so no stemming
+    CONFIG = "simple"
+
+    documents = table(
+        "search_documents", column("kind", String), column("item_id", String), column("document")
+    )
+
+    def _tsquery(self, kind: str, terms: List[str], field: Optional[str] = None):
+        label = self.WEIGHTS[SEARCH_FIELDS[kind].index(field)] if field is not None else ""
+        return func.to_tsquery(self.CONFIG, " & ".join(f"{term}:*{label}" for term in terms))
+
+    def create(self, connection: Connection) -> bool:
+        existing = connection.exec_driver_sql("SELECT to_regclass('search_documents')").scalar()
+        if existing is not None:
+            return False
+
+        connection.exec_driver_sql(
+            "CREATE TABLE search_documents ("
+            "kind TEXT NOT NULL, item_id TEXT NOT NULL, document TSVECTOR NOT NULL, "
+            "PRIMARY KEY (kind, item_id))"
+        )
+        connection.exec_driver_sql(
+            "CREATE INDEX ix_search_documents_document ON search_documents USING GIN (document)"
+        )
+        return True
+
+    def index(self, db: Session, kind: str, item_id: str, fields: Dict[str, Optional[str]]) -> None:
+        document = " || ".join(
+            f"setweight(to_tsvector('{self.CONFIG}', coalesce(:{field}, '')), '{self.WEIGHTS[position]}')"
+            for position, field in enumerate(SEARCH_FIELDS[kind])
+        )
+        db.execute(
+            text(
+                "INSERT INTO search_documents (kind, item_id, document) "
+                f"VALUES (:kind, :item_id, {document}) "
+                "ON CONFLICT (kind, item_id) DO UPDATE SET document = EXCLUDED.document"
+            ),
+            {"kind": kind, "item_id": item_id, **{field: fields[field] for field in SEARCH_FIELDS[kind]}}
+        )
+
+    def remove(self, db: Session, kind: str, item_id: str) -> None:
+        db.execute(
+            self.documents.delete().where(
+                self.documents.c.kind == kind, self.documents.c.item_id == item_id
+            )
+        )
+
+    def search(self, db, kind, query, limit, after=None):
+        terms = _terms(query)
+        if not terms:
+            return []
+
+        tsquery = self._tsquery(kind, terms)
+        # Negated so that, as with bm25, lower ranks are better
+        ranked = (
+            select(
+                self.documents.c.item_id.label("item_id"),
+                (-func.ts_rank(self.documents.c.document, tsquery)).cast(Float).label("rank")
+            )
+            .where(self.documents.c.kind == kind, self.documents.c.document.op("@@")(tsquery))
+            .subquery()
+        )
+        statement = select(ranked.c.item_id, ranked.c.rank).order_by(ranked.c.rank, ranked.c.item_id).limit(limit)
+        if after is not None:
+            statement = statement.where(tuple_(ranked.c.rank, ranked.c.item_id) > tuple_(*after))
+        return [(item_id, rank) for item_id, rank in db.execute(statement)]
+
+    def matching_ids(self, db, kind, field, query):
+        terms = _terms(query)
+        return select(self.documents.c.item_id).where(
+            self.documents.c.kind == kind,
+            self.documents.c.document.op("@@")(self._tsquery(kind, terms, field)) if terms else false()
+        )
+
+# Search backend for each database dialect
+BACKENDS: Dict[str, SearchBackend] = {
+    "sqlite": SQLiteSearchBackend(),
+    "postgresql": PostgresSearchBackend(),
+}
+
+def check_backend(dialect: str) -> None:
+    """
+    Raise RuntimeError unless `dialect` has a search backend. Called by
+    `init_db`, so an unsupported database fails at startup rather than on
+    its first search.
+    """
+    if dialect not in BACKENDS:
+        raise RuntimeError(f"No search backend configured for {dialect}; use one of: {', '.join(BACKENDS)}")
+
+def get_backend(db: Session) -> SearchBackend:
+    """The search backend for the database `db` is bound to."""
+    return BACKENDS[db.get_bind().dialect.name]
+
+def create_search_index(connection: Connection) -> bool:
+    """Create the search index if missing. Returns True if it was created and needs a `reindex_all`."""
+    return BACKENDS[connection.dialect.name].create(connection)
+
+def _fields(item, kind: str) -> Dict[str, Optional[str]]:
+    return {field: getattr(item, field) for field in SEARCH_FIELDS[kind]}
+
+def index_event(db: Session, event: models.event.Event) -> None:
+    """Add or refresh an event's search document. Call before committing the event."""
+    get_backend(db).index(db, "events", event.id, _fields(event, "events"))
+
+def remove_event(db: Session, event_id: str) -> None:
+    """Drop an event's search document. Call before committing the deletion."""
+    get_backend(db).remove(db, "events", event_id)
+
+def index_community(db: Session, community: models.community.Community) -> None:
+    """Add or refresh a community's search document. Call before committing the community."""
+    get_backend(db).index(db, "communities", community.id, _fields(community, "communities"))
+
+def remove_community(db: Session, community_id: str) -> None:
+    """Drop a community's search document. Call before committing the deletion."""
+    get_backend(db).remove(db, "communities", community_id)
+
+def reindex_all(db: Session) -> None:
+    """Rebuild the search document of every event and community."""
+    for event in db.query(models.event.Event).yield_per(1000):
+        index_event(db, event)
+    for community in db.query(models.community.Community).yield_per(1000):
+        index_community(db, community)
+    db.commit()
+
+if __name__ == "__main__":
+    # Run with `python -m app.utils.search` from the api directory
+    db = SessionLocal()
+    try:
+        reindex_all(db)
+    finally:
+        db.close()
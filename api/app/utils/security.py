@@ -1,22 +1,44 @@
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
-from typing import Optional
+from typing import Callable, NamedTuple, Optional, TypeVar
+import asyncio
 import os
-from fastapi import Depends, HTTPException, status
+import threading
+import time
+from fastapi import Depends, HTTPException, WebSocket, WebSocketException, status
 from fastapi.security import OAuth2PasswordBearer
 from jose import JWTError, jwt
 from passlib.context import CryptContext
-from sqlalchemy.orm import Session
-from ..database import get_db
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session, selectinload
+from ..database import get_async_db
 from ..models import user as user_models
+from . import metrics
+from .cache import TTLCache
 
 # JWT configuration - Use environment variables in production
 SECRET_KEY = os.getenv("JWT_SECRET_KEY", "YOUR_SECRET_KEY")
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 60 * 24 * 7  # 7 days
 
+# Verified token / principal cache configuration
+PRINCIPAL_CACHE_TTL_SECONDS = int(os.getenv("PRINCIPAL_CACHE_TTL_SECONDS", "300"))
+PRINCIPAL_CACHE_SIZE = int(os.getenv("PRINCIPAL_CACHE_SIZE", "10000"))
+
 # Password hashing context
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
+# bcrypt costs ~250ms of CPU per call, so async handlers run it in a bounded
+# pool instead of on the event loop
+PASSWORD_HASH_CONCURRENCY = int(os.getenv("PASSWORD_HASH_CONCURRENCY", str(min(4, os.cpu_count() or 1))))
+_password_executor = ThreadPoolExecutor(
+    max_workers=PASSWORD_HASH_CONCURRENCY,
+    thread_name_prefix="password-hash"
+)
+_password_tasks_lock = threading.Lock()
+_password_tasks_pending = 0  # Submitted and not yet finished
+_password_tasks_running = 0  # Currently executing in the pool
+
 # OAuth2 scheme for token authentication
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/login")
 
@@ -28,6 +50,46 @@ def get_password_hash(password: str) -> str:
     """Hash a password for storage."""
     return pwd_context.hash(password)
 
+T = TypeVar("T")
+
+def _run_password_task(task: Callable[..., T], *args) -> T:
+    """Run a hashing task inside the pool, tracking how many are executing."""
+    global _password_tasks_running
+    with _password_tasks_lock:
+        _password_tasks_running += 1
+    try:
+        return task(*args)
+    finally:
+        with _password_tasks_lock:
+            _password_tasks_running -= 1
+
+async def _submit_password_task(task: Callable[..., T], *args) -> T:
+    """Submit a hashing task to the pool and wait for it without blocking the event loop."""
+    global _password_tasks_pending
+    with _password_tasks_lock:
+        _password_tasks_pending += 1
+    try:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(_password_executor, _run_password_task, task, *args)
+    finally:
+        with _password_tasks_lock:
+            _password_tasks_pending -= 1
+
+def password_hash_queue_depth() -> int:
+    """Number of hashing tasks waiting for a free worker in the pool."""
+    with _password_tasks_lock:
+        return _password_tasks_pending - _password_tasks_running
+
+metrics.register_gauge("password_hash.queue_depth", password_hash_queue_depth)
+
+async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+    """Verify a password against its hash, off the event loop."""
+    return await _submit_password_task(verify_password, plain_password, hashed_password)
+
+async def get_password_hash_async(password: str) -> str:
+    """Hash a password for storage, off the event loop."""
+    return await _submit_password_task(get_password_hash, password)
+
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -> str:
     """Create a JWT access token."""
     to_encode = data.copy()
@@ -45,17 +107,44 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -
     
     return encoded_jwt
 
-async def get_current_user(
-    token: str = Depends(oauth2_scheme),
-    db: Session = Depends(get_db)
-) -> user_models.User:
-    """Get the current user based on the JWT token."""
+class Principal(NamedTuple):
+    """Lightweight authenticated user, for handlers that don't need the ORM `User`."""
+    id: str
+    name: str
+    avatar: Optional[str]
+    notifications_enabled: bool
+    location_sharing_enabled: bool
+
+    @classmethod
+    def from_user(cls, user: user_models.User) -> "Principal":
+        return cls(
+            id=user.id,
+            name=user.name,
+            avatar=user.avatar,
+            notifications_enabled=user.notifications_enabled,
+            location_sharing_enabled=user.location_sharing_enabled
+        )
+
+# Verified tokens (token -> user ID) and principals (user ID -> Principal)
+_token_cache = TTLCache(maxsize=PRINCIPAL_CACHE_SIZE, ttl=PRINCIPAL_CACHE_TTL_SECONDS)
+_principal_cache = TTLCache(maxsize=PRINCIPAL_CACHE_SIZE, ttl=PRINCIPAL_CACHE_TTL_SECONDS)
+
+def invalidate_user(user_id: str) -> None:
+    """Drop a user's cached principal. Call whenever the user row changes or is deleted."""
+    _principal_cache.pop(user_id)
+
+def _get_token_user_id(token: str) -> str:
+    """Decode and validate a JWT, returning its user ID. Verified tokens are cached."""
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Invalid authentication credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
     
+    user_id = _token_cache.get(token)
+    if user_id is not None:
+        return user_id
+    
     try:
         # Decode and validate token
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
@@ -66,11 +155,96 @@ async def get_current_user(
             
     except JWTError:
         raise credentials_exception
+    
+    # Never cache a token past its own expiry
+    ttl = PRINCIPAL_CACHE_TTL_SECONDS
+    if payload.get("exp") is not None:
+        ttl = min(ttl, payload["exp"] - time.time())
+    _token_cache.set(token, user_id, ttl=ttl)
+    
+    return user_id
+
+def _load_user(db: Session, user_id: str) -> Optional[user_models.User]:
+    """Load a user row with its interests; runs through `run_sync` on the async session."""
+    return (
+        db.query(user_models.User)
+        .options(selectinload(user_models.User.interests))
+        .filter(user_models.User.id == user_id)
+        .first()
+    )
+
+async def get_current_user(
+    token: str = Depends(oauth2_scheme),
+    db: AsyncSession = Depends(get_async_db)
+) -> user_models.User:
+    """Get the current user based on the JWT token."""
+    user_id = _get_token_user_id(token)
         
     # Get user from database
-    user = db.query(user_models.User).filter(user_models.User.id == user_id).first()
+    user = await db.run_sync(_load_user, user_id)
     
     if user is None:
-        raise credentials_exception
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid authentication credentials",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    
+    _principal_cache.set(user.id, Principal.from_user(user))
         
-    return user
\ No newline at end of file
+    return user
+
+async def _get_principal(token: str, db: AsyncSession) -> Principal:
+    """Resolve a token to a cached `Principal`, loading the user on a cache miss."""
+    user_id = _get_token_user_id(token)
+    
+    principal = _principal_cache.get(user_id)
+    if principal is None:
+        user = await db.run_sync(_load_user, user_id)
+        
+        if user is None:
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail="Invalid authentication credentials",
+                headers={"WWW-Authenticate": "Bearer"},
+            )
+        
+        principal = Principal.from_user(user)
+        _principal_cache.set(user_id, principal)
+    
+    return principal
+
+async def get_current_principal(
+    token: str = Depends(oauth2_scheme),
+    db: AsyncSession = Depends(get_async_db)
+) -> Principal:
+    """
+    Get the current user as a cached `Principal`.
+    
+    Use this instead of `get_current_user` in handlers that only need the
+    user's ID or display fields; it skips the database on a cache hit.
+    """
+    return await _get_principal(token, db)
+
+async def get_websocket_principal(
+    websocket: WebSocket,
+    token: Optional[str] = None,
+    db: AsyncSession = Depends(get_async_db)
+) -> Principal:
+    """
+    Get the current user of a WebSocket as a cached `Principal`.
+    
+    Browsers can't set headers on the handshake, so the token may also be
+    passed as the `token` query parameter.
+    """
+    if token is None:
+        scheme, _, credentials = websocket.headers.get("authorization", "").partition(" ")
+        if scheme.lower() == "bearer":
+            token = credentials
+    if not token:
+        raise WebSocketException(code=status.WS_1008_POLICY_VIOLATION)
+    
+    try:
+        return await _get_principal(token, db)
+    except HTTPException:
+        raise WebSocketException(code=status.WS_1008_POLICY_VIOLATION)
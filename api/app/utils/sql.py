@@ -0,0 +1,33 @@
+from sqlalchemy import Table
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+from sqlalchemy.sql.dml import Insert
+
+# Dialects with an `INSERT ... ON CONFLICT DO NOTHING` construct
+_CONFLICT_INSERTS = {
+    "sqlite": sqlite.insert,
+    "postgresql": postgresql.insert,
+}
+
+def check_dialect(dialect: str) -> None:
+    """
+    Raise RuntimeError unless `dialect` has an `INSERT ... ON CONFLICT`
+    construct. Called when the engine is built, so an unsupported database
+    fails at startup rather than on its first write.
+    """
+    if dialect not in _CONFLICT_INSERTS:
+        raise RuntimeError(
+            f"INSERT ... ON CONFLICT is not supported for {dialect}; use one of: {', '.join(_CONFLICT_INSERTS)}"
+        )
+
+def conflict_insert(db: Session, table: Table) -> Insert:
+    """Build an INSERT on `table` supporting the dialect's `on_conflict_do_*` methods."""
+    return _CONFLICT_INSERTS[db.get_bind().dialect.name](table)
+
+def insert_ignore(db: Session, table: Table) -> Insert:
+    """
+    Build an INSERT on `table` that skips rows conflicting with an existing
+    key instead of failing. The result's `rowcount` is the number of rows
+    actually inserted.
+    """
+    return conflict_insert(db, table).on_conflict_do_nothing()
@@ -0,0 +1,65 @@
+import hashlib
+from typing import Dict, List, Optional
+
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from .. import models
+from .sql import conflict_insert
+
+# Lists are private to the user and may be stored, but must be revalidated
+# with the ETag before each use
+LIST_CACHE_CONTROL = "private, no-cache"
+
+def bump(db: Session, *collections: str) -> None:
+    """
+    Record a change to shared collections: "events", "communities" or "users"
+    (the profiles embedded in other lists). Call just before committing.
+    """
+    table = models.version.CollectionVersion.__table__
+    # A fixed order keeps concurrent bumps from deadlocking on PostgreSQL
+    rows = [{"name": name, "version": 1} for name in sorted(set(collections))]
+    db.execute(
+        conflict_insert(db, table).values(rows).on_conflict_do_update(
+            index_elements=[table.c.name],
+            set_={"version": table.c.version + 1}
+        )
+    )
+
+def bump_user(db: Session, user_ids, *counters) -> None:
+    """
+    Record a change to some users' own lists, given a list or SELECT of
+    their IDs and the User version columns to bump, e.g.
+    `User.activity_version`. Call before committing.
+    """
+    User = models.user.User
+    db.query(User).filter(User.id.in_(user_ids)).update(
+        {counter: counter + 1 for counter in counters},
+        synchronize_session=False
+    )
+
+def get_versions(db: Session, collections: List[str]) -> Dict[str, int]:
+    """The current version of shared collections; ones never changed are at 0."""
+    CollectionVersion = models.version.CollectionVersion
+    versions = dict(db.execute(
+        select(CollectionVersion.name, CollectionVersion.version).where(CollectionVersion.name.in_(collections))
+    ).all())
+    return {name: versions.get(name, 0) for name in collections}
+
+def list_version(db: Session, collections: List[str], user_id: Optional[str] = None, user_counter=None) -> str:
+    """
+    The combined version of a list built from shared `collections` and, when
+    given, one of a user's own version columns. Two primary-key lookups.
+    """
+    parts = [str(version) for version in get_versions(db, collections).values()]
+    if user_id is not None:
+        parts.append(str(db.scalar(select(user_counter).where(models.user.User.id == user_id)) or 0))
+    return ".".join(parts)
+
+def list_etag(*parts) -> str:
+    """
+    A weak ETag for a list, from the versions of everything it is built from
+    and whatever else selects it, such as the user and the query string.
+    """
+    digest = hashlib.blake2b("|".join(str(part) for part in parts).encode("utf-8"), digest_size=12)
+    return f'W/"{digest.hexdigest()}"'
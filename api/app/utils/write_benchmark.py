@@ -0,0 +1,120 @@
+import logging
+import os
+import sys
+import tempfile
+import threading
+import time
+from typing import Dict
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.exc import OperationalError
+
+from .. import crud
+from ..database import Base, SessionLocal, _configure_sqlite_connection, _engine_options
+from . import feed, metrics
+
+# Users and events written to; each writer attends and likes as distinct users
+USER_COUNT = 5_000
+EVENT_COUNT = 50
+
+# Writer threads run at once, and the writes each makes
+WRITER_COUNTS = (1, 8, 32)
+WRITES_PER_WRITER = 100
+
+def populate(engine) -> None:
+    """Insert USER_COUNT users and EVENT_COUNT upcoming events, bypassing the ORM."""
+    with engine.begin() as connection:
+        connection.exec_driver_sql(
+            "INSERT INTO users (id, email, password, name, attending_count, community_count) VALUES (?, ?, '', 'User', 0, 0)",
+            [(f"user-{i:05d}", f"user-{i:05d}@example.com") for i in range(USER_COUNT)]
+        )
+        connection.exec_driver_sql(
+            "INSERT INTO events (id, title, description, date, time, location, category, price, organizer_id, "
+            "attendee_count, starts_at, created_at) "
+            "VALUES (?, 'Event', '', '2099-01-01', '18:00', '', 'music', 0, 'user-00000', 0, '2099-01-01 18:00:00', "
+            "CURRENT_TIMESTAMP)",
+            [(f"event-{i:03d}",) for i in range(EVENT_COUNT)]
+        )
+
+def run_writers(writers: int) -> Dict[str, float]:
+    """
+    Attend and like events from `writers` threads at once, each write in its
+    own session and transaction, as concurrent requests would. Returns the
+    throughput, how many writes failed on a locked database or otherwise,
+    and how many of the background feed rescores they queued failed.
+    """
+    outcomes = {"ok": 0, "locked": 0, "failed": 0}
+    rescore_failures = metrics.snapshot().get("feed.rescore_failures", 0)
+    lock = threading.Lock()
+
+    def write(writer: int) -> None:
+        for i in range(WRITES_PER_WRITER):
+            user_id = f"user-{(writer * WRITES_PER_WRITER + i) % USER_COUNT:05d}"
+            event_id = f"event-{i % EVENT_COUNT:03d}"
+            db = SessionLocal()
+            try:
+                if i % 2:
+                    crud.event.like_event(db, event_id, user_id)
+                else:
+                    crud.event.attend_event(db, event_id, user_id)
+                outcome = "ok"
+            except OperationalError as exc:
+                db.rollback()
+                outcome = "locked" if "locked" in str(exc) else "failed"
+            finally:
+                db.close()
+            with lock:
+                outcomes[outcome] += 1
+
+    threads = [threading.Thread(target=write, args=(writer,)) for writer in range(writers)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    # Let the rescoring queued by the writes finish before the next run
+    while feed.queue_depth():
+        time.sleep(0.05)
+    return {
+        **outcomes,
+        "writes_per_second": outcomes["ok"] / elapsed,
+        "rescore_failures": metrics.snapshot().get("feed.rescore_failures", 0) - rescore_failures,
+    }
+
+def build_engine(url: str, tuned: bool):
+    """
+    An engine on `url`, with the app's pool options and SQLite pragmas when
+    `tuned`. Otherwise it keeps the rollback journal and fails at once on a
+    locked database, with no busy timeout.
+    """
+    if not tuned:
+        return create_engine(url, connect_args={"check_same_thread": False, "timeout": 0})
+    engine = create_engine(url, **_engine_options(url))
+    event.listen(engine, "connect", _configure_sqlite_connection)
+    return engine
+
+if __name__ == "__main__":
+    # Run with `python -m app.utils.write_benchmark [writes per writer]` from the api directory
+    WRITES_PER_WRITER = int(sys.argv[1]) if len(sys.argv) > 1 else WRITES_PER_WRITER
+    # Rescores failing on a locked database are counted below, not logged one by one
+    logging.getLogger(feed.__name__).disabled = True
+    for label, tuned in (("untuned engine (rollback journal, no busy timeout)", False), ("tuned engine", True)):
+        print(label)
+        for writers in WRITER_COUNTS:
+            with tempfile.TemporaryDirectory() as directory:
+                engine = build_engine(f"sqlite:///{os.path.join(directory, 'writes.db')}", tuned)
+                Base.metadata.create_all(bind=engine)
+                populate(engine)
+
+                # Point the CRUD layer's sessions, and the background workers'
+                # sessions, at this database
+                SessionLocal.configure(bind=engine)
+                result = run_writers(writers)
+                engine.dispose()
+            print(
+                f"    {writers:3} writers   {result['writes_per_second']:8,.0f} writes/s   "
+                f"{result['locked']:5} locked   {result['failed']:5} other errors   "
+                f"{result['rescore_failures']:5} failed rescores"
+            )
@@ -0,0 +1,29 @@
+import pytest
+
+from app.utils.responses import RangeNotSatisfiable, parse_range
+
+@pytest.mark.parametrize("header, size, expected", [
+    (None, 100, None),
+    ("bytes=0-9", 100, (0, 10)),
+    ("bytes=90-", 100, (90, 100)),
+    ("bytes=90-200", 100, (90, 100)),
+    ("bytes=-10", 100, (90, 100)),
+    ("bytes=-200", 100, (0, 100)),
+    ("bytes=9-0", 100, None),
+    ("bytes=0-9,20-29", 100, None),
+    ("items=0-9", 100, None),
+    ("bytes=-", 100, None),
+    ("bytes=-", 0, None),
+])
+def test_parse_range(header, size, expected):
+    assert parse_range(header, size) == expected
+
+@pytest.mark.parametrize("header, size", [
+    ("bytes=100-", 100),
+    ("bytes=-0", 100),
+    ("bytes=-5", 0),
+    ("bytes=0-", 0),
+])
+def test_parse_range_not_satisfiable(header, size):
+    with pytest.raises(RangeNotSatisfiable):
+        parse_range(header, size)